@@ -43,3 +43,20 @@ def api_client_authenticated(api_client, authenticated_user):
     """Create an authenticated API client."""
     api_client.force_authenticate(user=authenticated_user)
     return api_client
+
+
+@pytest.fixture(scope="function")
+def count_queries():
+    """
+    Count the database queries of a call, e.g.
+    `response, queries = count_queries(api_client.get, url)`.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    def count(func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            result = func(*args, **kwargs)
+        return result, len(context.captured_queries)
+
+    return count
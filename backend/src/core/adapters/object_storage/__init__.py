@@ -1,4 +1,4 @@
-from typing import Self
+from typing import IO, Any, Self
 
 from core.config.storage import StorageOptions
 
@@ -17,3 +17,12 @@ class StorageAdapter:
         self.async_adaptee = (
             self.async_adaptee_class(self.options) if self.async_adaptee_class else None
         )
+
+    def open_upload_stream(
+        self: Self,
+        remote_path: str,
+        *args: Any,
+        **kwargs: Any,
+    ) -> IO[bytes]:
+        msg = f"{type(self).__name__} does not support upload streams"
+        raise NotImplementedError(msg)
@@ -13,7 +13,50 @@ from .async_gcs import AsynchronousGCS
 from .gcs_file import GCSFile
 
 if TYPE_CHECKING:
+    from types import TracebackType
+
     from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile
+    from google.cloud.storage import Blob
+
+# resumable upload chunks must be multiples of 256KB
+UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+
+
+class GCSUploadWriter:
+    """
+    A writable stream uploading the data to GCS with a resumable upload,
+    the object is only created when the upload is finalized on close.
+    """
+
+    def __init__(self: Self, blob: Blob) -> None:
+        self.writer = blob.open("wb", chunk_size=UPLOAD_CHUNK_SIZE, ignore_flush=True)
+
+    def write(self: Self, data: bytes) -> int:
+        return self.writer.write(data)
+
+    def flush(self: Self) -> None:
+        """Chunks are only uploaded once they reach the chunk size."""
+
+    def close(self: Self) -> None:
+        self.writer.close()
+
+    def abort(self: Self) -> None:
+        """Cancel the resumable upload, the object is not created."""
+        self.writer.terminate()
+
+    def __enter__(self: Self) -> Self:
+        return self
+
+    def __exit__(
+        self: Self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc is None:
+            self.close()
+        else:
+            self.abort()
 
 
 class GCSDefaultStorage(GoogleCloudStorage):
@@ -102,6 +145,17 @@ class GCSStorageAdapter(StorageAdapter):
 
         return self.sync_adaptee.upload_file(local_path, remote_path)
 
+    def open_upload_stream(
+        self: Self,
+        remote_path: str,
+        *args: Any,
+        **kwargs: Any,
+    ) -> GCSUploadWriter:
+        """
+        a resumable upload writer, the object is finalized when it is closed
+        """
+        return GCSUploadWriter(self.async_adaptee.bucket.blob(remote_path))
+
     def upload_folder(
         self: Self,
         local_path: str,
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import json
+import os
 import shutil
+import uuid
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Self
 
@@ -11,9 +13,51 @@ from core.adapters.object_storage import StorageAdapter
 from core.config import settings
 
 if TYPE_CHECKING:
+    from types import TracebackType
+
     from core.config.storage import StorageOptions
 
 
+class LocalUploadWriter:
+    """
+    A writable stream to a temporary file next to the destination,
+    moved in place on close and removed if the write fails.
+    """
+
+    def __init__(self: Self, path: Path) -> None:
+        self.path = path
+        self.temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.part")
+        self.file = self.temp_path.open("wb")
+
+    def write(self: Self, data: bytes) -> int:
+        return self.file.write(data)
+
+    def flush(self: Self) -> None:
+        self.file.flush()
+
+    def close(self: Self) -> None:
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self: Self) -> None:
+        self.file.close()
+        self.temp_path.unlink(missing_ok=True)
+
+    def __enter__(self: Self) -> Self:
+        return self
+
+    def __exit__(
+        self: Self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc is None:
+            self.close()
+        else:
+            self.abort()
+
+
 class LocalFile:
     def __init__(self: Self, storage_options: StorageOptions) -> None:
         self.base_path = Path(storage_options.LOCAL_PATH)
@@ -72,6 +116,11 @@ class LocalFile:
         full_destination_path.parent.mkdir(parents=True, exist_ok=True)
         shutil.copyfile(file_path, full_destination_path)
 
+    def open_write_stream(self: Self, destination_path: str) -> LocalUploadWriter:
+        full_destination_path = self.get_full_path(destination_path)
+        full_destination_path.parent.mkdir(parents=True, exist_ok=True)
+        return LocalUploadWriter(full_destination_path)
+
     def upload_folder(self: Self, folder_path: str, destination_path: str) -> None:
         if not Path(folder_path).exists():
             raise FileNotFoundError
@@ -171,6 +220,14 @@ class LocalStorageAdapter(StorageAdapter):
 
         return self.sync_adaptee.upload_file(local_path, remote_path)
 
+    def open_upload_stream(
+        self: Self,
+        remote_path: str,
+        *args: Any,
+        **kwargs: Any,
+    ) -> LocalUploadWriter:
+        return self.sync_adaptee.open_write_stream(remote_path)
+
     def upload_folder(
         self: Self,
         local_path: str,
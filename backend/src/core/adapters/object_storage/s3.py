@@ -12,7 +12,7 @@ from core.adapters.object_storage import StorageAdapter
 from core.config import settings
 
 from .async_s3 import AsynchronousS3
-from .s3file import S3File
+from .s3file import S3File, S3MultipartUploadWriter
 
 if TYPE_CHECKING:
     from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile
@@ -105,6 +105,14 @@ class S3StorageAdapter(StorageAdapter):
 
         return self.sync_adaptee.upload_file(local_path, remote_path)
 
+    def open_upload_stream(
+        self: Self,
+        remote_path: str,
+        *args: Any,
+        **kwargs: Any,
+    ) -> S3MultipartUploadWriter:
+        return self.sync_adaptee.open_multipart_upload(remote_path)
+
     def upload_folder(
         self: Self,
         local_path: str,
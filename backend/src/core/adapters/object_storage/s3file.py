@@ -9,12 +9,91 @@ from core.config import settings
 
 if TYPE_CHECKING:
     from collections.abc import Generator
+    from types import TracebackType
 
     from botocore.httpchecksum import StreamingChecksumBody
 
     from core.config.storage import StorageOptions
 
 
+class S3MultipartUploadWriter:
+    """
+    A writable stream uploading the data to S3 with a multipart upload,
+    parts are sent whenever `part_size` bytes are buffered.
+    """
+
+    def __init__(
+        self: Self,
+        s3: boto3.client,
+        bucket_name: str,
+        key: str,
+        part_size: int = 8 * 1024 * 1024,
+    ) -> None:
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.key = key
+        # S3 requires at least 5MB for every part except the last one
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.buffer = bytearray()
+        self.parts: list[dict[str, Any]] = []
+        self.upload_id = self.s3.create_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+        )["UploadId"]
+
+    def write(self: Self, data: bytes) -> int:
+        self.buffer.extend(data)
+        if len(self.buffer) >= self.part_size:
+            self.upload_part()
+        return len(data)
+
+    def flush(self: Self) -> None:
+        """Parts are only uploaded once they reach the part size."""
+
+    def upload_part(self: Self) -> None:
+        part_number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=bytes(self.buffer),
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer.clear()
+
+    def close(self: Self) -> None:
+        if self.buffer or not self.parts:
+            self.upload_part()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def abort(self: Self) -> None:
+        self.s3.abort_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+        )
+
+    def __enter__(self: Self) -> Self:
+        return self
+
+    def __exit__(
+        self: Self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc is None:
+            self.close()
+        else:
+            self.abort()
+
+
 def s3_connect() -> boto3.client:
     return boto3.client("s3", endpoint_url=settings.S3_ENDPOINT_URL)
 
@@ -95,6 +174,9 @@ class S3File:
             key,
         )
 
+    def open_multipart_upload(self: Self, key: str) -> S3MultipartUploadWriter:
+        return S3MultipartUploadWriter(self.s3, self.bucket_name, key)
+
     def download_file(self: Self, key: str, remote_path: str) -> None:
         self.s3.download_file(
             self.bucket_name,
@@ -0,0 +1,466 @@
+"""
+In-process zip archiver, compressing the members in parallel.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Literal, Self
+
+from django.core.exceptions import ImproperlyConfigured
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from types import TracebackType
+
+    from core.storages import FileStorage
+
+logger = logging.getLogger("default")
+
+CHUNK_SIZE = 1024 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+
+# see APPNOTE.TXT of the zip file format
+LOCAL_FILE_HEADER = struct.Struct("<4s2B4HL2L2H")
+CENTRAL_DIRECTORY = struct.Struct("<4s4B4HL2L5H2L")
+END_OF_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4sQ2H2L4Q")
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR = struct.Struct("<4sLQL")
+
+DEFLATED = 8
+UTF8_FILE_NAME_FLAG = 0x800
+CREATE_SYSTEM_UNIX = 3
+DEFAULT_VERSION = 20
+ZIP64_VERSION = 45
+
+
+class CountingStream:
+    """
+    Count the bytes written to a file object, the output may not support tell().
+    """
+
+    def __init__(self: Self, fileobj: IO[bytes]) -> None:
+        self.fileobj = fileobj
+        self.bytes_written = 0
+
+    def write(self: Self, data: bytes) -> int:
+        self.bytes_written += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self: Self) -> None:
+        self.fileobj.flush()
+
+
+class ZipMember:
+    """
+    A member compressed ahead of writing, so the archive can be streamed
+    to non-seekable outputs with the sizes written in the local header.
+    """
+
+    def __init__(self: Self, path: Path, arcname: str, spool_max_size: int) -> None:
+        self.path = path
+        self.arcname = arcname
+        self.data = tempfile.SpooledTemporaryFile(max_size=spool_max_size)  # noqa: SIM115
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+        self.header_offset = 0
+
+        stat = path.stat()
+        self.external_attr = (stat.st_mode & 0xFFFF) << 16
+        self.dos_time, self.dos_date = to_dos_datetime(stat.st_mtime)
+
+    def compress(self: Self, compresslevel: int) -> Self:
+        # raw deflate stream, zlib releases the GIL while compressing
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+        with self.path.open("rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                self.crc = zlib.crc32(chunk, self.crc)
+                self.file_size += len(chunk)
+                self.data.write(compressor.compress(chunk))
+        self.data.write(compressor.flush())
+        self.compress_size = self.data.tell()
+        self.data.seek(0)
+        return self
+
+    @property
+    def zip64(self: Self) -> bool:
+        return self.file_size > ZIP64_LIMIT or self.compress_size > ZIP64_LIMIT
+
+    def get_local_header(self: Self) -> bytes:
+        name = self.arcname.encode("utf-8")
+        extra = b""
+        file_size, compress_size = self.file_size, self.compress_size
+        if self.zip64:
+            extra = struct.pack("<HHQQ", 1, 16, file_size, compress_size)
+            file_size = compress_size = ZIP64_LIMIT
+
+        return (
+            LOCAL_FILE_HEADER.pack(
+                b"PK\003\004",
+                ZIP64_VERSION if self.zip64 else DEFAULT_VERSION,
+                0,
+                UTF8_FILE_NAME_FLAG,
+                DEFLATED,
+                self.dos_time,
+                self.dos_date,
+                self.crc,
+                compress_size,
+                file_size,
+                len(name),
+                len(extra),
+            )
+            + name
+            + extra
+        )
+
+    def get_central_directory(self: Self) -> bytes:
+        name = self.arcname.encode("utf-8")
+        zip64_fields = []
+        file_size, compress_size = self.file_size, self.compress_size
+        header_offset = self.header_offset
+        if file_size > ZIP64_LIMIT:
+            zip64_fields.append(file_size)
+            file_size = ZIP64_LIMIT
+        if compress_size > ZIP64_LIMIT:
+            zip64_fields.append(compress_size)
+            compress_size = ZIP64_LIMIT
+        if header_offset > ZIP64_LIMIT:
+            zip64_fields.append(header_offset)
+            header_offset = ZIP64_LIMIT
+
+        extra = b""
+        if zip64_fields:
+            extra = struct.pack(
+                f"<HH{len(zip64_fields)}Q",
+                1,
+                8 * len(zip64_fields),
+                *zip64_fields,
+            )
+        version = ZIP64_VERSION if zip64_fields else DEFAULT_VERSION
+
+        return (
+            CENTRAL_DIRECTORY.pack(
+                b"PK\001\002",
+                version,
+                CREATE_SYSTEM_UNIX,
+                version,
+                0,
+                UTF8_FILE_NAME_FLAG,
+                DEFLATED,
+                self.dos_time,
+                self.dos_date,
+                self.crc,
+                compress_size,
+                file_size,
+                len(name),
+                len(extra),
+                0,
+                0,
+                0,
+                self.external_attr,
+                header_offset,
+            )
+            + name
+            + extra
+        )
+
+
+def to_dos_datetime(timestamp: float) -> tuple[int, int]:
+    """Convert a timestamp to the (time, date) pair used in zip headers."""
+    t = time.localtime(timestamp)
+    year = min(max(t.tm_year, 1980), 2107)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+class ZipArchiver:
+    """
+    Write a zip archive into a file object, without shelling out to `zip`.
+
+    Members are compressed in parallel through a thread pool and written in order,
+    the output only needs `write`, so it can be a local file or an upload stream.
+    ```
+    with Path("export.zip").open("wb") as f, ZipArchiver(f) as archiver:
+        archiver.add_files(["a.csv", "b.csv"])
+    logger.info(archiver.get_stats_message())
+    ```
+    Setting a password compresses the members sequentially, with the format
+    picked by `encryption`:
+        - "zipcrypto": the legacy PKWARE encryption every unzip tool can open,
+            e.g. Windows Explorer, written by the `zip` command like before.
+        - "aes": WinZip AES-256, stronger but not readable by Windows Explorer,
+            it requires the optional `pyzipper` package.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: Self,
+        fileobj: IO[bytes],
+        password: str | None = None,
+        compresslevel: int = 6,
+        max_workers: int | None = None,
+        spool_max_size: int = 16 * 1024 * 1024,
+        encryption: Literal["zipcrypto", "aes"] = "zipcrypto",
+    ) -> None:
+        if encryption not in ("zipcrypto", "aes"):
+            msg = f"Unknown zip encryption: {encryption}"
+            raise ValueError(msg)
+
+        self.output = CountingStream(fileobj)
+        self.password = password
+        self.encryption = encryption
+        self.compresslevel = compresslevel
+        self.max_workers = max_workers or min(os.cpu_count() or 1, 8)
+        self.spool_max_size = spool_max_size
+
+        self.members: list[ZipMember] = []
+        self.file_count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.duration = 0.0
+        self.encrypted_zip_file = None
+        self.zip_command_files: list[Path] = []
+        if password and encryption == "aes":
+            self.encrypted_zip_file = self.open_encrypted_zip_file()
+        elif password and not shutil.which("zip"):
+            msg = "ZipCrypto password protection requires the zip command"
+            raise ImproperlyConfigured(msg)
+
+    def open_encrypted_zip_file(self: Self) -> object:
+        try:
+            import pyzipper
+        except ImportError as e:
+            msg = "Password protected zip files require the pyzipper package"
+            raise ImproperlyConfigured(msg) from e
+
+        zip_file = pyzipper.AESZipFile(
+            self.output,
+            "w",
+            compression=pyzipper.ZIP_DEFLATED,
+            compresslevel=self.compresslevel,
+            encryption=pyzipper.WZ_AES,
+        )
+        zip_file.setpassword(self.password.encode())
+        return zip_file
+
+    @property
+    def offset(self: Self) -> int:
+        return self.output.bytes_written
+
+    def write(self: Self, data: bytes) -> None:
+        self.output.write(data)
+
+    def add_files(
+        self: Self,
+        files: Iterable[str | Path],
+        junk_paths: bool = True,
+    ) -> None:
+        """
+        Add files to the archive.
+
+        Arguments:
+            - junk_paths:
+                store the file name only, do not make directory structure.
+        """
+        paths = [Path(f) for f in files]
+        start = time.perf_counter()
+
+        if self.password and self.encryption == "zipcrypto":
+            # the zip command writes the whole archive, the files are added on close
+            self.zip_command_files.extend(paths)
+        elif self.encrypted_zip_file:
+            for path in paths:
+                self.encrypted_zip_file.write(
+                    path,
+                    arcname=path.name if junk_paths else str(path),
+                )
+                self.bytes_in += path.stat().st_size
+                self.file_count += 1
+        else:
+            members = [
+                ZipMember(
+                    path,
+                    path.name if junk_paths else path.as_posix().lstrip("/"),
+                    self.spool_max_size,
+                )
+                for path in paths
+            ]
+            with ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="zip",
+            ) as executor:
+                # map keeps the order, members are written while the rest compress
+                for member in executor.map(
+                    lambda m: m.compress(self.compresslevel),
+                    members,
+                ):
+                    self.write_member(member)
+
+        self.duration += time.perf_counter() - start
+
+    def write_member(self: Self, member: ZipMember) -> None:
+        member.header_offset = self.offset
+        self.write(member.get_local_header())
+        with member.data:
+            while chunk := member.data.read(CHUNK_SIZE):
+                self.write(chunk)
+
+        self.bytes_in += member.file_size
+        self.file_count += 1
+        self.members.append(member)
+
+    def write_zip_command_archive(self: Self) -> None:
+        """
+        Stream the ZipCrypto archive written by `zip -P` to stdout into the output.
+        """
+        start = time.perf_counter()
+        with subprocess.Popen(  # noqa: S603
+            [  # noqa: S607
+                "zip",
+                "-q",
+                f"-{self.compresslevel}",
+                "-j",  # junk the path, do not make directory structure
+                "-P",
+                self.password,
+                "-",  # write the archive to stdout
+                *(str(path) for path in self.zip_command_files),
+            ],
+            stdout=subprocess.PIPE,
+        ) as process:
+            while chunk := process.stdout.read(CHUNK_SIZE):
+                self.write(chunk)
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, "zip")
+
+        self.bytes_in += sum(path.stat().st_size for path in self.zip_command_files)
+        self.file_count += len(self.zip_command_files)
+        self.duration += time.perf_counter() - start
+
+    def write_end_of_archive(self: Self) -> None:
+        central_directory_offset = self.offset
+        for member in self.members:
+            self.write(member.get_central_directory())
+        central_directory_size = self.offset - central_directory_offset
+
+        count = len(self.members)
+        if (
+            count > ZIP64_COUNT_LIMIT
+            or central_directory_offset > ZIP64_LIMIT
+            or central_directory_size > ZIP64_LIMIT
+        ):
+            zip64_end_offset = self.offset
+            self.write(
+                ZIP64_END_OF_CENTRAL_DIRECTORY.pack(
+                    b"PK\006\006",
+                    ZIP64_END_OF_CENTRAL_DIRECTORY.size - 12,
+                    ZIP64_VERSION,
+                    ZIP64_VERSION,
+                    0,
+                    0,
+                    count,
+                    count,
+                    central_directory_size,
+                    central_directory_offset,
+                ),
+            )
+            self.write(
+                ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR.pack(
+                    b"PK\006\007",
+                    0,
+                    zip64_end_offset,
+                    1,
+                ),
+            )
+            count = min(count, ZIP64_COUNT_LIMIT)
+            central_directory_offset = min(central_directory_offset, ZIP64_LIMIT)
+            central_directory_size = min(central_directory_size, ZIP64_LIMIT)
+
+        self.write(
+            END_OF_CENTRAL_DIRECTORY.pack(
+                b"PK\005\006",
+                0,
+                0,
+                count,
+                count,
+                central_directory_size,
+                central_directory_offset,
+                0,
+            ),
+        )
+
+    def close(self: Self) -> None:
+        if self.password and self.encryption == "zipcrypto":
+            self.write_zip_command_archive()
+        elif self.encrypted_zip_file:
+            self.encrypted_zip_file.close()
+        else:
+            self.write_end_of_archive()
+        self.output.flush()
+        self.bytes_out = self.offset
+
+    @property
+    def compression_ratio(self: Self) -> float:
+        """Archive size divided by the original size."""
+        if not self.bytes_in:
+            return 0.0
+        return self.bytes_out / self.bytes_in
+
+    @property
+    def throughput(self: Self) -> float:
+        """Original bytes compressed per second."""
+        if not self.duration:
+            return 0.0
+        return self.bytes_in / self.duration
+
+    def get_stats_message(self: Self) -> str:
+        return (
+            f"compressed {self.file_count} files"
+            f" | {self.bytes_in:,} -> {self.bytes_out:,} bytes"
+            f" | ratio: {self.compression_ratio:.2%}"
+            f" | throughput: {self.throughput / 1_000_000:.2f}MB/s"
+        )
+
+    def __enter__(self: Self) -> Self:
+        return self
+
+    def __exit__(
+        self: Self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc is None:
+            self.close()
+
+
+def compress_files_to_storage(
+    storage: FileStorage,
+    remote_path: str,
+    files_to_compress: Iterable[str | Path],
+    password: str | None = None,
+    encryption: Literal["zipcrypto", "aes"] = "zipcrypto",
+) -> ZipArchiver:
+    """
+    Stream a zip archive of the files straight into the storage,
+    e.g. a S3 multipart upload, without writing the archive locally.
+    See `ZipArchiver` for the password `encryption` formats.
+    """
+    with (
+        storage.open_upload_stream(remote_path) as stream,
+        ZipArchiver(stream, password=password, encryption=encryption) as archiver,
+    ):
+        archiver.add_files(files_to_compress)
+
+    logger.info("%s: %s", remote_path, archiver.get_stats_message())
+    return archiver
@@ -4,10 +4,15 @@ Custom backends and filters for rest framework
 
 from __future__ import annotations
 
+import operator
 import traceback
-from typing import TYPE_CHECKING, Self
+from functools import reduce
+from typing import TYPE_CHECKING, ClassVar, Self
 
-from django.core.exceptions import ValidationError
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Case, Exists, F, FloatField, OuterRef, Q, Value, When
+from django.db.models.constants import LOOKUP_SEP
 from django_filters import rest_framework as filters
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.exceptions import ValidationError as RestValidationError
@@ -17,55 +22,122 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView, exception_handler
 
+from .config import settings
 from .definitions import ErrorCode
 from .exceptions import (
     ErrorCodeBoundError,
 )
+from .pagination import EstimatedCountPaginator
 from .utils import camel_case, logger, snake_case
 
 if TYPE_CHECKING:
     from django.db.models import QuerySet
-    from django_filters import Filter
+    from django.http import QueryDict
 
 
 class PageSizePageNumberPagination(PageNumberPagination):
     """
     Override the default page size parameter name.
+    Large lists are counted by the planner estimate, see `get_count`.
     """
 
+    django_paginator_class = EstimatedCountPaginator
     page_query_description = "查詢結果的分頁頁碼"
     page_size_query_description = "每頁要回傳的查詢結果數量"
     page_size_query_param = "size"
     page_size = 1000
 
+    def get_paginated_response(self: Self, data: list) -> Response:
+        response = super().get_paginated_response(data)
+        response.data["count_is_approximate"] = self.page.paginator.is_count_approximate
+        return response
+
+    def get_paginated_response_schema(self: Self, schema: dict) -> dict:
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count_is_approximate"] = {
+            "type": "boolean",
+            "example": False,
+        }
+        return response_schema
+
 
 class SortingFilter(OrderingFilter):
     """
     Use field:asc or field:desc to sort the queryset.
+
+    The sort keys are allow-listed by `sorting_fields` of the view, a list of
+    field names or a dict of sort keys to the field names they order by, or
+    else the `ordering_fields` of rest framework. A unique tiebreaker is added
+    so the order is stable, e.g. for the cursor pagination.
+    The `core.W001` check warns about the sort keys without an index.
     """
 
     ordering_param = "sort"
     ordering_description = "用來排序的欄位"
 
+    def get_sorting_fields(
+        self: Self,
+        request: Request,
+        queryset: QuerySet,
+        view: APIView,
+    ) -> dict[str, str]:
+        """The sort keys of the view and the field each one orders by."""
+        sorting_fields = getattr(view, "sorting_fields", None)
+        if sorting_fields is None:
+            valid_fields = self.get_valid_fields(queryset, view, {"request": request})
+            return {name: name for name, _ in valid_fields}
+        if isinstance(sorting_fields, dict):
+            return sorting_fields
+        return {name: name for name in sorting_fields}
+
     def get_ordering(
         self: Self,
         request: Request,
         queryset: QuerySet,
         view: APIView,
     ) -> list[str]:
-        sort = request.query_params.get("sort")
-        sort_list: list[str] = []
+        sort = request.query_params.get(self.ordering_param)
+        if not sort:
+            ordering = self.get_default_ordering(view)
+            return self.add_tiebreaker(queryset, list(ordering or []))
 
-        if sort:
-            for sort_item in sort.split(","):
-                ordering = sort_item.split(":")
-                field = snake_case(ordering[0])
-                splited_ordering_len = 2
-                if len(ordering) == splited_ordering_len:
-                    field = field if ordering[1] == "asc" else "-" + field
-                sort_list.append(field)
-            return sort_list
-        return super().get_ordering(request, queryset, view)
+        sorting_fields = self.get_sorting_fields(request, queryset, view)
+        sort_list: list[str] = []
+        for sort_item in sort.split(","):
+            key, _, direction = sort_item.strip().partition(":")
+            field = sorting_fields.get(snake_case(key))
+            if field is None or direction not in ["", "asc", "desc"]:
+                msg = f"Unsupported sort {sort_item!r}, use one of {', '.join(sorting_fields)}"
+                raise RestValidationError({self.ordering_param: [msg]})
+            sort_list.append(f"-{field}" if direction == "desc" else field)
+        return self.add_tiebreaker(queryset, sort_list)
+
+    def add_tiebreaker(self: Self, queryset: QuerySet, ordering: list) -> list:
+        """Append the primary key unless a unique field already orders the rows."""
+        if not ordering or not all(isinstance(term, str) for term in ordering):
+            return ordering
+
+        opts = queryset.model._meta
+        for term in ordering:
+            name = term.lstrip("-")
+            if name == "pk":
+                return ordering
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.unique and not field.null:
+                return ordering
+        # in the direction of the last field, to scan a composite index one way
+        return [*ordering, "-pk" if ordering[-1].startswith("-") else "pk"]
+
+    def get_schema_operation_parameters(self: Self, view: APIView) -> list[dict]:
+        parameters = super().get_schema_operation_parameters(view)
+        if sorting_fields := getattr(view, "sorting_fields", None):
+            parameters[0]["description"] += (
+                f": {', '.join(sorting_fields)}, e.g. {next(iter(sorting_fields))}:desc"
+            )
+        return parameters
 
 
 def _wrap_rest_validation_message(exc: RestValidationError) -> str:
@@ -161,54 +233,216 @@ def generic_exception_handler(  # noqa: C901
     return response
 
 
-def trans_field_to_camel_case(
-    filter_field: Filter,
-    lookup: str,
-    view: APIView,
-    transformed_name: str,
-) -> None:
-    # trans request.GET to camel case
-    original_name = (
-        f"{filter_field.field_name}:{lookup}"
-        if lookup not in ["exact", "in"]
-        else filter_field.field_name
-    )
-    if snake_case(original_name) in view.request.GET:
-        view.request.GET[transformed_name] = view.request.GET[snake_case(original_name)]
+def translate_query_params(
+    query_params: QueryDict, aliases: dict[str, str]
+) -> QueryDict:
+    """Copy the query parameters named by `aliases` to their filter names."""
+    if not aliases.keys() & query_params.keys():
+        return query_params
 
-    if original_name in view.request.GET:
-        view.request.GET[transformed_name] = view.request.GET[original_name]
+    data = query_params.copy()
+    for key, values in query_params.lists():
+        if (name := aliases.get(key)) is not None:
+            data.setlist(name, values)
+    return data
 
 
 class CustomDjangoFilterBackend(filters.DjangoFilterBackend):
     """
     Wrap field_name__gte to fieldName:gte
+
+    The filterset class with the renamed filters is built once per view and
+    model, `field_name:gte` and `fieldName:gte` are both accepted.
     """
 
-    def get_filterset_class(
+    filtersets: ClassVar[dict[tuple, tuple[type[filters.FilterSet] | None, dict]]] = {}
+
+    def get_camel_case_filterset(
         self: Self,
         view: APIView,
         queryset: QuerySet | None = None,
-    ) -> type[filters.FilterSet | None]:
-        filterset_class = super().get_filterset_class(view, queryset)
+    ) -> tuple[type[filters.FilterSet] | None, dict[str, str]]:
+        """The filterset class and the names of its filters by query parameter."""
+        key = (type(view), queryset.model if queryset is not None else None)
+        if key in self.filtersets:
+            return self.filtersets[key]
 
+        filterset_class = super().get_filterset_class(view, queryset)
+        aliases = {}
         if filterset_class is not None:
-            updated_filters = {}
-
+            base_filters = {}
             for filter_field in filterset_class.base_filters.values():
                 field_name = camel_case(filter_field.field_name)
                 lookup = filter_field.lookup_expr
                 if lookup in ["exact", "in"]:
+                    original_name = filter_field.field_name
                     transformed_name = field_name
                 else:
+                    original_name = f"{filter_field.field_name}:{lookup}"
                     transformed_name = f"{field_name}:{lookup}"
-                updated_filters[transformed_name] = filter_field
-                trans_field_to_camel_case(filter_field, lookup, view, transformed_name)
+                base_filters[transformed_name] = filter_field
+                for name in (snake_case(original_name), original_name):
+                    if name != transformed_name:
+                        aliases[name] = transformed_name
 
-            filterset_class.base_filters = updated_filters
+            # subclass instead of renaming the filters of a shared class
+            filterset_class = type(filterset_class.__name__, (filterset_class,), {})
+            filterset_class.base_filters = base_filters
+
+        self.filtersets[key] = filterset_class, aliases
+        return filterset_class, aliases
+
+    def get_filterset_class(
+        self: Self,
+        view: APIView,
+        queryset: QuerySet | None = None,
+    ) -> type[filters.FilterSet | None]:
+        return self.get_camel_case_filterset(view, queryset)[0]
 
-        return filterset_class
+    def get_filterset_kwargs(
+        self: Self,
+        request: Request,
+        queryset: QuerySet,
+        view: APIView,
+    ) -> dict:
+        kwargs = super().get_filterset_kwargs(request, queryset, view)
+        _, aliases = self.get_camel_case_filterset(view, queryset)
+        kwargs["data"] = translate_query_params(kwargs["data"], aliases)
+        return kwargs
 
 
 class CustomSearchFilter(SearchFilter):
+    """
+    Search the `search_fields` of the view and order by relevance unless
+    a `sort` is given, the ordering of the view breaks the ties.
+
+    On PostgreSQL the `@` fields are matched by full text search of
+    `settings.SEARCH_CONFIG`, served by the GIN indexes of
+    `get_search_vector_index`, and the `icontains` of the other fields by the
+    trigram indexes of `get_trigram_index`. Other databases use `icontains`
+    for the `@` fields. Exact and prefix matches of the plain fields rank first.
+    """
+
     search_description = "搜尋關鍵字"
+    rank_annotation = "search_rank"
+
+    def get_view_search_terms(self: Self, request: Request, view: APIView) -> list:
+        """The search terms without the ones shorter than `search_min_length` of the view."""
+        min_length = getattr(view, "search_min_length", 0)
+        return [
+            term for term in self.get_search_terms(request) if len(term) >= min_length
+        ]
+
+    def is_postgresql(self: Self, queryset: QuerySet) -> bool:
+        return connections[queryset.db].vendor == "postgresql"
+
+    def construct_search(self: Self, field_name: str, queryset: QuerySet) -> str:
+        if field_name.startswith("@") and not self.is_postgresql(queryset):
+            field_name = field_name[1:]
+        return super().construct_search(field_name, queryset)
+
+    def filter_queryset(
+        self: Self,
+        request: Request,
+        queryset: QuerySet,
+        view: APIView,
+    ) -> QuerySet:
+        search_fields = [
+            str(field) for field in self.get_search_fields(view, request) or []
+        ]
+        search_terms = self.get_view_search_terms(request, view)
+        if not search_fields or not search_terms:
+            return queryset
+
+        # the fields matched by `icontains`, ranked by exact and prefix matches
+        plain_fields = [
+            field
+            for field in search_fields
+            if self.construct_search(field, queryset)
+            == f"{field}{LOOKUP_SEP}{self.default_lookup}"
+        ]
+        vector_fields = []
+        if self.is_postgresql(queryset):
+            vector_fields = [field[1:] for field in search_fields if field[0] == "@"]
+            search_fields = [field for field in search_fields if field[0] != "@"]
+
+        ranks = [self.get_match_rank(field, search_terms) for field in plain_fields]
+        if vector_fields:
+            queryset, conditions, vector_ranks = self.get_vector_search(
+                queryset, vector_fields, search_terms
+            )
+            ranks += vector_ranks
+        else:
+            conditions = [Q() for _ in search_terms]
+
+        orm_lookups = [
+            self.construct_search(field, queryset) for field in search_fields
+        ]
+        for lookup in orm_lookups:
+            conditions = [
+                condition | Q(**{lookup: term})
+                for condition, term in zip(conditions, search_terms, strict=True)
+            ]
+        base = queryset
+        queryset = queryset.filter(reduce(operator.and_, conditions))
+
+        if self.must_call_distinct(queryset, [*search_fields, *vector_fields]):
+            queryset = base.filter(Exists(queryset.filter(pk=OuterRef("pk"))))
+        elif ranks and not request.query_params.get(SortingFilter.ordering_param):
+            # the ordering of the view breaks the ties of the rank
+            ordering = (
+                queryset.query.order_by or queryset.model._meta.ordering or ("pk",)
+            )
+            queryset = queryset.annotate(
+                **{self.rank_annotation: reduce(operator.add, ranks)}
+            ).order_by(f"-{self.rank_annotation}", *ordering)
+        return queryset
+
+    def get_match_rank(self: Self, field: str, search_terms: list[str]) -> Case:
+        """1 for an exact match of a term, 0.5 for a prefix match and 0 otherwise."""
+        return Case(
+            When(
+                reduce(
+                    operator.or_,
+                    (Q(**{f"{field}__iexact": term}) for term in search_terms),
+                ),
+                then=Value(1.0),
+            ),
+            When(
+                reduce(
+                    operator.or_,
+                    (Q(**{f"{field}__istartswith": term}) for term in search_terms),
+                ),
+                then=Value(0.5),
+            ),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+
+    def get_vector_search(
+        self: Self,
+        queryset: QuerySet,
+        fields: list[str],
+        search_terms: list[str],
+    ) -> tuple[QuerySet, list[Q], list]:
+        """The full text match of each term and the rank of the `fields`."""
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        config = settings.SEARCH_CONFIG
+        aliases = {
+            f"{field}_search_vector": SearchVector(field, config=config)
+            for field in fields
+        }
+        queryset = queryset.alias(**aliases)
+        conditions = [
+            reduce(
+                operator.or_,
+                (Q(**{alias: SearchQuery(term, config=config)}) for alias in aliases),
+            )
+            for term in search_terms
+        ]
+        query = reduce(
+            operator.and_, (SearchQuery(term, config=config) for term in search_terms)
+        )
+        ranks = [SearchRank(F(alias), query) for alias in aliases]
+        return queryset, conditions, ranks
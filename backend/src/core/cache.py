@@ -1,15 +1,599 @@
 from __future__ import annotations
 
+import hashlib
+import inspect
+import logging
+import pickle
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal
 from functools import wraps
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, NamedTuple, Self
 
+import orjson
 from django.core.cache import cache
+from django.db import connections, models, transaction
+from django.db.models.signals import post_delete, post_save
+
+from core.config import settings
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
+    from collections.abc import Callable, Iterable
+
+logger = logging.getLogger("default")
+
+MISSING = object()
+LOCAL_CACHE_VERSION_KEY = "local_cache:version"
+LOCAL_CACHE_TAGS_VERSION_KEY = "local_cache:tags_version"
+TAG_KEY_PREFIX = "cacheable:tag:"
+
+_refresh_executor: ThreadPoolExecutor | None = None
+_refresh_executor_lock = threading.Lock()
+
+
+def get_refresh_executor() -> ThreadPoolExecutor:
+    global _refresh_executor  # noqa: PLW0603
+    with _refresh_executor_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(
+                max_workers=4,
+                thread_name_prefix="cache-refresh",
+            )
+        return _refresh_executor
+
+
+@dataclass
+class TierStats:
+    hits: int = 0
+    misses: int = 0
+
+    def record(self: Self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    @property
+    def hit_ratio(self: Self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass
+class CacheStats:
+    """Hits of `cacheable` per tier, in this process."""
+
+    local: TierStats = field(default_factory=TierStats)
+    shared: TierStats = field(default_factory=TierStats)
+
+    def reset(self: Self) -> None:
+        self.local = TierStats()
+        self.shared = TierStats()
+
+    def get_stats_message(self: Self) -> str:
+        return (
+            f"local: {self.local.hits}/{self.local.hits + self.local.misses}"
+            f" ({self.local.hit_ratio:.2%})"
+            f" | shared: {self.shared.hits}/{self.shared.hits + self.shared.misses}"
+            f" ({self.shared.hit_ratio:.2%})"
+        )
+
+
+cache_stats = CacheStats()
+
+
+class LocalCache:
+    """
+    Per-process LRU cache with expiry, bounded by the pickled size of the values.
+
+    Values are stored pickled, so the callers cannot mutate the cached objects.
+    Other processes invalidate it by bumping a version in the shared cache,
+    which is checked at most every `sync_interval` seconds. A second version
+    only drops the tag generations, see `invalidate_tags`.
+    """
+
+    def __init__(self: Self, max_bytes: int, sync_interval: float) -> None:
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self.entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.version = None
+        self.tags_version = None
+        self.synced_at = 0.0
+
+    def sync(self: Self) -> None:
+        now = time.monotonic()
+        if now - self.synced_at < self.sync_interval:
+            return
+        self.synced_at = now
+        versions = cache.get_many(
+            [LOCAL_CACHE_VERSION_KEY, LOCAL_CACHE_TAGS_VERSION_KEY]
+        )
+        version = versions.get(LOCAL_CACHE_VERSION_KEY)
+        tags_version = versions.get(LOCAL_CACHE_TAGS_VERSION_KEY)
+        if version != self.version:
+            self.clear()
+        elif tags_version != self.tags_version:
+            self.clear_prefix(TAG_KEY_PREFIX)
+        self.version = version
+        self.tags_version = tags_version
+
+    def get(self: Self, key: str) -> Any:
+        self.sync()
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return MISSING
+            data, expires_at = item
+            if time.monotonic() >= expires_at:
+                self.pop(key)
+                return MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(data)  # noqa: S301
+
+    def set(self: Self, key: str, value: Any, timeout: float) -> None:
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            self.pop(key)
+            self.entries[key] = (data, time.monotonic() + timeout)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self.pop(next(iter(self.entries)))
+
+    def pop(self: Self, key: str) -> None:
+        item = self.entries.pop(key, None)
+        if item is not None:
+            self.size -= len(item[0])
+
+    def delete(self: Self, key: str) -> None:
+        with self.lock:
+            self.pop(key)
+
+    def clear(self: Self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def clear_prefix(self: Self, prefix: str) -> None:
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                self.pop(key)
+
+
+local_cache = LocalCache(
+    settings.LOCAL_CACHE_MAX_BYTES,
+    settings.LOCAL_CACHE_SYNC_INTERVAL,
+)
+
+
+def bump_version(key: str) -> None:
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted in between
+            cache.add(key, 1, None)
+
+
+def invalidate_local_caches() -> None:
+    """Clear the local cache of every process, within their sync interval."""
+    local_cache.clear()
+    bump_version(LOCAL_CACHE_VERSION_KEY)
+
+
+def get_tag_key(tag: str) -> str:
+    return f"{TAG_KEY_PREFIX}{tag}"
+
+
+def get_tag_generations(tags: list[str], local_timeout: int) -> list[int]:
+    """
+    The current generation of each tag, a key embedding the generations
+    is unreachable once one of its tags is invalidated.
+    """
+    keys = [get_tag_key(tag) for tag in tags]
+    generations = {}
+    if local_timeout:
+        for key in keys:
+            generation = local_cache.get(key)
+            if generation is not MISSING:
+                generations[key] = generation
+
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        generations.update(cache.get_many(missing))
+    for key in missing:
+        if generations.get(key) is None:
+            # start from the clock, an evicted counter must not reuse old generations
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+        if local_timeout:
+            local_cache.set(key, generations[key], local_timeout)
+
+    return [generations[key] for key in keys]
+
+
+def invalidate_tags(*tags: str) -> None:
+    """
+    Invalidate every key tagged with one of `tags`, O(1) per tag.
+
+    The local caches only drop their tag generations, the values keyed by
+    the old generations are unreachable and the other values stay cached.
+    """
+    for tag in tags:
+        key = get_tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # no key was tagged yet, or the counter was evicted
+            cache.add(key, time.time_ns(), None)
+        local_cache.delete(key)
+    bump_version(LOCAL_CACHE_TAGS_VERSION_KEY)
+
+
+def invalidate_on_save(
+    model: type[models.Model],
+    tags: Callable[[models.Model], Iterable[str]],
+) -> None:
+    """
+    Invalidate the tags of an instance when it is saved or deleted,
+    once the transaction commits so no process caches the old rows again.
+    ```
+    invalidate_on_save(UserProfile, lambda profile: [f"user:{profile.user_id}"])
+    ```
+    """
+
+    def receiver(
+        sender: type[models.Model], instance: models.Model, **kwargs: Any
+    ) -> None:
+        instance_tags = list(tags(instance))
+        transaction.on_commit(
+            lambda: invalidate_tags(*instance_tags),
+            using=kwargs.get("using"),
+        )
+
+    for signal in (post_save, post_delete):
+        signal.connect(
+            receiver,
+            sender=model,
+            weak=False,
+            dispatch_uid=f"cacheable:{model._meta.label}:{id(tags)}",
+        )
+
 
+def _key_default(value: Any) -> Any:
+    if isinstance(value, models.Model):
+        return [value._meta.label, value.pk]
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, set | frozenset):
+        return sorted(value, key=repr)
+    msg = f"Cannot derive a cache key from {type(value).__name__}, pass a cache_key"
+    raise TypeError(msg)
 
-def cacheable(cache_key: str | Callable, timeout: int = 600) -> Callable:
+
+class CacheEntry(NamedTuple):
+    """
+    The cached value with its freshness, a cached None is an entry
+    while a miss is no entry at all.
+    """
+
+    value: Any
+    fresh_until: float
+
+    @property
+    def is_fresh(self: Self) -> bool:
+        return time.time() < self.fresh_until
+
+
+class CachedFunction:
+    """
+    Cache the return value of `func`.
+
+    - a missing key is computed by a single caller (single-flight),
+        concurrent callers wait for its result instead of computing it again
+    - an expired value is served for `stale_timeout` more seconds
+        while a single background refresh computes the new value
+    - the timeouts are spread by `jitter` so keys set together do not expire together
+    - hits are served from the in-process `local_cache` for `local_timeout` seconds
+        before the shared cache is read again
+    - the key embeds the generation of its tags, see `invalidate_tags`
+    - the local keys also embed a generation of the function, so `invalidate`
+        drops the local entries of this function only
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: Self,
+        func: Callable,
+        cache_key: str | Callable | None = None,
+        timeout: int = 600,
+        stale_timeout: int = 60,
+        jitter: float = 0.1,
+        lock_timeout: int = 30,
+        local_timeout: int | None = None,
+        tags: Callable[..., Iterable[str]] | None = None,
+        namespace: str | None = None,
+        version: int = 1,
+    ) -> None:
+        self.func = func
+        self.cache_key = cache_key
+        self.tags = tags
+        self.namespace = namespace or f"{func.__module__}.{func.__qualname__}"
+        self.version = version
+        self.signature = inspect.signature(func)
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.jitter = jitter
+        self.lock_timeout = lock_timeout
+        self.local_timeout = (
+            settings.LOCAL_CACHE_TIMEOUT if local_timeout is None else local_timeout
+        )
+
+    def get_key(self: Self, args: tuple, kwargs: dict) -> str:
+        return self.get_keys([(args, kwargs)])[0]
+
+    def get_keys(self: Self, calls: list[tuple[tuple, dict]]) -> list[str]:
+        """The keys of the calls, the generations of their tags are read at once."""
+        keys = []
+        tags_of_calls = []
+        for args, kwargs in calls:
+            keys.append(self.get_base_key(args, kwargs))
+            tags = [self.namespace_tag]
+            if self.tags is not None:
+                tags.extend(self.tags(*args, **kwargs))
+            tags_of_calls.append(tags)
+
+        all_tags = list(dict.fromkeys(tag for tags in tags_of_calls for tag in tags))
+        generations = dict(
+            zip(
+                all_tags,
+                get_tag_generations(all_tags, self.local_timeout),
+                strict=True,
+            ),
+        )
+        return [
+            f"{key}:{'.'.join(str(generations[tag]) for tag in tags)}"
+            for key, tags in zip(keys, tags_of_calls, strict=True)
+        ]
+
+    def get_base_key(self: Self, args: tuple, kwargs: dict) -> str:
+        if self.cache_key is None:
+            arguments_hash = self.hash_arguments(args, kwargs)
+            return f"cacheable:{self.namespace}:v{self.version}:{arguments_hash}"
+        if callable(self.cache_key):
+            # pass self if the function is a bound method
+            return self.cache_key(*args, **kwargs)
+        return self.cache_key
+
+    def hash_arguments(self: Self, args: tuple, kwargs: dict) -> str:
+        """A stable hash of the arguments, `f(1)` and `f(x=1)` get the same key."""
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        data = orjson.dumps(
+            bound.arguments,
+            default=_key_default,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+        )
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    @property
+    def namespace_tag(self: Self) -> str:
+        return f"namespace:{self.namespace}"
+
+    def invalidate_all(self: Self) -> None:
+        invalidate_tags(self.namespace_tag)
+
+    def get_timeout(self: Self) -> float:
+        return self.timeout * (1 + random.uniform(-self.jitter, self.jitter))  # noqa: S311
+
+    def __call__(
+        self: Self,
+        *args: Any,
+        refresh_cache: bool = False,
+        **kwargs: Any,
+    ) -> Any:
+        key = self.get_key(args, kwargs)
+        if refresh_cache:
+            return self.compute(key, args, kwargs)
+
+        entry = self.get_entry(key)
+        if entry is None:
+            return self.compute_once(key, args, kwargs)
+
+        if not entry.is_fresh:
+            self.refresh_in_background(key, args, kwargs)
+        return entry.value
+
+    def get_entry(self: Self, key: str) -> CacheEntry | None:
+        return self.get_entries([key]).get(key)
+
+    @property
+    def local_tag(self: Self) -> str:
+        return f"local:{self.namespace}"
+
+    def get_local_key(self: Self, key: str) -> str:
+        generation = get_tag_generations([self.local_tag], self.local_timeout)[0]
+        return f"{key}@{generation}"
+
+    def get_entries(self: Self, keys: list[str]) -> dict[str, CacheEntry]:
+        """Read the local tier, then the shared cache in one `get_many`."""
+        entries = {}
+        if self.local_timeout:
+            suffix = self.get_local_key("")
+            for key in keys:
+                entry = local_cache.get(key + suffix)
+                cache_stats.local.record(entry is not MISSING)
+                if entry is not MISSING:
+                    entries[key] = entry
+
+        missing = [key for key in keys if key not in entries]
+        if missing:
+            found = cache.get_many(missing)
+            for key in missing:
+                entry = found.get(key)
+                # values cached before the entries were introduced are misses
+                is_entry = isinstance(entry, CacheEntry)
+                cache_stats.shared.record(is_entry)
+                if is_entry:
+                    entries[key] = entry
+                    self.set_local_entry(key, entry)
+
+        return entries
+
+    def set_entry(self: Self, key: str, value: Any) -> None:
+        self.set_entries({key: value})
+
+    def set_entries(self: Self, values: dict[str, Any]) -> None:
+        timeout = self.get_timeout()
+        fresh_until = time.time() + timeout
+        entries = {key: CacheEntry(value, fresh_until) for key, value in values.items()}
+        cache.set_many(entries, timeout + self.stale_timeout)
+        for key, entry in entries.items():
+            self.set_local_entry(key, entry)
+
+    def set_local_entry(self: Self, key: str, entry: CacheEntry) -> None:
+        if not self.local_timeout:
+            return
+        # not longer than the shared entry lives
+        expires_in = entry.fresh_until + self.stale_timeout - time.time()
+        local_cache.set(
+            self.get_local_key(key), entry, min(self.local_timeout, expires_in)
+        )
+
+    def compute(self: Self, key: str, args: tuple, kwargs: dict) -> Any:
+        value = self.func(*args, **kwargs)
+        self.set_entry(key, value)
+        return value
+
+    def acquire(self: Self, key: str) -> str | None:
+        token = uuid.uuid4().hex
+        if cache.add(f"{key}:lock", token, self.lock_timeout):
+            return token
+        return None
+
+    def release(self: Self, key: str, token: str) -> None:
+        if cache.get(f"{key}:lock") == token:
+            cache.delete(f"{key}:lock")
+
+    def compute_once(self: Self, key: str, args: tuple, kwargs: dict) -> Any:
+        token = self.acquire(key)
+        if token is None:
+            entry = self.wait_for_entry(key)
+            if entry is not None:
+                return entry.value
+            logger.warning("Timed out waiting for cache key %s, computing it", key)
+            return self.compute(key, args, kwargs)
+
+        try:
+            return self.compute(key, args, kwargs)
+        finally:
+            self.release(key, token)
+
+    def wait_for_entry(self: Self, key: str) -> CacheEntry | None:
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            if (entry := self.get_entry(key)) is not None:
+                return entry
+            if cache.get(f"{key}:lock") is None:
+                # the owner failed, let this caller compute
+                return None
+            delay = min(delay * 2, 0.5)
+        return None
+
+    def refresh_in_background(self: Self, key: str, args: tuple, kwargs: dict) -> None:
+        token = self.acquire(key)
+        if token is None:
+            # another caller is refreshing it
+            return
+
+        def refresh() -> None:
+            try:
+                self.compute(key, args, kwargs)
+            except Exception:
+                logger.exception("Failed to refresh cache key %s", key)
+            finally:
+                self.release(key, token)
+                # the connections of this thread are not reused by a request
+                connections.close_all()
+
+        get_refresh_executor().submit(refresh)
+
+    def many(
+        self: Self,
+        values: Iterable,
+        *args: Any,
+        loader: Callable[[list], dict | Iterable] | None = None,
+        **kwargs: Any,
+    ) -> list:
+        """
+        Call the function with each value as the first argument, the results are read
+        with one `get_many` and the misses are written back with one `set_many`.
+
+        Arguments:
+            - values: the first argument of each call, `args` and `kwargs` follow it
+            - loader: computes the misses at once, it takes the list of missing values
+                and returns the results in the same order or a dict by value,
+                a value missing from the dict is cached as None
+        """
+        values = list(values)
+        calls = [((value, *args), kwargs) for value in values]
+        keys = self.get_keys(calls)
+        entries = self.get_entries(keys)
+
+        results = {}
+        missing = {}
+        for key, value, (call_args, call_kwargs) in zip(
+            keys, values, calls, strict=True
+        ):
+            entry = entries.get(key)
+            if entry is None:
+                missing.setdefault(key, value)
+                continue
+            if not entry.is_fresh:
+                self.refresh_in_background(key, call_args, call_kwargs)
+            results[key] = entry.value
+
+        if missing:
+            missing_values = list(missing.values())
+            if loader is None:
+                loaded = [self.func(value, *args, **kwargs) for value in missing_values]
+            else:
+                loaded = loader(missing_values)
+                if isinstance(loaded, dict):
+                    loaded = [loaded.get(value) for value in missing_values]
+            computed = dict(zip(missing, loaded, strict=True))
+            self.set_entries(computed)
+            results.update(computed)
+
+        return [results[key] for key in keys]
+
+    def invalidate(self: Self, *args: Any, **kwargs: Any) -> None:
+        cache.delete(self.get_key(args, kwargs))
+        if self.local_timeout:
+            # the other functions keep their local entries
+            invalidate_tags(self.local_tag)
+
+
+def cacheable(  # noqa: PLR0913
+    cache_key: str | Callable | None = None,
+    timeout: int = 600,
+    stale_timeout: int = 60,
+    jitter: float = 0.1,
+    lock_timeout: int = 30,
+    local_timeout: int | None = None,
+    tags: Callable[..., Iterable[str]] | None = None,
+    namespace: str | None = None,
+    version: int = 1,
+) -> Callable:
     """A decorator to cache function return value, preventing unnecessary calls to the function.
     Args:
         cache_key: The key to use for the cache, can pass in a function to generate the key,
@@ -19,31 +603,53 @@ def cacheable(cache_key: str | Callable, timeout: int = 600) -> Callable:
             def foo(x):
                 return x
             ```
-            but this may cause memory leak, so make sure:
+            By default the key is derived from the qualified name of the function
+            and a hash of the arguments, model instances are keyed by their pk.
+            Every argument value gets a key, so make sure:
             1. cached values are small enough
             2. you set a shorter `timeout`
         timeout: `TTL` for a cache key, in seconds. Default to 600 seconds (10 minutes)
+        stale_timeout: seconds an expired value is still served while it is refreshed
+            in the background, 0 to always wait for the new value
+        jitter: the timeout is randomly spread by this ratio, e.g. 0.1 for +-10%
+        lock_timeout: seconds the callers wait for the caller computing a missing key
+        local_timeout: seconds a value is served from the in-process cache,
+            None for `settings.LOCAL_CACHE_TIMEOUT` and 0 to always read the shared cache
+        tags: a function with the signature of the decorated function returning the tags
+            of the key, e.g. `lambda user: [f"user:{user.pk}"]`
+        namespace: the namespace of the derived keys, default to the qualified name
+        version: bump it when the returned value changes shape
+
+    A None or empty return value is cached too. Call `foo(x, refresh_cache=True)`
+    to recompute the value, `foo.invalidate(x)` to delete it, `foo.invalidate_all()`
+    to invalidate every key of the function and `invalidate_tags("user:1")` to
+    invalidate the keys tagged with `user:1`.
+    `foo.many([1, 2, 3])` returns `[foo(1), foo(2), foo(3)]` with one cache read.
     """
 
     def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        def wrapper(*args: tuple, refresh_cache: bool = False, **kwargs: dict) -> None:
-            if callable(cache_key):
-                # pass self if the function is a bound method
-                cache_key_ = cache_key(*args, **kwargs)
-            else:
-                cache_key_ = cache_key
-
-            value = cache.get(cache_key_)
-            if value and not refresh_cache:
-                return value
+        cached_function = CachedFunction(
+            func,
+            cache_key,
+            timeout=timeout,
+            stale_timeout=stale_timeout,
+            jitter=jitter,
+            lock_timeout=lock_timeout,
+            local_timeout=local_timeout,
+            tags=tags,
+            namespace=namespace,
+            version=version,
+        )
 
-            value = func(*args, **kwargs)
-
-            cache.set(cache_key_, value, timeout)
-
-            return value
+        # a function, so it binds `self` when decorating a method
+        @wraps(func)
+        def wrapper(*args: Any, refresh_cache: bool = False, **kwargs: Any) -> Any:
+            return cached_function(*args, refresh_cache=refresh_cache, **kwargs)
 
+        wrapper.invalidate = cached_function.invalidate
+        wrapper.invalidate_all = cached_function.invalidate_all
+        wrapper.many = cached_function.many
+        wrapper.cached_function = cached_function
         return wrapper
 
     return decorator
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from typing import Self
+
+import pyzstd
+from django_redis.compressors.zstd import ZStdCompressor
+
+from core.config import settings
+
+
+class SizedZStdCompressor(ZStdCompressor):
+    """
+    The zstd compressor of django-redis, compressing the values from
+    `CACHE_COMPRESS_MIN_BYTES` bytes at `CACHE_COMPRESS_LEVEL`.
+    """
+
+    min_length = settings.CACHE_COMPRESS_MIN_BYTES
+
+    def compress(self: Self, value: bytes) -> bytes:
+        if len(value) < self.min_length:
+            return value
+        return pyzstd.compress(value, settings.CACHE_COMPRESS_LEVEL)
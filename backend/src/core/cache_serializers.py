@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import pickle
+import threading
+from typing import Any, Self
+
+from django.core.cache.backends.redis import RedisSerializer
+from django.core.exceptions import ImproperlyConfigured
+
+from core.config import settings
+
+# the magic number of the zstd frames, pickled data starts with the protocol opcode
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class CompressedRedisSerializer(RedisSerializer):
+    """
+    Pickle the values and compress the ones from `min_size` bytes with zstd,
+    integers are stored as is for atomic `incr`.
+    """
+
+    def __init__(
+        self: Self,
+        protocol: int | None = None,
+        min_size: int | None = None,
+        level: int | None = None,
+    ) -> None:
+        super().__init__(protocol)
+        try:
+            import zstandard
+        except ImportError as e:
+            msg = "Compressing the cache values requires the zstandard package"
+            raise ImproperlyConfigured(msg) from e
+
+        self.zstandard = zstandard
+        self.min_size = (
+            settings.CACHE_COMPRESS_MIN_BYTES if min_size is None else min_size
+        )
+        self.level = settings.CACHE_COMPRESS_LEVEL if level is None else level
+        # zstd contexts must not be shared between threads
+        self.local = threading.local()
+
+    @property
+    def compressor(self: Self) -> Any:
+        if not hasattr(self.local, "compressor"):
+            self.local.compressor = self.zstandard.ZstdCompressor(level=self.level)
+        return self.local.compressor
+
+    @property
+    def decompressor(self: Self) -> Any:
+        if not hasattr(self.local, "decompressor"):
+            self.local.decompressor = self.zstandard.ZstdDecompressor()
+        return self.local.decompressor
+
+    def dumps(self: Self, obj: Any) -> Any:
+        if type(obj) is int:
+            return obj
+        data = pickle.dumps(obj, self.protocol)
+        if len(data) < self.min_size:
+            return data
+        return self.compressor.compress(data)
+
+    def loads(self: Self, data: bytes) -> Any:
+        try:
+            return int(data)
+        except ValueError:
+            if data.startswith(ZSTD_MAGIC):
+                data = self.decompressor.decompress(data)
+            return pickle.loads(data)  # noqa: S301
@@ -0,0 +1,204 @@
+"""
+Memoized translation of the keys of payloads between snake_case and camelCase.
+
+```
+from core.casing import camelize, underscoreize
+
+camelize({"first_name": "A"})  # {"firstName": "A"}
+underscoreize({"firstName": "A"})  # {"first_name": "A"}
+```
+
+The keys of an API are a small set, each translation is computed once and
+kept in a bounded LRU, the field names of the models and serializers are
+translated at startup by `preload_field_names`.
+"""
+
+from __future__ import annotations
+
+import re
+import sys
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Self
+
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+
+from core.config import settings
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Collection, Iterable
+
+CAMELIZE_RE = re.compile(r"[a-z0-9]?_[a-z0-9]")
+UNDERSCOREIZE_RE = re.compile(
+    r"([a-z0-9]|[A-Z]?(?=[A-Z0-9](?=[a-z0-9]|(?<![A-Z])$)))"
+    r"([A-Z]|(?<=[a-z])[0-9](?=[0-9A-Z]|$)|(?<=[A-Z])[0-9](?=[0-9]|$))",
+)
+UNDERSCOREIZE_NO_NUMBER_RE = re.compile(r"([a-z0-9]|[A-Z]?(?=[A-Z](?=[a-z])))([A-Z])")
+
+
+def _underscore_to_camel(match: re.Match) -> str:
+    group = match.group()
+    if len(group) == 3:
+        return group[0] + group[2].upper()
+    return group[1].upper()
+
+
+def to_camel(key: str) -> str:
+    """`first_name` to `firstName`, as `djangorestframework_camel_case` does."""
+    if "_" not in key:
+        return key
+    return CAMELIZE_RE.sub(_underscore_to_camel, key)
+
+
+def to_snake(key: str) -> str:
+    """`firstName` to `first_name`, `field1` to `field_1`."""
+    return UNDERSCOREIZE_RE.sub(r"\1_\2", key).lower()
+
+
+def to_snake_no_number(key: str) -> str:
+    """`firstName` to `first_name`, `field1` stays `field1`."""
+    return UNDERSCOREIZE_NO_NUMBER_RE.sub(r"\1_\2", key).lower()
+
+
+class KeyTranslator:
+    """
+    Memoized `convert` of keys, the results are interned.
+
+    Arguments:
+        - convert: the translation of a key
+        - maxsize: keys kept in the LRU, None for `settings.CASE_KEY_CACHE_SIZE`
+    """
+
+    def __init__(
+        self: Self,
+        convert: Callable[[str], str],
+        maxsize: int | None = None,
+    ) -> None:
+        self.convert = convert
+        # translations of the known field names, never evicted
+        self.known: dict[str, str] = {}
+        self.lookup = lru_cache(
+            maxsize=settings.CASE_KEY_CACHE_SIZE if maxsize is None else maxsize,
+        )(self.translate)
+
+    def translate(self: Self, key: str) -> str:
+        return sys.intern(self.convert(key))
+
+    def __call__(self: Self, key: str) -> str:
+        try:
+            return self.known[key]
+        except KeyError:
+            return self.lookup(key)
+
+    def preload(self: Self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.known[key] = self.translate(key)
+
+    def clear(self: Self) -> None:
+        self.known.clear()
+        self.lookup.cache_clear()
+
+
+camel_translator = KeyTranslator(to_camel)
+snake_translator = KeyTranslator(to_snake)
+snake_no_number_translator = KeyTranslator(to_snake_no_number)
+
+
+def translate_keys(
+    data: Any,
+    translate: Callable[[str], str],
+    ignore_fields: Collection[str] | None = None,
+    ignore_keys: Collection[str] | None = None,
+) -> Any:
+    """
+    Copy `data` with the keys of its dicts translated, walking it with a stack
+    instead of recursion. Tuples become lists and lazy translations strings.
+
+    Arguments:
+        - translate: the translation of a key, e.g. `camel_translator`
+        - ignore_fields: keys whose values are copied as is
+        - ignore_keys: keys which are not translated
+    """
+    ignore_fields = ignore_fields or ()
+    ignore_keys = ignore_keys or ()
+    root = [None]
+    # (container, index or key, value)
+    stack = [(root, 0, data)]
+    while stack:
+        container, slot, value = stack.pop()
+        if isinstance(value, dict):
+            copy = container[slot] = {}
+            for key, item in value.items():
+                if isinstance(key, Promise):
+                    key = force_str(key)
+                new_key = translate(key) if isinstance(key, str) else key
+                if key in ignore_keys or new_key in ignore_keys:
+                    new_key = key
+                copy[new_key] = item
+                if key not in ignore_fields and new_key not in ignore_fields:
+                    stack.append((copy, new_key, item))
+        elif isinstance(value, list | tuple):
+            copy = container[slot] = list(value)
+            stack.extend((copy, index, item) for index, item in enumerate(value))
+        elif isinstance(value, Promise):
+            container[slot] = force_str(value)
+        else:
+            container[slot] = value
+    return root[0]
+
+
+def get_snake_translator(
+    no_underscore_before_number: bool = False,
+) -> KeyTranslator:
+    if no_underscore_before_number:
+        return snake_no_number_translator
+    return snake_translator
+
+
+def camelize(data: Any, **options: Any) -> Any:
+    """`djangorestframework_camel_case.util.camelize`, memoized and iterative."""
+    return translate_keys(
+        data,
+        camel_translator,
+        options.get("ignore_fields"),
+        options.get("ignore_keys"),
+    )
+
+
+def underscoreize(data: Any, **options: Any) -> Any:
+    """`djangorestframework_camel_case.util.underscoreize`, memoized and iterative."""
+    return translate_keys(
+        data,
+        get_snake_translator(options.get("no_underscore_before_number", False)),
+        options.get("ignore_fields"),
+        options.get("ignore_keys"),
+    )
+
+
+def get_field_names() -> set[str]:
+    """The field names of the models and of the serializers imported so far."""
+    from django.apps import apps
+    from rest_framework import serializers
+
+    names = set()
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            names.add(field.name)
+            if attname := getattr(field, "attname", None):
+                names.add(attname)
+
+    classes = [serializers.Serializer]
+    while classes:
+        serializer_class = classes.pop()
+        names.update(getattr(serializer_class, "_declared_fields", {}))
+        classes.extend(serializer_class.__subclasses__())
+    return names
+
+
+def preload_field_names() -> None:
+    """Translate the known field names once, they are never evicted."""
+    names = get_field_names()
+    camel_translator.preload(names)
+    camel_names = [camel_translator(name) for name in names]
+    snake_translator.preload(camel_names)
+    snake_no_number_translator.preload(camel_names)
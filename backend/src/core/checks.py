@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+from django.core.checks import Tags, Warning, register
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import UniqueConstraint
+from django.urls import URLPattern, URLResolver, get_resolver
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+    from django.apps import AppConfig
+    from django.db import models
+
+
+def iter_view_classes(patterns: list) -> Generator[type]:
+    """The class based views of the URL patterns."""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_view_classes(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            callback = pattern.callback
+            view_class = getattr(callback, "cls", None) or getattr(
+                callback, "view_class", None
+            )
+            if view_class is not None:
+                yield view_class
+
+
+def resolve_field(
+    model: type[models.Model],
+    path: str,
+) -> tuple[type[models.Model], models.Field] | None:
+    """The model and field at the end of a `__` separated path."""
+    field = None
+    try:
+        for part in path.split("__"):
+            if field is not None:
+                model = field.related_model
+            opts = model._meta
+            field = opts.pk if part == "pk" else opts.get_field(part)
+    except (AttributeError, FieldDoesNotExist):
+        return None
+    return model, field
+
+
+def has_index(model: type[models.Model], field: models.Field) -> bool:
+    """Whether the field is indexed alone or leads an index of the model."""
+    if field.primary_key or field.unique or field.db_index:
+        return True
+
+    opts = model._meta
+    leading_fields = [
+        index.fields[0].lstrip("-") for index in opts.indexes if index.fields
+    ]
+    leading_fields += [fields[0] for fields in opts.unique_together]
+    leading_fields += [
+        constraint.fields[0]
+        for constraint in opts.constraints
+        if isinstance(constraint, UniqueConstraint)
+        and constraint.fields
+        and constraint.condition is None
+    ]
+    return field.name in leading_fields
+
+
+@register(Tags.urls)
+def check_sorting_indexes(
+    app_configs: list[AppConfig] | None = None,
+    **kwargs: Any,
+) -> list[Warning]:
+    """Warn about the `sorting_fields` of the views without an index."""
+    from core.backends import SortingFilter
+
+    warnings = []
+    for view_class in set(iter_view_classes(get_resolver().url_patterns)):
+        sorting_fields = getattr(view_class, "sorting_fields", None)
+        queryset = getattr(view_class, "queryset", None)
+        backends = getattr(view_class, "filter_backends", [])
+        if (
+            not sorting_fields
+            or queryset is None
+            or not any(issubclass(backend, SortingFilter) for backend in backends)
+        ):
+            continue
+
+        if not isinstance(sorting_fields, dict):
+            sorting_fields = {name: name for name in sorting_fields}
+        for key, path in sorting_fields.items():
+            resolved = resolve_field(queryset.model, path)
+            if resolved is None or not has_index(*resolved):
+                warnings.append(
+                    Warning(
+                        f"{view_class.__name__} sorts by {key!r} ({path}) without an index.",
+                        hint="Index the field, or lead an index of the model with it.",
+                        obj=view_class,
+                        id="core.W001",
+                    ),
+                )
+    return warnings
@@ -5,6 +5,7 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 from core.config.cache import CacheSettings
 from core.config.database import DatabaseSettings
 from core.config.frontend import FrontendRedirectSettings
+from core.config.lock import LockSettings
 from core.config.messaging import MessagingSettings
 from core.config.notification import NotificationSettings
 from core.config.sftp import SftpSettings
@@ -43,6 +44,7 @@ class Settings(
     StorageSettings,
     CacheSettings,
     MessagingSettings,
+    LockSettings,
 ):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
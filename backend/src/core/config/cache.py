@@ -5,6 +5,23 @@ class CacheSettings(BaseSettings):
     ENABLE_CACHE: bool = False
     CACHE_BACKEND: str = "django.core.cache.backends.redis.RedisCache"
     CACHE_LOCATION: str = "redis://127.0.0.1:6379"
+    # redis connection pool
+    CACHE_MAX_CONNECTIONS: int = 50
+    CACHE_SOCKET_TIMEOUT: float = 1.0
+    # pickled values from this size are compressed with zstd, 0 disables it.
+    # needs pyzstd (django-redis) or zstandard (django RedisCache) installed
+    CACHE_COMPRESS_MIN_BYTES: int = 0
+    CACHE_COMPRESS_LEVEL: int = 3
+    # "database", "file" or "locmem" when ENABLE_CACHE is false. the file and
+    # locmem caches are per host, they are only used with DEBUG
+    CACHE_LOCAL_BACKEND: str = "database"
+    CACHE_FILE_LOCATION: str | None = None
 
     # chart cache (seconds)
     CHART_CACHE_TIMEOUT: int = 288000
+
+    # in-process cache in front of the shared cache
+    LOCAL_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    LOCAL_CACHE_TIMEOUT: int = 5
+    # seconds between the checks of the shared invalidation version
+    LOCAL_CACHE_SYNC_INTERVAL: float = 1.0
@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+from pydantic_settings import BaseSettings
+
+
+class LockSettings(BaseSettings):
+    # defaults to PostgresAdvisoryLock on PostgreSQL and CacheLock otherwise
+    LOCK_BACKEND: str | None = None
+    # seconds to wait for a lock before giving up
+    LOCK_TIMEOUT: float = 3600
+    # seconds a redis lock is held without renewal, e.g. after the worker died
+    LOCK_LEASE_SECONDS: float = 30
+    # defaults to CACHE_LOCATION
+    LOCK_REDIS_URL: str | None = None
@@ -11,6 +11,17 @@ class SystemSettings(BaseSettings):
     SEGMENTATION_BACKEND: str = "segmentation.backends.pg.PGSegmentationBackend"
     BATCH_SIZE: int = 1000
 
+    # paginated lists above this many rows (by the planner estimate) are not counted
+    EXACT_COUNT_THRESHOLD: int = 10_000
+    # seconds the row count of a table (pg_class.reltuples) is kept by a process
+    TABLE_ROWS_CACHE_TIMEOUT: int = 60
+    # rows streamed by a list view without pagination
+    UNPAGINATED_LIST_MAX_ROWS: int = 10_000
+    # text search configuration of the full text search, e.g. "english"
+    SEARCH_CONFIG: str = "simple"
+    # keys kept by each memoized camelCase/snake_case translation
+    CASE_KEY_CACHE_SIZE: int = 10_000
+
     DOWNLOAD_FILE_EXPIRE_SECONDS: int = 60
 
     # Maximum upload file size (byte)
@@ -0,0 +1,95 @@
+"""
+Process-local snapshot of the active system configurations.
+
+```
+from core.configurations import config
+
+config.get("MAINTENANCE_MODE", False)
+```
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import threading
+import time
+from typing import Any, Self
+
+from core.cache import get_tag_generations, invalidate_tags
+from core.config import settings
+
+logger = logging.getLogger("default")
+
+SYSTEM_CONFIGURATION_TAG = "system_configuration"
+
+
+class SystemConfigurationStore:
+    """
+    The typed values of the active `SystemConfiguration`, parsed once per change.
+
+    The snapshot is reloaded when the generation of `SYSTEM_CONFIGURATION_TAG`
+    in the shared cache changes, it is bumped when a configuration is saved
+    or deleted and checked at most every `check_interval` seconds.
+
+    The snapshot is shared by the threads, `get` and `[]` return copies of the
+    values, so a caller changing a JSON value does not change it for the others.
+    """
+
+    def __init__(self: Self, check_interval: float | None = None) -> None:
+        self.check_interval = (
+            settings.LOCAL_CACHE_SYNC_INTERVAL
+            if check_interval is None
+            else check_interval
+        )
+        self.values: dict[str, Any] | None = None
+        self.generation = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self: Self, key: str, default: Any = None) -> Any:
+        values = self.get_values()
+        if key not in values:
+            return default
+        return copy.deepcopy(values[key])
+
+    def __getitem__(self: Self, key: str) -> Any:
+        return copy.deepcopy(self.get_values()[key])
+
+    def __contains__(self: Self, key: str) -> bool:
+        return key in self.get_values()
+
+    def get_values(self: Self) -> dict[str, Any]:
+        """The shared snapshot, not to be modified."""
+        now = time.monotonic()
+        if self.values is not None and now - self.checked_at < self.check_interval:
+            return self.values
+
+        with self.lock:
+            if self.values is None or now - self.checked_at >= self.check_interval:
+                # read the generation first, a change while loading reloads again
+                generation = get_tag_generations([SYSTEM_CONFIGURATION_TAG], 0)[0]
+                if self.values is None or generation != self.generation:
+                    self.values = self.load()
+                    self.generation = generation
+                self.checked_at = now
+        return self.values
+
+    def load(self: Self) -> dict[str, Any]:
+        from core.models import SystemConfiguration
+
+        values = {}
+        for configuration in SystemConfiguration.objects.filter(is_active=True):
+            try:
+                values[configuration.key] = configuration.get_typed_value()
+            except ValueError:
+                logger.exception("Invalid system configuration %s", configuration.key)
+        return values
+
+    def invalidate(self: Self) -> None:
+        """Reload the snapshot of every process."""
+        self.values = None
+        invalidate_tags(SYSTEM_CONFIGURATION_TAG)
+
+
+config = SystemConfigurationStore()
@@ -0,0 +1,415 @@
+"""
+Named locks shared between processes, e.g. to serialize the access to a file.
+
+```
+with get_lock(f"file:{file_key}", timeout=60):
+    ...
+```
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, ClassVar, Self
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.module_loading import import_string
+
+from core.config import settings
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+logger = logging.getLogger("default")
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+class LockTimeoutError(TimeoutError):
+    """The lock could not be acquired in time."""
+
+
+@dataclass
+class LockStats:
+    """Wait time metrics of the locks acquired in this process."""
+
+    acquired: int = 0
+    contended: int = 0
+    timeouts: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self: Self, wait: float, acquired: bool) -> None:
+        with self._lock:
+            if acquired:
+                self.acquired += 1
+            else:
+                self.timeouts += 1
+            if wait:
+                self.contended += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+    @property
+    def average_wait(self: Self) -> float:
+        """Average wait of the contended acquisitions, in seconds."""
+        if not self.contended:
+            return 0.0
+        return self.total_wait / self.contended
+
+    def reset(self: Self) -> None:
+        with self._lock:
+            self.acquired = self.contended = self.timeouts = 0
+            self.total_wait = self.max_wait = 0.0
+
+
+lock_stats = LockStats()
+
+
+class BaseLock(ABC):
+    """
+    A lock on `key`, released when the holder exits or dies.
+
+    Arguments:
+        - key: name of the lock, shared by every process
+        - timeout: seconds to wait for the lock, 0 to fail immediately
+            and None for `settings.LOCK_TIMEOUT`
+    """
+
+    def __init__(self: Self, key: str, timeout: float | None = None) -> None:
+        self.key = key
+        self.timeout = settings.LOCK_TIMEOUT if timeout is None else timeout
+        self.locked = False
+        self.wait_time = 0.0
+
+    @abstractmethod
+    def try_acquire(self: Self) -> bool:
+        """Take the lock if it is free, without waiting."""
+
+    @abstractmethod
+    def wait_acquire(self: Self, timeout: float) -> bool:
+        """Wait for the lock, return False after `timeout` seconds."""
+
+    @abstractmethod
+    def unlock(self: Self) -> None:
+        """Release the lock held by this instance."""
+
+    def acquire(self: Self, timeout: float | None = None) -> bool:
+        timeout = self.timeout if timeout is None else timeout
+        self.wait_time = 0.0
+        self.locked = self.try_acquire()
+        if not self.locked and timeout > 0:
+            logger.info("Waiting for lock %s", self.key)
+            start = time.perf_counter()
+            self.locked = self.wait_acquire(timeout)
+            self.wait_time = time.perf_counter() - start
+
+        lock_stats.record(self.wait_time, self.locked)
+        if self.locked and self.wait_time > 1:
+            logger.info("Acquired lock %s after %.2fs", self.key, self.wait_time)
+        return self.locked
+
+    def release(self: Self) -> None:
+        if self.locked:
+            self.unlock()
+            self.locked = False
+
+    def __enter__(self: Self) -> Self:
+        if not self.acquire():
+            msg = f"Failed to get lock {self.key} in {self.timeout}s"
+            raise LockTimeoutError(msg)
+        return self
+
+    def __exit__(
+        self: Self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.release()
+
+
+class PostgresAdvisoryLock(BaseLock):
+    """
+    Session level advisory lock, held on a dedicated connection so it is
+    independent of the transactions of the ORM connection.
+
+    Waiters block in `pg_advisory_lock`, PostgreSQL grants the lock in the order
+    it was requested and wakes the next waiter on release, `lock_timeout` bounds
+    the wait.
+    """
+
+    def __init__(
+        self: Self,
+        key: str,
+        timeout: float | None = None,
+        using: str = DEFAULT_DB_ALIAS,
+    ) -> None:
+        super().__init__(key, timeout)
+        self.using = using
+        self.lock_id = self.hash_key(key)
+        self.connection = None
+
+    @staticmethod
+    def hash_key(key: str) -> int:
+        """Advisory locks take a signed bigint."""
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big", signed=True)
+
+    def connect(self: Self) -> Any:
+        wrapper = connections[self.using]
+        if wrapper.vendor != "postgresql":
+            msg = "PostgresAdvisoryLock requires a PostgreSQL database"
+            raise ImproperlyConfigured(msg)
+
+        connection = wrapper.get_new_connection(wrapper.get_connection_params())
+        connection.autocommit = True
+        return connection
+
+    def execute(self: Self, sql: str, params: tuple) -> Any:
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()[0]
+
+    def try_acquire(self: Self) -> bool:
+        self.connection = self.connection or self.connect()
+        return self.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_id,))
+
+    def wait_acquire(self: Self, timeout: float) -> bool:
+        # lock_timeout is in milliseconds, 0 disables it
+        self.execute(
+            "SELECT set_config('lock_timeout', %s, false)",
+            (str(max(int(timeout * 1000), 1)),),
+        )
+        try:
+            self.execute("SELECT pg_advisory_lock(%s)", (self.lock_id,))
+        except Exception as e:
+            if get_sqlstate(e) != LOCK_NOT_AVAILABLE:
+                raise
+            return False
+        return True
+
+    def unlock(self: Self) -> None:
+        try:
+            self.execute("SELECT pg_advisory_unlock(%s)", (self.lock_id,))
+        finally:
+            # the lock is released with the session anyway
+            self.close()
+
+    def close(self: Self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def acquire(self: Self, timeout: float | None = None) -> bool:
+        try:
+            locked = super().acquire(timeout)
+        except Exception:
+            self.close()
+            raise
+        if not locked:
+            self.close()
+        return locked
+
+
+def get_sqlstate(error: Exception) -> str | None:
+    """The SQLSTATE of a psycopg2 or psycopg (3) error."""
+    return getattr(error, "pgcode", None) or getattr(error, "sqlstate", None)
+
+
+class RedisLock(BaseLock):
+    """
+    Lock with a lease, renewed in a background thread while the lock is held,
+    it expires by itself if the holder dies.
+
+    On release one waiter is woken through a list instead of polling. The lock
+    is not fair: a client calling `try_acquire` at that moment can take it
+    before the woken waiter, which then waits for the next release.
+    """
+
+    RELEASE_SCRIPT: ClassVar[str] = """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        redis.call("del", KEYS[1], KEYS[2])
+        redis.call("rpush", KEYS[2], 1)
+        redis.call("pexpire", KEYS[2], ARGV[2])
+        return 1
+    end
+    return 0
+    """
+    RENEW_SCRIPT: ClassVar[str] = """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("pexpire", KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+
+    clients: ClassVar[dict[str, Any]] = {}
+
+    def __init__(
+        self: Self,
+        key: str,
+        timeout: float | None = None,
+        lease_seconds: float | None = None,
+    ) -> None:
+        super().__init__(key, timeout)
+        self.lease_ms = int((lease_seconds or settings.LOCK_LEASE_SECONDS) * 1000)
+        self.redis = self.get_client()
+        self.token = uuid.uuid4().hex
+        self.lock_key = f"lock:{key}"
+        self.signal_key = f"lock:{key}:signal"
+        self.stop_renewal = threading.Event()
+        self.renewal_thread = None
+
+    @classmethod
+    def get_client(cls: type[Self]) -> Any:
+        try:
+            import redis
+        except ImportError as e:
+            msg = "RedisLock requires the redis package"
+            raise ImproperlyConfigured(msg) from e
+
+        url = settings.LOCK_REDIS_URL or settings.CACHE_LOCATION
+        if url not in cls.clients:
+            cls.clients[url] = redis.Redis.from_url(url)
+        return cls.clients[url]
+
+    def try_acquire(self: Self) -> bool:
+        if not self.redis.set(self.lock_key, self.token, nx=True, px=self.lease_ms):
+            return False
+
+        self.stop_renewal.clear()
+        self.renewal_thread = threading.Thread(
+            target=self.renew,
+            name=f"lock-renewal-{self.key}",
+            daemon=True,
+        )
+        self.renewal_thread.start()
+        return True
+
+    def wait_acquire(self: Self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            # wake up on release, or when the lease of a dead holder may have expired
+            wait = min(remaining, self.lease_ms / 1000)
+            self.redis.blpop([self.signal_key], timeout=max(wait, 0.01))
+            if self.try_acquire():
+                return True
+        return False
+
+    def renew(self: Self) -> None:
+        interval = self.lease_ms / 3000
+        while not self.stop_renewal.wait(interval):
+            if not self.redis.eval(
+                self.RENEW_SCRIPT,
+                1,
+                self.lock_key,
+                self.token,
+                self.lease_ms,
+            ):
+                logger.warning("Lost lock %s, the lease expired", self.key)
+                return
+
+    def unlock(self: Self) -> None:
+        self.stop_renewal.set()
+        if self.renewal_thread:
+            self.renewal_thread.join()
+        self.redis.eval(
+            self.RELEASE_SCRIPT,
+            2,
+            self.lock_key,
+            self.signal_key,
+            self.token,
+            self.lease_ms,
+        )
+
+
+class CacheLock(BaseLock):
+    """
+    Lock stored in the default cache with `cache.add`, for databases without
+    advisory locks. The cache must be shared by the processes, e.g. the
+    database or redis cache.
+
+    The entry expires after `lease_seconds` and is renewed while the lock is
+    held, so it is dropped if the holder dies. Waiters poll, it is not fair.
+    """
+
+    POLL_INTERVAL: ClassVar[float] = 0.05
+    MAX_POLL_INTERVAL: ClassVar[float] = 1.0
+
+    def __init__(
+        self: Self,
+        key: str,
+        timeout: float | None = None,
+        lease_seconds: float | None = None,
+    ) -> None:
+        super().__init__(key, timeout)
+        self.lease_seconds = lease_seconds or settings.LOCK_LEASE_SECONDS
+        self.cache = caches["default"]
+        self.token = uuid.uuid4().hex
+        self.lock_key = f"lock:{key}"
+        self.stop_renewal = threading.Event()
+        self.renewal_thread = None
+
+    def try_acquire(self: Self) -> bool:
+        if not self.cache.add(self.lock_key, self.token, self.lease_seconds):
+            return False
+
+        self.stop_renewal.clear()
+        self.renewal_thread = threading.Thread(
+            target=self.renew,
+            name=f"lock-renewal-{self.key}",
+            daemon=True,
+        )
+        self.renewal_thread.start()
+        return True
+
+    def wait_acquire(self: Self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        interval = self.POLL_INTERVAL
+        while (remaining := deadline - time.monotonic()) > 0:
+            time.sleep(min(interval, remaining))
+            if self.try_acquire():
+                return True
+            interval = min(interval * 2, self.MAX_POLL_INTERVAL)
+        return False
+
+    def renew(self: Self) -> None:
+        interval = self.lease_seconds / 3
+        while not self.stop_renewal.wait(interval):
+            if self.cache.get(self.lock_key) != self.token:
+                logger.warning("Lost lock %s, the lease expired", self.key)
+                return
+            self.cache.touch(self.lock_key, self.lease_seconds)
+
+    def unlock(self: Self) -> None:
+        self.stop_renewal.set()
+        if self.renewal_thread:
+            self.renewal_thread.join()
+        if self.cache.get(self.lock_key) == self.token:
+            self.cache.delete(self.lock_key)
+
+
+def get_lock_backend(using: str = DEFAULT_DB_ALIAS) -> type[BaseLock]:
+    """
+    The `settings.LOCK_BACKEND` class, by default advisory locks on PostgreSQL
+    and cache locks on the other databases.
+    """
+    if settings.LOCK_BACKEND:
+        return import_string(settings.LOCK_BACKEND)
+    if connections[using].vendor == "postgresql":
+        return PostgresAdvisoryLock
+    return CacheLock
+
+
+def get_lock(key: str, timeout: float | None = None, **kwargs: Any) -> BaseLock:
+    """Get a lock of the `settings.LOCK_BACKEND` backend."""
+    return get_lock_backend()(key, timeout, **kwargs)
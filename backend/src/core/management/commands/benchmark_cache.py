@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import tempfile
+import time
+from typing import TYPE_CHECKING, Any, Self
+
+from django.core.cache.backends.base import BaseCache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from core.config import settings
+from core.utils import batched
+
+if TYPE_CHECKING:
+    from argparse import ArgumentParser
+    from collections.abc import Callable
+
+DATABASE_CACHE_TABLE = "benchmark_cache_table"
+BACKENDS = ["locmem", "file", "database", "redis", "redis-zstd"]
+
+
+def generate_value(size: int) -> dict:
+    """A JSON-like value of about `size` bytes, shaped like a cached API response."""
+    row = {"id": 1, "name": "name", "email": "user@example.com", "is_active": True}
+    return {
+        "count": size // 80,
+        "results": [dict(row, id=i) for i in range(size // 80)],
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare the operations per second of the cache backends."
+
+    def add_arguments(self: Self, parser: ArgumentParser) -> None:
+        parser.add_argument("--ops", type=int, default=10_000)
+        parser.add_argument(
+            "--size", type=int, default=4096, help="value size in bytes"
+        )
+        parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+        parser.add_argument("--redis-url", default=settings.CACHE_LOCATION)
+
+    def handle(self: Self, *args: Any, **options: Any) -> None:
+        value = generate_value(options["size"])
+        with tempfile.TemporaryDirectory() as folder:
+            for name in options["backends"]:
+                try:
+                    cache = self.create_cache(name, folder, options["redis_url"])
+                    cache.set("benchmark:ping", 1)
+                except Exception as e:  # noqa: BLE001
+                    self.stdout.write(f"{name:<10} | skipped: {e}")
+                    continue
+
+                try:
+                    self.benchmark(name, cache, value, options["ops"])
+                finally:
+                    cache.clear()
+                    if name == "database":
+                        with connection.cursor() as cursor:
+                            cursor.execute(
+                                f"DROP TABLE {connection.ops.quote_name(DATABASE_CACHE_TABLE)}",
+                            )
+
+    def create_cache(self: Self, name: str, folder: str, redis_url: str) -> BaseCache:
+        if name == "locmem":
+            backend, location, options = "locmem.LocMemCache", "benchmark", {}
+        elif name == "file":
+            backend, location, options = "filebased.FileBasedCache", folder, {}
+        elif name == "database":
+            backend, location, options = "db.DatabaseCache", DATABASE_CACHE_TABLE, {}
+        else:
+            backend, location = "redis.RedisCache", redis_url
+            options = {"max_connections": settings.CACHE_MAX_CONNECTIONS}
+            if name == "redis-zstd":
+                options["serializer"] = (
+                    "core.cache_serializers.CompressedRedisSerializer"
+                )
+
+        backend_class = import_string(f"django.core.cache.backends.{backend}")
+        cache = backend_class(
+            location, {"OPTIONS": {"MAX_ENTRIES": 1_000_000, **options}}
+        )
+        if name == "database":
+            self.create_database_table()
+        return cache
+
+    def create_database_table(self: Self) -> None:
+        # createcachetable only reads settings.CACHES
+        from django.core.management.commands.createcachetable import (
+            Command as CreateCacheTableCommand,
+        )
+
+        command = CreateCacheTableCommand()
+        command.verbosity = 0
+        command.create_table(connection.alias, DATABASE_CACHE_TABLE, dry_run=False)
+
+    def benchmark(
+        self: Self, name: str, cache: BaseCache, value: dict, ops: int
+    ) -> None:
+        keys = [f"benchmark:{i}" for i in range(ops)]
+        results = {
+            "set": self.measure(lambda: [cache.set(key, value) for key in keys], ops),
+            "get": self.measure(lambda: [cache.get(key) for key in keys], ops),
+            "get_many": self.measure(
+                lambda: [cache.get_many(batch) for batch in batched(keys, 100)],
+                ops,
+            ),
+        }
+        self.stdout.write(
+            f"{name:<10} | "
+            + " | ".join(f"{op}: {rate:>12,.0f} ops/s" for op, rate in results.items()),
+        )
+
+    def measure(self: Self, func: Callable[[], Any], ops: int) -> float:
+        start = time.perf_counter()
+        func()
+        return ops / (time.perf_counter() - start)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, Any, Self
+
+from django.core.management.base import BaseCommand
+from djangorestframework_camel_case import util
+
+from core import casing
+
+if TYPE_CHECKING:
+    from argparse import ArgumentParser
+    from collections.abc import Callable
+
+
+def generate_payload(rows: int, depth: int) -> dict:
+    """A list response of `rows` rows, each nesting `depth` levels of objects."""
+    row: dict[str, Any] = {"leaf_value": 1, "updated_at": "2024-01-01T00:00:00Z"}
+    for level in range(depth):
+        row = {
+            "id": level,
+            "first_name": "name",
+            "last_name": "name",
+            "email_address": "user@example.com",
+            "is_active": True,
+            "tag_list": ["a", "b"],
+            "nested_object": row,
+        }
+    return {"count": rows, "page_size": rows, "results": [row] * rows}
+
+
+class Command(BaseCommand):
+    help = "Compare the camelCase/snake_case key translation of the payloads."
+
+    def add_arguments(self: Self, parser: ArgumentParser) -> None:
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--depth", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def handle(self: Self, *args: Any, **options: Any) -> None:
+        payload = generate_payload(options["rows"], options["depth"])
+        camel_payload = casing.camelize(payload)
+        if casing.underscoreize(camel_payload) != util.underscoreize(camel_payload):
+            msg = "The translations differ from djangorestframework_camel_case"
+            raise AssertionError(msg)
+
+        for name, library, memoized, data in [
+            ("camelize", util.camelize, casing.camelize, payload),
+            ("underscoreize", util.underscoreize, casing.underscoreize, camel_payload),
+        ]:
+            before = self.measure(library, data, options["repeat"])
+            after = self.measure(memoized, data, options["repeat"])
+            self.stdout.write(
+                f"{name:<14} | library: {before * 1000:>8.1f} ms"
+                f" | memoized: {after * 1000:>8.1f} ms | {before / after:.1f}x",
+            )
+
+    def measure(
+        self: Self, func: Callable[[Any], Any], data: Any, repeat: int
+    ) -> float:
+        """The best time of `repeat` runs, in seconds."""
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(data)
+            times.append(time.perf_counter() - start)
+        return min(times)
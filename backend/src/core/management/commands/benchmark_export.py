@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import datetime
+import random
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Self
+
+from django.core.management.base import BaseCommand
+
+from core.utils import BatchCSVWriter, BatchParquetWriter, batched
+
+if TYPE_CHECKING:
+    from argparse import ArgumentParser
+
+HEADERS = ["id", "uuid", "name", "amount", "created_at", "is_active"]
+
+
+def generate_rows(row_count: int) -> list[tuple]:
+    """Generate rows shaped like a typical `values_list` export."""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    return [
+        (
+            i,
+            str(uuid.uuid4()),
+            f"user_{i % 5000}",
+            round(random.uniform(0, 10000), 2),
+            now - datetime.timedelta(seconds=i),
+            i % 3 == 0,
+        )
+        for i in range(row_count)
+    ]
+
+
+def get_folder_size(folder: str) -> int:
+    return sum(path.stat().st_size for path in Path(folder).iterdir())
+
+
+class Command(BaseCommand):
+    help = "Compare the CSV and Parquet export writers by file size and time."
+
+    def add_arguments(self: Self, parser: ArgumentParser) -> None:
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--chunk-size", type=int, default=10_000)
+
+    def handle(self: Self, *args: Any, **options: Any) -> None:
+        rows = generate_rows(options["rows"])
+        chunk_size = options["chunk_size"]
+
+        with tempfile.TemporaryDirectory() as folder:
+            start = time.perf_counter()
+            with BatchCSVWriter(
+                folder,
+                "export_{batch_number}.csv",
+                headers=HEADERS,
+            ) as writer:
+                for row in rows:
+                    writer.write(row)
+            self.report("csv", time.perf_counter() - start, get_folder_size(folder))
+
+        with tempfile.TemporaryDirectory() as folder:
+            start = time.perf_counter()
+            with BatchParquetWriter(
+                folder,
+                "export_{batch_number}.parquet",
+                headers=HEADERS,
+            ) as writer:
+                for chunk in batched(rows, chunk_size):
+                    writer.write_batch(chunk)
+            self.report(
+                "parquet",
+                time.perf_counter() - start,
+                get_folder_size(folder),
+            )
+
+    def report(self: Self, name: str, duration: float, size: int) -> None:
+        self.stdout.write(
+            f"{name:<8} | time: {duration:8.3f}s | size: {size / 1_000_000:10.2f}MB",
+        )
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Self
+
+from django.http import QueryDict
+from djangorestframework_camel_case.settings import api_settings
+
+from core.casing import get_snake_translator
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from django.http import HttpRequest, HttpResponse
+
+
+class CamelCaseMiddleware:
+    """
+    Translate the camelCase query parameters to snake_case, as
+    `djangorestframework_camel_case.middleware.CamelCaseMiddleWare` does with
+    memoized keys.
+    """
+
+    def __init__(
+        self: Self,
+        get_response: Callable[[HttpRequest], HttpResponse],
+    ) -> None:
+        self.get_response = get_response
+        options = api_settings.JSON_UNDERSCOREIZE
+        self.translate = get_snake_translator(
+            options.get("no_underscore_before_number", False),
+        )
+        self.ignore_keys = options.get("ignore_keys") or ()
+
+    def __call__(self: Self, request: HttpRequest) -> HttpResponse:
+        if request.GET:
+            query = QueryDict(mutable=True)
+            for key, values in request.GET.lists():
+                new_key = self.translate(key)
+                if key in self.ignore_keys or new_key in self.ignore_keys:
+                    new_key = key
+                query.setlist(new_key, values)
+            request.GET = query
+        return self.get_response(request)
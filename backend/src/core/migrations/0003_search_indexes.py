@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from core.operations import AddPostgresIndex, get_trigram_index
+
+
+class Migration(migrations.Migration):
+
+    # the indexes are created concurrently, outside of a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0002_initial'),
+    ]
+
+    operations = [
+        AddPostgresIndex(
+            model_name='category',
+            index=get_trigram_index('name', 'categories_name_trgm'),
+            extension='pg_trgm',
+        ),
+        AddPostgresIndex(
+            model_name='tag',
+            index=get_trigram_index('name', 'tags_name_trgm'),
+            extension='pg_trgm',
+        ),
+    ]
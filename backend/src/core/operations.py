@@ -0,0 +1,157 @@
+"""
+Migration operations for the PostgreSQL only indexes, e.g. of the search.
+The indexes are created concurrently, the migration must not be atomic.
+
+```
+atomic = False
+
+operations = [
+    AddPostgresIndex("user", get_trigram_index("username", "users_username_trgm")),
+]
+```
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Any, Self
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, models
+from django.db.models.functions import Cast, Upper
+
+from core.config import settings
+from core.locks import get_sqlstate
+
+if TYPE_CHECKING:
+    from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+    from django.db.migrations.state import ProjectState
+
+logger = logging.getLogger("default")
+
+INSUFFICIENT_PRIVILEGE = "42501"
+
+
+def get_trigram_index(field_name: str, name: str) -> models.Index:
+    """
+    A pg_trgm GIN index serving `icontains`, PostgreSQL compares
+    `UPPER(field::text) LIKE UPPER(%s)`.
+    """
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+
+    return GinIndex(
+        OpClass(Upper(Cast(field_name, models.TextField())), name="gin_trgm_ops"),
+        name=name,
+    )
+
+
+def get_search_vector_index(field_name: str, name: str) -> models.Index:
+    """A GIN index of the `tsvector` the search filter matches the `@` fields with."""
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return GinIndex(SearchVector(field_name, config=settings.SEARCH_CONFIG), name=name)
+
+
+class AddPostgresIndex(AddIndexConcurrently):
+    """
+    Add an index on PostgreSQL only with `CREATE INDEX CONCURRENTLY`, so the
+    table is not locked against writes, other databases skip it.
+
+    The index is not part of the model state, the model does not declare it.
+    When `extension` is given it is created first, if the server does not
+    provide it the index is skipped with a warning. Creating an extension
+    needs the CREATE privilege on the database, or a superuser for the
+    untrusted ones.
+    """
+
+    def __init__(
+        self: Self,
+        model_name: str,
+        index: models.Index,
+        extension: str | None = None,
+    ) -> None:
+        super().__init__(model_name, index)
+        self.extension = extension
+
+    def deconstruct(self: Self) -> tuple[str, list, dict[str, Any]]:
+        name, args, kwargs = super().deconstruct()
+        if self.extension:
+            kwargs["extension"] = self.extension
+        return name, args, kwargs
+
+    def state_forwards(self: Self, app_label: str, state: ProjectState) -> None:
+        pass
+
+    def create_extension(self: Self, schema_editor: BaseDatabaseSchemaEditor) -> bool:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT installed_version IS NOT NULL"
+                " FROM pg_available_extensions WHERE name = %s",
+                [self.extension],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            logger.warning(
+                "Skipped index %s, the %s extension is not available",
+                self.index.name,
+                self.extension,
+            )
+            return False
+        if row[0]:
+            return True
+
+        try:
+            schema_editor.execute(
+                f"CREATE EXTENSION IF NOT EXISTS {schema_editor.quote_name(self.extension)}",
+            )
+        except DatabaseError as e:
+            if get_sqlstate(e.__cause__) != INSUFFICIENT_PRIVILEGE:
+                raise
+            msg = (
+                f"The database role may not create the {self.extension} extension,"
+                f" run `CREATE EXTENSION {self.extension};` as a superuser"
+                f" before migrating, it is needed by the index {self.index.name}"
+            )
+            raise ImproperlyConfigured(msg) from e
+        return True
+
+    def database_forwards(
+        self: Self,
+        app_label: str,
+        schema_editor: BaseDatabaseSchemaEditor,
+        from_state: ProjectState,
+        to_state: ProjectState,
+    ) -> None:
+        if schema_editor.connection.vendor != "postgresql":
+            return
+
+        self._ensure_not_in_transaction(schema_editor)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if self.extension and not self.create_extension(schema_editor):
+            return
+        schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(
+        self: Self,
+        app_label: str,
+        schema_editor: BaseDatabaseSchemaEditor,
+        from_state: ProjectState,
+        to_state: ProjectState,
+    ) -> None:
+        if schema_editor.connection.vendor != "postgresql":
+            return
+
+        self._ensure_not_in_transaction(schema_editor)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.execute(
+                "DROP INDEX CONCURRENTLY IF EXISTS"
+                f" {schema_editor.quote_name(self.index.name)}",
+            )
+
+    def describe(self: Self) -> str:
+        return f"Create PostgreSQL index {self.index.name} on {self.model_name}"
@@ -2,10 +2,201 @@
 Custom pagination classes for consistent API responses.
 """
 
+import datetime
+import itertools
+import json
+import logging
+import operator
+import time
+import uuid
 from collections import OrderedDict
+from decimal import Decimal
+from functools import reduce
 
-from rest_framework.pagination import PageNumberPagination
+from django.core import signing
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+from djangorestframework_camel_case.settings import api_settings
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (
+    BasePagination,
+    PageNumberPagination,
+    _positive_int,
+)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from core.casing import camelize
+from core.config import settings
+from core.renderers import dumps
+
+logger = logging.getLogger("default")
+
+
+def get_count(queryset, exact_threshold=None):
+    """
+    Count the queryset, return the count and whether it is approximate.
+
+    Only tables with more than `exact_threshold` rows by `pg_class.reltuples`
+    are estimated, the other ones are always counted. Unfiltered queries of
+    those tables return `reltuples`, filtered ones the `EXPLAIN` rows when
+    they are above the threshold.
+    """
+    if not isinstance(queryset, QuerySet):
+        return len(queryset), False
+
+    exact_threshold = (
+        settings.EXACT_COUNT_THRESHOLD if exact_threshold is None else exact_threshold
+    )
+    queryset = queryset.order_by()
+    try:
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return 0, False
+
+    table_rows = get_table_rows(queryset)
+    if table_rows is None or table_rows <= exact_threshold:
+        return queryset.count(), False
+
+    query = queryset.query
+    if not (
+        query.where
+        or query.distinct
+        or query.group_by
+        or query.combinator
+        or query.is_sliced
+    ):
+        return table_rows, True
+
+    estimate = estimate_count(queryset, sql, params)
+    if estimate > exact_threshold:
+        return estimate, True
+    return queryset.count(), False
+
+
+# (alias, table) -> (pg_class.reltuples, expiry), a rough size needs no sharing
+_table_rows = {}
+
+
+def get_table_rows(queryset):
+    """
+    The PostgreSQL `pg_class.reltuples` of the table of the queryset, kept in the
+    process for `TABLE_ROWS_CACHE_TIMEOUT` seconds, None elsewhere or before the
+    first analyze.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    db_table = queryset.model._meta.db_table
+    key = (queryset.db, db_table)
+    table_rows, expires_at = _table_rows.get(key, (None, 0.0))
+    if time.monotonic() >= expires_at:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(db_table)],
+            )
+            row = cursor.fetchone()
+        # -1 until the table is analyzed
+        table_rows = int(row[0]) if row and row[0] >= 0 else None
+        _table_rows[key] = (
+            table_rows,
+            time.monotonic() + settings.TABLE_ROWS_CACHE_TIMEOUT,
+        )
+    return table_rows
+
+
+def estimate_count(queryset, sql, params):
+    """The rows of the query by the PostgreSQL planner."""
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPage(Page):
+    def __init__(self, object_list, number, paginator, has_more):
+        super().__init__(object_list, number, paginator)
+        self.has_more = has_more
+
+    def has_next(self):
+        return self.has_more
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting with `get_count`, when the count is approximate
+    the pages are not bounded by it and `has_next` is found by reading one more row.
+
+    The pages known to exist are the ones up to the next of the last page read,
+    and the last page makes the count exact. A page past the rows raises
+    `EmptyPage`, like with an exact count.
+    """
+
+    # the pages known to exist while the count is approximate
+    known_pages = 1
+
+    @cached_property
+    def count_result(self):
+        return get_count(self.object_list)
+
+    @property
+    def count(self):
+        return self.count_result[0]
+
+    @property
+    def is_count_approximate(self):
+        return self.count_result[1]
+
+    @property
+    def num_pages(self):
+        if not self.is_count_approximate:
+            return super().num_pages
+        return self.known_pages
+
+    def validate_number(self, number):
+        if not self.is_count_approximate:
+            return super().validate_number(number)
+
+        try:
+            number = int(number)
+        except (TypeError, ValueError) as e:
+            raise PageNotAnInteger(self.error_messages["invalid_page"]) from e
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def page(self, number):
+        if not self.is_count_approximate:
+            return super().page(number)
+
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom : bottom + self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages["no_results"])
+        if has_more:
+            self.known_pages = max(self.known_pages, number + 1)
+        else:
+            # the last page, the rows before it are all counted
+            self.count_result = (bottom + len(rows), False)
+        return EstimatedCountPage(
+            rows[: self.per_page],
+            number,
+            self,
+            has_more=has_more,
+        )
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -16,16 +207,27 @@ class StandardResultsSetPagination(PageNumberPagination):
         "next": "...",
         "previous": "...",
         "count": 123,
+        "count_is_approximate": false,
         "page": 1,
         "page_size": 20,
         "total_pages": 7
     }
+    `total_pages` is null when the count is approximate, the pages are
+    followed by the `next` links.
     """
 
+    django_paginator_class = EstimatedCountPaginator
     page_size = 20
     page_size_query_param = "page_size"
     max_page_size = 100
 
+    def get_total_pages(self):
+        """The pages of the exact count, None while the count is approximate."""
+        paginator = self.page.paginator
+        if paginator.is_count_approximate:
+            return None
+        return paginator.num_pages
+
     def get_paginated_response(self, data):
         return Response(
             OrderedDict(
@@ -34,20 +236,335 @@ class StandardResultsSetPagination(PageNumberPagination):
                     ("next", self.get_next_link()),
                     ("previous", self.get_previous_link()),
                     ("count", self.page.paginator.count),
+                    (
+                        "count_is_approximate",
+                        self.page.paginator.is_count_approximate,
+                    ),
                     ("page", self.page.number),
                     ("page_size", self.page.paginator.per_page),
-                    ("total_pages", self.page.paginator.num_pages),
+                    ("total_pages", self.get_total_pages()),
                 ]
             )
         )
 
 
+class CursorSerializer:
+    """
+    JSON for the cursor values, keeping the microseconds which
+    `DjangoJSONEncoder` drops.
+    """
+
+    def dumps(self, obj):
+        return json.dumps(obj, default=self.default, separators=(",", ":")).encode(
+            "latin-1"
+        )
+
+    def loads(self, data):
+        return json.loads(data.decode("latin-1"))
+
+    @staticmethod
+    def default(value):
+        if isinstance(value, datetime.date | datetime.time):
+            return value.isoformat()
+        if isinstance(value, Decimal | uuid.UUID):
+            return str(value)
+        raise TypeError
+
+
+class CursorPagination(BasePagination):
+    """
+    Keyset pagination on the ordering of the queryset, e.g. the `sort` of `SortingFilter`:
+    {
+        "results": [...],
+        "next": "...",
+        "previous": "...",
+        "page_size": 20,
+        "count": 123 (with ?count=true)
+    }
+
+    The cursor is the signed sort values of the first or last row of the page,
+    so a page costs the same at any depth. The primary key is added to the ordering
+    as a tiebreaker and NULLs are sorted last in ascending order. Annotations can
+    be ordered by too, e.g. the `search_rank` of `CustomSearchFilter`.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = 100
+    page_size_query_param = "size"
+    max_page_size = 1000
+    count_query_param = "count"
+    default_ordering = ("-pk",)
+    invalid_cursor_message = "Invalid cursor"
+    salt = "core.pagination.CursorPagination"
+    # default to settings.SECRET_KEY
+    signing_key = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        # (lookup, descending, nullable) of each ordering field
+        self.fields = [self.resolve_field(queryset, name) for name in self.ordering]
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ("true", "1"):
+            self.count = queryset.order_by().count()
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor["r"])
+        queryset = queryset.order_by(*self.get_order_by(reverse))
+        if cursor:
+            queryset = queryset.filter(self.get_keyset_filter(cursor["v"], reverse))
+
+        rows = list(queryset[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = bool(cursor) if reverse else has_more
+        self.has_previous = has_more if reverse else bool(cursor)
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, queryset):
+        ordering = list(
+            queryset.query.order_by
+            or queryset.model._meta.ordering
+            or self.default_ordering
+        )
+        if not all(isinstance(name, str) and name != "?" for name in ordering):
+            msg = "Cursor pagination needs to order by field names"
+            raise ValidationError({"sort": msg})
+
+        names = {name.lstrip("-") for name in ordering}
+        pk_name = queryset.model._meta.pk.name
+        if not names & {"pk", pk_name}:
+            # a unique tiebreaker, in the direction of the last field for the index
+            ordering.append("-pk" if ordering[-1].startswith("-") else "pk")
+        return ordering
+
+    def resolve_field(self, queryset, name):
+        annotation = queryset.query.annotations.get(name.lstrip("-"))
+        if annotation is not None:
+            # e.g. the rank of `CustomSearchFilter`, compared as an expression
+            nullable = getattr(annotation.output_field, "null", True)
+            return name.lstrip("-"), name.startswith("-"), nullable
+
+        parts = name.lstrip("-").split("__")
+        nullable = False
+        opts = queryset.model._meta
+        try:
+            for i, part in enumerate(parts):
+                field = opts.pk if part == "pk" else opts.get_field(part)
+                nullable = nullable or field.null
+                if i < len(parts) - 1:
+                    opts = field.related_model._meta
+        except (FieldDoesNotExist, AttributeError) as e:
+            msg = f"Cannot sort by {name.lstrip('-')}"
+            raise ValidationError({"sort": msg}) from e
+
+        if part != "pk":
+            # a foreign key is compared by its column, not the related ordering
+            parts[-1] = field.attname
+        return "__".join(parts), name.startswith("-"), nullable
+
+    def get_order_by(self, reverse):
+        order_by = []
+        for lookup, descending, nullable in self.fields:
+            descending = descending != reverse
+            if not nullable:
+                order_by.append(f"-{lookup}" if descending else lookup)
+            elif descending:
+                order_by.append(F(lookup).desc(nulls_first=True))
+            else:
+                order_by.append(F(lookup).asc(nulls_last=True))
+        return order_by
+
+    def get_keyset_filter(self, values, reverse):
+        """
+        Rows after the cursor: (f1 > v1) or (f1 = v1 and f2 > v2) or ...
+        """
+        conditions = []
+        equal = Q()
+        for (lookup, descending, nullable), value in zip(
+            self.fields, values, strict=True
+        ):
+            after = self.get_after(lookup, descending != reverse, nullable, value)
+            if after is not None:
+                conditions.append(equal & after)
+            if value is None:
+                equal &= Q(**{f"{lookup}__isnull": True})
+            else:
+                equal &= Q(**{lookup: value})
+
+        if not conditions:
+            return Q(pk__in=[])
+        return reduce(operator.or_, conditions)
+
+    def get_after(self, lookup, descending, nullable, value):
+        # NULLs are last in ascending order and first in descending order
+        if descending:
+            if value is None:
+                return Q(**{f"{lookup}__isnull": False})
+            return Q(**{f"{lookup}__lt": value})
+
+        if value is None:
+            return None
+        after = Q(**{f"{lookup}__gt": value})
+        if nullable:
+            after |= Q(**{f"{lookup}__isnull": True})
+        return after
+
+    def get_values(self, row):
+        values = []
+        for lookup, _, _ in self.fields:
+            value = row
+            for part in lookup.split("__"):
+                value = getattr(value, part, None)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, row, reverse):
+        payload = {"o": self.ordering, "v": self.get_values(row), "r": reverse}
+        cursor = signing.dumps(
+            payload,
+            key=self.signing_key,
+            salt=self.salt,
+            serializer=CursorSerializer,
+            compress=True,
+        )
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            cursor,
+        )
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+
+        try:
+            payload = signing.loads(
+                cursor,
+                key=self.signing_key,
+                salt=self.salt,
+                serializer=CursorSerializer,
+            )
+        except signing.BadSignature as e:
+            raise NotFound(self.invalid_cursor_message) from e
+
+        # the cursor is only valid for the ordering it was created with
+        if payload.get("o") != self.ordering or len(payload.get("v", [])) != len(
+            self.fields
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return payload
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict(
+            [
+                ("results", data),
+                ("next", self.get_next_link()),
+                ("previous", self.get_previous_link()),
+                ("page_size", self.page_size),
+            ]
+        )
+        if self.count is not None:
+            response["count"] = self.count
+        return Response(response)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "分頁游標",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "每頁要回傳的查詢結果數量",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "是否回傳查詢結果總數",
+                "schema": {"type": "boolean"},
+            },
+        ]
+
+
+def stream_json_results(chunks, get_envelope, transform=None):
+    """
+    Write `{"results": [...], ...}` as JSON chunk by chunk, the other fields of
+    the envelope are written after the results, `get_envelope` receives the number
+    of results.
+
+    Arguments:
+        - chunks: iterable of lists of results
+        - get_envelope: function of the count returning the other fields
+        - transform: applied to each list of results and to the envelope,
+            e.g. to camelize the keys
+    """
+    transform = transform or (lambda data: data)
+    count = 0
+    yield b'{"results":['
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if count:
+            yield b","
+        # strip the brackets of the list
+        yield dumps(transform(chunk))[1:-1]
+        count += len(chunk)
+    envelope = dumps(transform(get_envelope(count)))
+    yield b"]" + (b"," + envelope[1:] if len(envelope) > 2 else b"}")
+
+
 class ConsistentListMixin:
     """
     Mixin to ensure all list views return paginated response structure,
     even when pagination is disabled or not needed.
+
+    Without pagination the JSON results are streamed in chunks of
+    `list_chunk_size` rows, up to `list_max_rows` rows, `truncated` is true
+    in the envelope when rows were left out.
+
+    The first chunk is serialized before the response starts, so a failing
+    query still returns a 500. An error in a later chunk can not change the
+    status any more, it ends the response with an incomplete JSON body.
     """
 
+    list_chunk_size = None
+    list_max_rows = None
+
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
@@ -58,17 +575,66 @@ class ConsistentListMixin:
             return self.get_paginated_response(serializer.data)
 
         # If no pagination is configured, create a paginated-like response
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(
-            OrderedDict(
-                [
-                    ("results", serializer.data),
-                    ("next", None),
-                    ("previous", None),
-                    ("count", len(serializer.data)),
-                    ("page", 1),
-                    ("page_size", len(serializer.data)),
-                    ("total_pages", 1),
-                ]
-            )
+        renderer = getattr(request, "accepted_renderer", None)
+        if not isinstance(renderer, JSONRenderer):
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(self.get_list_envelope(serializer.data, len(queryset)))
+
+        transform = getattr(renderer, "transform", None)
+        if isinstance(renderer, CamelCaseJSONRenderer):
+
+            def transform(data):
+                return camelize(data, **api_settings.JSON_UNDERSCOREIZE)
+
+        chunks = self.iter_serialized_chunks(queryset)
+        first_chunk = next(chunks, [])
+        return StreamingHttpResponse(
+            stream_json_results(
+                itertools.chain([first_chunk], chunks),
+                lambda count: self.get_list_envelope(
+                    None, count, truncated=self.list_truncated
+                ),
+                transform,
+            ),
+            content_type=renderer.media_type,
+        )
+
+    def get_list_envelope(self, results, count, truncated=False):
+        envelope = OrderedDict([("results", results)] if results is not None else [])
+        envelope.update(
+            [
+                ("next", None),
+                ("previous", None),
+                ("count", count),
+                ("page", 1),
+                ("page_size", count),
+                ("total_pages", 1),
+                ("truncated", truncated),
+            ]
         )
+        return envelope
+
+    def iter_serialized_chunks(self, queryset):
+        """
+        Serialize the rows in chunks, without caching the queryset.
+        `list_truncated` is set once all the chunks are read.
+        """
+        chunk_size = self.list_chunk_size or settings.BATCH_SIZE
+        max_rows = self.list_max_rows or settings.UNPAGINATED_LIST_MAX_ROWS
+        if isinstance(queryset, QuerySet):
+            rows = queryset[: max_rows + 1].iterator(chunk_size=chunk_size)
+        else:
+            rows = iter(queryset)
+
+        self.list_truncated = False
+        total = 0
+        while chunk := list(itertools.islice(rows, min(chunk_size, max_rows - total))):
+            total += len(chunk)
+            yield self.get_serializer(chunk, many=True).data
+        if next(rows, None) is not None:
+            self.list_truncated = True
+            logger.warning(
+                "%s listed without pagination, truncated to %s rows",
+                type(self).__name__,
+                max_rows,
+            )
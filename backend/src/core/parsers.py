@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from typing import IO, Any, Self
+
+import orjson
+from djangorestframework_camel_case.settings import api_settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from core.casing import underscoreize
+
+
+class CamelCaseORJSONParser(JSONParser):
+    """Parse JSON with orjson and translate the camelCase keys to snake_case."""
+
+    json_underscoreize = api_settings.JSON_UNDERSCOREIZE
+
+    def parse(
+        self: Self,
+        stream: IO[bytes],
+        media_type: str | None = None,
+        parser_context: dict | None = None,
+    ) -> Any:
+        try:
+            data = orjson.loads(stream.read())
+        except orjson.JSONDecodeError as e:
+            msg = f"JSON parse error - {e}"
+            raise ParseError(msg) from e
+        return underscoreize(data, **self.json_underscoreize)
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from typing import Any, Self
+
+import orjson
+from djangorestframework_camel_case.settings import api_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.casing import camelize
+
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+LINE_SEPARATORS = ((b"\xe2\x80\xa8", b"\\u2028"), (b"\xe2\x80\xa9", b"\\u2029"))
+
+json_encoder = JSONEncoder()
+
+
+def orjson_default(value: Any) -> Any:
+    """
+    Encode what orjson does not as the REST framework encoder does, e.g.
+    Decimal, lazy translations and querysets. Datetimes are passed through
+    to keep the format of the REST framework.
+    """
+    return json_encoder.default(value)
+
+
+def dumps(data: Any, option: int = 0) -> bytes:
+    """The JSON of `data` as `JSONRenderer` writes it, with orjson."""
+    content = orjson.dumps(data, default=orjson_default, option=ORJSON_OPTIONS | option)
+    # a strict javascript subset, as JSONRenderer
+    for separator, escaped in LINE_SEPARATORS:
+        if separator in content:
+            content = content.replace(separator, escaped)
+    return content
+
+
+class CamelCaseORJSONRenderer(JSONRenderer):
+    """
+    Render the data with camelCase keys using orjson, the keys are translated
+    by the memoized `core.casing.camelize` before encoding.
+    """
+
+    json_underscoreize = api_settings.JSON_UNDERSCOREIZE
+
+    def transform(self: Self, data: Any) -> Any:
+        return camelize(data, **self.json_underscoreize)
+
+    def render(
+        self: Self,
+        data: Any,
+        accepted_media_type: str | None = None,
+        renderer_context: dict | None = None,
+    ) -> bytes:
+        if data is None:
+            return b""
+
+        # orjson only indents by 2 spaces
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        return dumps(self.transform(data), orjson.OPT_INDENT_2 if indent else 0)
@@ -1,6 +1,9 @@
+from functools import cache
 from typing import Any
 
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
 from rest_framework import serializers
 
 from .models import ImageModel
@@ -110,3 +113,89 @@ class ImageUploadSerializer(serializers.ModelSerializer):
         # Set the uploaded_by field to the current user
         validated_data["uploaded_by"] = self.context["request"].user
         return super().create(validated_data)
+
+
+def get_model_field(model: Any, path: str) -> Any:
+    """The relation `path` of `model` ends at, `None` if it is not a relation."""
+    field = None
+    for name in path.split("__"):
+        if model is None:
+            return None
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        model = field.related_model
+    return field if field is not None and field.is_relation else None
+
+
+def get_serializer_relations(
+    serializer: serializers.BaseSerializer, prefix: str = ""
+) -> tuple[list[str], list[str]]:
+    """
+    The `select_related` and `prefetch_related` lookups the representation
+    of `serializer` reads.
+
+    Nested serializers and related fields over a single relation are joined,
+    over many relations they are prefetched. Relations read elsewhere, e.g.
+    by a method field, are declared with `Meta.select_related` and
+    `Meta.prefetch_related`.
+    """
+    meta = getattr(serializer, "Meta", None)
+    model = getattr(meta, "model", None)
+    select = [prefix + name for name in getattr(meta, "select_related", ())]
+    prefetch = [prefix + name for name in getattr(meta, "prefetch_related", ())]
+    if model is None:
+        return select, prefetch
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == "*":
+            continue
+        path = field.source.replace(".", "__")
+        model_field = get_model_field(model, path)
+        if model_field is None:
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            prefetch.append(prefix + path)
+            nested_select, nested_prefetch = get_serializer_relations(
+                field.child, f"{prefix}{path}__"
+            )
+            prefetch += nested_select + nested_prefetch
+        elif isinstance(field, serializers.ManyRelatedField):
+            prefetch.append(prefix + path)
+        elif model_field.many_to_many or model_field.one_to_many:
+            continue
+        elif isinstance(field, serializers.BaseSerializer):
+            select.append(prefix + path)
+            nested_select, nested_prefetch = get_serializer_relations(
+                field, f"{prefix}{path}__"
+            )
+            select += nested_select
+            prefetch += nested_prefetch
+        elif (
+            isinstance(field, serializers.RelatedField)
+            and not field.use_pk_only_optimization()
+        ):
+            select.append(prefix + path)
+    return select, prefetch
+
+
+@cache
+def get_serializer_class_relations(
+    serializer_class: type[serializers.BaseSerializer],
+) -> tuple[list[str], list[str]]:
+    """`get_serializer_relations` of a serializer class, built once."""
+    return get_serializer_relations(serializer_class())
+
+
+def optimize_queryset(
+    queryset: QuerySet, serializer_class: type[serializers.BaseSerializer]
+) -> QuerySet:
+    """Select and prefetch the relations `serializer_class` reads."""
+    select, prefetch = get_serializer_class_relations(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
@@ -0,0 +1,7 @@
+from __future__ import annotations
+
+from core.cache import invalidate_on_save
+from core.configurations import SYSTEM_CONFIGURATION_TAG
+from core.models import SystemConfiguration
+
+invalidate_on_save(SystemConfiguration, lambda _: [SYSTEM_CONFIGURATION_TAG])
@@ -94,6 +94,22 @@ class FileStorage:
             **kwargs,
         )
 
+    def open_upload_stream(
+        self: Self,
+        remote_path: str,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Any:
+        """
+        open a writable binary stream to the remote path,
+        the object is stored when the stream is closed
+        """
+        return self.adapter.open_upload_stream(
+            remote_path,
+            *args,
+            **kwargs,
+        )
+
     def upload_folder(
         self: Self,
         local_path: str,
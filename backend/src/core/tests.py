@@ -1 +1,1248 @@
-# Create your tests here.
+"""
+Tests for the core app.
+"""
+
+import datetime
+import gzip
+import io
+import json
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from decimal import Decimal
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import polars as pl
+import pytest
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.utils.translation import gettext_lazy
+from django_filters import rest_framework as filters
+from djangorestframework_camel_case import util as camel_case_util
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+from rest_framework import generics, serializers
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.permissions import AllowAny
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core import pagination
+from core.archives import ZipArchiver, compress_files_to_storage
+from core.backends import CustomDjangoFilterBackend, CustomSearchFilter, SortingFilter
+from core.cache import (
+    CacheEntry,
+    cache_stats,
+    cacheable,
+    invalidate_local_caches,
+    invalidate_on_save,
+    invalidate_tags,
+    local_cache,
+)
+from core.casing import camelize, underscoreize
+from core.checks import has_index, resolve_field
+from core.config import settings as core_settings
+from core.configurations import SystemConfigurationStore
+from core.locks import (
+    CacheLock,
+    LockTimeoutError,
+    PostgresAdvisoryLock,
+    get_lock_backend,
+    lock_stats,
+)
+from core.models import Category, SystemConfiguration, Tag
+from core.pagination import (
+    ConsistentListMixin,
+    CursorPagination,
+    EstimatedCountPaginator,
+)
+from core.parsers import CamelCaseORJSONParser
+from core.renderers import CamelCaseORJSONRenderer
+from core.storages import FileStorage
+from core.utils import (
+    BaseBatchWriter,
+    BatchCSVWriter,
+    BatchParquetWriter,
+    StreamingBatchCSVWriter,
+    batched,
+    batched_queryset,
+    bulk_update_or_create,
+    compress_files,
+)
+
+
+@pytest.mark.unit
+def test_batch_csv_writer_writes_ok_file(tmp_path):
+    """Test the CSV writer writes the rows and the ok file."""
+    with BatchCSVWriter(
+        str(tmp_path),
+        "export_{batch_number}.csv",
+        headers=["id", "name"],
+        ok_file_name="export_{batch_number}.ok",
+    ) as writer:
+        writer.write([1, "foo"])
+        writer.write([2, "bar"])
+
+    assert (tmp_path / "export_0.csv").read_text().splitlines() == [
+        "id,name",
+        "1,foo",
+        "2,bar",
+    ]
+    assert (tmp_path / "export_0.ok").exists()
+
+
+@pytest.mark.unit
+def test_batch_parquet_writer_rolls_over_by_rows(tmp_path):
+    """Test the Parquet writer splits the chunks into files by row count."""
+    with BatchParquetWriter(
+        str(tmp_path),
+        "export_{batch_number}.parquet",
+        headers=["id", "name"],
+        file_limit_rows=4,
+        ok_file_name="export_{batch_number}.ok",
+    ) as writer:
+        writer.write_batch([(i, f"name_{i}") for i in range(3)])
+        writer.write_batch([(i, f"name_{i}") for i in range(3, 10)])
+
+    files = sorted(Path(tmp_path).glob("*.parquet"))
+    assert [pl.read_parquet(f).height for f in files] == [4, 4, 2]
+    assert pl.read_parquet(files[-1])["name"].to_list() == ["name_8", "name_9"]
+    assert (tmp_path / "export_2.ok").exists()
+
+
+@pytest.mark.unit
+def test_batch_parquet_writer_without_rows(tmp_path):
+    """Test the Parquet writer always outputs at least one file."""
+    with BatchParquetWriter(
+        str(tmp_path),
+        "export_{batch_number}.parquet",
+        headers=["id", "name"],
+    ):
+        pass
+
+    assert pl.read_parquet(tmp_path / "export_0.parquet").columns == ["id", "name"]
+
+
+@pytest.mark.unit
+def test_batch_parquet_writer_streams_row_groups(tmp_path):
+    """Test each batch is written to the open file as its own row groups."""
+    import pyarrow.parquet as pq
+
+    with BatchParquetWriter(
+        str(tmp_path),
+        "export_{batch_number}.parquet",
+        headers=["id", "name"],
+        file_limit_rows=0,
+        row_group_size=3,
+        schema={"id": pl.Int64, "name": pl.String},
+    ) as writer:
+        writer.write_batch([(i, None) for i in range(2)])
+        assert writer.writer is not None
+        writer.write_batch([(i, f"name_{i}") for i in range(2, 7)])
+
+    metadata = pq.ParquetFile(tmp_path / "export_0.parquet").metadata
+    assert [metadata.row_group(i).num_rows for i in range(3)] == [2, 3, 2]
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+    frame = pl.read_parquet(tmp_path / "export_0.parquet")
+    assert frame["name"].to_list() == [None, None, *(f"name_{i}" for i in range(2, 7))]
+
+    with (
+        pytest.raises(ValueError, match="schema"),
+        BatchParquetWriter(str(tmp_path), "nulls_{batch_number}.parquet") as writer,
+    ):
+        writer.write_batch([{"name": None}])
+        writer.write_batch([{"name": "name"}])
+
+
+@pytest.mark.django_db
+def test_batch_parquet_writer_writes_model_querysets(tmp_path):
+    """Test model instances are written by their headers, or else their fields."""
+    for i in range(3):
+        Category.objects.create(name=f"category {i}", slug=f"category-{i}", order=i)
+
+    with BatchParquetWriter(
+        str(tmp_path),
+        "categories_{batch_number}.parquet",
+        headers=["name", "order", "parent"],
+    ) as writer:
+        writer.write_queryset(Category.objects.all(), batch_size=2)
+
+    frame = pl.read_parquet(tmp_path / "categories_0.parquet")
+    assert frame.columns == ["name", "order", "parent"]
+    assert frame["order"].to_list() == [0, 1, 2]
+
+    with BatchParquetWriter(str(tmp_path), "all_{batch_number}.parquet") as writer:
+        writer.write_queryset(Category.objects.all())
+    columns = pl.read_parquet(tmp_path / "all_0.parquet").columns
+    assert {"id", "name", "parent_id"} <= set(columns)
+
+
+@pytest.mark.unit
+def test_incomplete_batch_writer_is_not_instantiable(tmp_path):
+    """Test a writer missing a file operation fails before writing anything."""
+
+    class NoCloseWriter(BaseBatchWriter):
+        def open_new_file(self, columns=None, filename_format=None):
+            pass
+
+        def write_batch(self, chunk):
+            pass
+
+    with pytest.raises(TypeError, match="close"):
+        NoCloseWriter(str(tmp_path), "export_{batch_number}.txt")
+
+
+@pytest.mark.unit
+def test_batch_csv_writer_rolls_over_on_exact_bytes(tmp_path):
+    """Test the CSV writer rolls over right after the row exceeding the limit."""
+    with BatchCSVWriter(
+        str(tmp_path),
+        "export_{batch_number}.csv",
+        headers=["id"],
+        file_limit_bytes=10,
+        buffer_rows=100,
+    ) as writer:
+        for i in range(10):
+            writer.write([f"{i}é"])
+
+    files = sorted(Path(tmp_path).glob("*.csv"))
+    # header (4 bytes) + 2 rows (5 bytes each) exceed 10 bytes
+    line_counts = [f.read_text(encoding="utf-8").count("\n") for f in files]
+    assert line_counts == [3] * 5 + [1]
+    assert all(f.stat().st_size == 14 for f in files[:-1])
+
+
+class FakeStorage:
+    def __init__(self):
+        self.uploaded = {}
+
+    def upload_file(self, local_path, remote_path):
+        self.uploaded[remote_path] = Path(local_path).read_bytes()
+
+
+@pytest.mark.unit
+def test_streaming_batch_csv_writer_uploads_compressed_parts(tmp_path):
+    """Test the streaming writer uploads gzip parts, then the ok file."""
+    storage = FakeStorage()
+    with StreamingBatchCSVWriter(
+        str(tmp_path),
+        "export_{batch_number}.csv",
+        "bucket",
+        ["exports"],
+        headers=["id"],
+        file_limit_bytes=20,
+        ok_file_name="export.ok",
+        storage=storage,
+    ) as writer:
+        for i in range(10):
+            writer.write([i])
+
+    assert list(storage.uploaded)[-1] == "exports/export.ok"
+    parts = [key for key in storage.uploaded if key.endswith(".csv.gz")]
+    assert len(parts) == 2
+    content = b"".join(gzip.decompress(storage.uploaded[key]) for key in parts)
+    assert content.count(b"\r\n") == 12
+    # uploaded parts are removed from the local folder
+    assert not list(Path(tmp_path).glob("*.gz"))
+
+
+@pytest.mark.unit
+def test_compress_files(tmp_path):
+    """Test the files are zipped without their paths and removed."""
+    files = []
+    for i in range(5):
+        path = tmp_path / "data" / f"part_{i}.csv"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text("id,name\n" * 1000 * (i + 1))
+        files.append(str(path))
+
+    zip_file_name = tmp_path / "export.zip"
+    size = compress_files(str(zip_file_name), files)
+
+    assert size == zip_file_name.stat().st_size
+    with zipfile.ZipFile(zip_file_name) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist() == [f"part_{i}.csv" for i in range(5)]
+        assert zip_file.read("part_4.csv") == b"id,name\n" * 5000
+    assert not any(Path(f).exists() for f in files)
+
+
+@pytest.mark.unit
+def test_compress_files_with_password(tmp_path):
+    """Test password protected archives stay ZipCrypto, readable by the stdlib."""
+    if not shutil.which("zip"):
+        pytest.skip("the zip command is not installed")
+    path = tmp_path / "data" / "secret.csv"
+    path.parent.mkdir()
+    path.write_text("id,name\n" * 1000)
+
+    zip_file_name = tmp_path / "export.zip"
+    compress_files(str(zip_file_name), [str(path)], password="s3cret")
+
+    with zipfile.ZipFile(zip_file_name) as zip_file:
+        assert zip_file.namelist() == ["secret.csv"]
+        with pytest.raises(RuntimeError):
+            zip_file.read("secret.csv")
+        assert zip_file.read("secret.csv", pwd=b"s3cret") == b"id,name\n" * 1000
+
+
+class UnseekableStream(io.RawIOBase):
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+
+@pytest.mark.unit
+def test_zip_archiver_streams_to_unseekable_output(tmp_path):
+    """Test the archive can be streamed, e.g. into a multipart upload."""
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"a" * 100_000)
+    stream = UnseekableStream()
+
+    with ZipArchiver(stream, max_workers=2) as archiver:
+        archiver.add_files([path])
+
+    data = b"".join(stream.chunks)
+    assert archiver.bytes_out == len(data)
+    assert archiver.compression_ratio < 0.01
+    with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+        assert zip_file.read("data.csv") == b"a" * 100_000
+
+
+@pytest.mark.unit
+def test_compress_files_to_storage_failure_leaves_no_object(tmp_path, monkeypatch):
+    """Test a failed archive is not stored, the upload is aborted instead."""
+    monkeypatch.setenv("EXPORTS_LOCAL_PATH", str(tmp_path / "storage"))
+    storage = FileStorage(
+        "core.adapters.object_storage.local.LocalStorageAdapter",
+        "exports",
+    )
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"a" * 100_000)
+
+    def files():
+        yield path
+        msg = "the export failed"
+        raise RuntimeError(msg)
+
+    with pytest.raises(RuntimeError, match="export failed"):
+        compress_files_to_storage(storage, "exports/export.zip", files())
+    assert not list((tmp_path / "storage").rglob("*.*"))
+
+    compress_files_to_storage(storage, "exports/export.zip", [path])
+    assert [p.name for p in (tmp_path / "storage").rglob("*.*")] == ["export.zip"]
+
+
+@pytest.mark.django_db
+def test_bulk_update_or_create():
+    """Test existing rows are updated and missing rows are created."""
+    Tag.objects.create(name="Python", slug="python", usage_count=1)
+
+    result = bulk_update_or_create(
+        Tag,
+        [
+            {"name": "Python", "slug": "python", "usage_count": 5},
+            {"name": "Django", "slug": "django", "usage_count": 3},
+        ],
+        match_field="slug",
+        create_fields=["name", "slug", "usage_count"],
+        update_fields=["usage_count"],
+    )
+
+    assert result == {"created": 1, "updated": 1, "unchanged": 0}
+    assert dict(Tag.objects.values_list("slug", "usage_count")) == {
+        "python": 5,
+        "django": 3,
+    }
+    assert Tag.objects.get(slug="django").created_at is not None
+
+
+@pytest.mark.django_db
+def test_bulk_update_or_create_with_update_only_fields():
+    """Test fields only listed in update_fields are not set on created rows."""
+    Tag.objects.create(name="Python", slug="python")
+
+    result = bulk_update_or_create(
+        Tag,
+        [
+            {"name": "Python", "slug": "python", "description": "updated"},
+            {"name": "Django", "slug": "django", "description": "ignored"},
+        ],
+        match_field="slug",
+        create_fields=["name", "slug"],
+        update_fields=["description"],
+    )
+
+    assert result == {"created": 1, "updated": 1, "unchanged": 0}
+    assert dict(Tag.objects.values_list("slug", "description")) == {
+        "python": "updated",
+        "django": "",
+    }
+
+
+@pytest.mark.django_db
+def test_bulk_update_or_create_by_auto_primary_key():
+    """Test rows matched by their auto id are updated, not inserted again."""
+    tags = [
+        Tag.objects.create(name=f"tag {i}", slug=f"tag-{i}", usage_count=0)
+        for i in range(3)
+    ]
+
+    result = bulk_update_or_create(
+        Tag,
+        [
+            {"id": tag.pk, "name": tag.name, "slug": tag.slug, "usage_count": 7}
+            for tag in tags
+        ],
+        match_field="id",
+        create_fields=["name", "slug", "usage_count"],
+        update_fields=["usage_count"],
+    )
+
+    assert result == {"created": 0, "updated": 3, "unchanged": 0}
+    assert Tag.objects.count() == 3
+    assert set(Tag.objects.values_list("usage_count", flat=True)) == {7}
+
+
+@pytest.mark.django_db
+def test_bulk_update_or_create_skips_unchanged_rows():
+    """Test matched rows holding the incoming values are not written."""
+    Tag.objects.create(name="Python", slug="python", usage_count=5)
+    Tag.objects.create(name="Django", slug="django", usage_count=1)
+
+    result = bulk_update_or_create(
+        Tag,
+        [
+            {"name": "Python", "slug": "python", "usage_count": 5},
+            {"name": "Django", "slug": "django", "usage_count": 3},
+            {"name": "Flask", "slug": "flask", "usage_count": 0},
+        ],
+        match_field="slug",
+        create_fields=["name", "slug", "usage_count"],
+        update_fields=["usage_count"],
+    )
+
+    assert result == {"created": 1, "updated": 1, "unchanged": 1}
+    assert dict(Tag.objects.values_list("slug", "usage_count")) == {
+        "python": 5,
+        "django": 3,
+        "flask": 0,
+    }
+
+
+@pytest.mark.unit
+def test_batched_accepts_generators():
+    """Test batched works on iterables without len() or slicing."""
+    assert list(batched((i for i in range(5)), 2)) == [[0, 1], [2, 3], [4]]
+
+
+@pytest.mark.django_db
+def test_batched_queryset():
+    """Test the queryset is streamed by keyset in fixed-size batches."""
+    Tag.objects.bulk_create(Tag(name=f"tag {i}", slug=f"tag-{i}") for i in range(5))
+    queryset = Tag.objects.order_by("-name")
+
+    batches = list(batched_queryset(queryset.values_list("slug", "name"), 2, "slug"))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert batches[0][0] == ("tag-0", "tag 0")
+
+    instances = [tag for batch in batched_queryset(queryset, 2) for tag in batch]
+    assert [tag.slug for tag in instances] == [f"tag-{i}" for i in range(5)]
+
+    with pytest.raises(ValueError, match="keyset"):
+        next(batched_queryset(queryset.values_list("name"), 2))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bulk_update_or_create_with_workers():
+    """Test the partitions are upserted concurrently and reported."""
+    Tag.objects.create(name="tag 0", slug="tag-0", usage_count=0)
+
+    result = bulk_update_or_create(
+        Tag,
+        [{"name": f"tag {i}", "slug": f"tag-{i}", "usage_count": i} for i in range(20)],
+        match_field="slug",
+        create_fields=["name", "slug", "usage_count"],
+        update_fields=["usage_count"],
+        workers=4,
+    )
+
+    assert (result["created"], result["updated"], result["unchanged"]) == (19, 0, 1)
+    assert len(result["partitions"]) == 4
+    assert sum(p["created"] + p["unchanged"] for p in result["partitions"]) == 20
+    assert Tag.objects.count() == 20
+
+
+@pytest.mark.django_db
+def test_bulk_update_or_create_with_workers_inside_transaction():
+    """Test concurrent upserts refuse to run inside a transaction."""
+    with pytest.raises(ValueError, match="transaction"):
+        bulk_update_or_create(
+            Tag,
+            [{"name": "tag", "slug": "tag"}],
+            match_field="slug",
+            create_fields=["name", "slug"],
+            update_fields=[],
+            workers=2,
+        )
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(
+    connection.vendor != "postgresql",
+    reason="advisory locks require PostgreSQL",
+)
+def test_postgres_advisory_lock():
+    """Test the lock is exclusive, times out and is granted after release."""
+    lock_stats.reset()
+    holder = PostgresAdvisoryLock("file:a", timeout=0)
+    with holder:
+        assert not PostgresAdvisoryLock("file:a").acquire(timeout=0.2)
+        with pytest.raises(LockTimeoutError):
+            PostgresAdvisoryLock("file:a", timeout=0).__enter__()
+        with PostgresAdvisoryLock("file:b", timeout=0):
+            pass
+
+    # a waiter is woken up as soon as the holder releases
+    holder.acquire()
+    waiter = PostgresAdvisoryLock("file:a", timeout=5)
+    thread = threading.Thread(target=waiter.acquire)
+    thread.start()
+    time.sleep(0.2)
+    holder.release()
+    thread.join()
+    assert waiter.locked
+    waiter.release()
+    assert (lock_stats.acquired, lock_stats.timeouts) == (4, 2)
+    assert lock_stats.max_wait >= 0.2
+
+
+def test_cache_lock(locmem_cache):
+    """Test the cache lock is exclusive and a waiter gets it after release."""
+    holder = CacheLock("file:a", timeout=0)
+    with holder:
+        assert not CacheLock("file:a").acquire(timeout=0.1)
+        with CacheLock("file:b", timeout=0):
+            pass
+
+    holder.acquire()
+    waiter = CacheLock("file:a", timeout=5)
+    thread = threading.Thread(target=waiter.acquire)
+    thread.start()
+    time.sleep(0.1)
+    holder.release()
+    thread.join()
+    assert waiter.locked
+    waiter.release()
+
+
+def test_default_lock_backend(monkeypatch):
+    """Test the default lock backend follows the database vendor."""
+    monkeypatch.setattr(core_settings, "LOCK_BACKEND", None)
+    expected = PostgresAdvisoryLock if connection.vendor == "postgresql" else CacheLock
+    assert get_lock_backend() is expected
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+    local_cache.clear()
+    cache_stats.reset()
+    yield cache
+    cache.clear()
+    local_cache.clear()
+
+
+@pytest.mark.unit
+def test_cacheable_caches_none(locmem_cache):
+    """Test a None result is cached and refresh_cache recomputes it."""
+    calls = []
+
+    @cacheable(lambda x: f"none_{x}")
+    def get_nothing(x):
+        calls.append(x)
+
+    assert get_nothing(1) is None
+    assert get_nothing(1) is None
+    assert calls == [1]
+
+    get_nothing(1, refresh_cache=True)
+    assert calls == [1, 1]
+
+
+@pytest.mark.unit
+def test_cacheable_single_flight(locmem_cache):
+    """Test concurrent misses compute the value once."""
+    calls = []
+
+    @cacheable("slow")
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(slow())) for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+
+
+@pytest.mark.unit
+def test_cacheable_serves_stale_while_refreshing(locmem_cache):
+    """Test an expired value is served while it is refreshed in the background."""
+
+    @cacheable("stale")
+    def get_value():
+        return "new"
+
+    key = get_value.cached_function.get_key((), {})
+    cache.set(key, CacheEntry("old", fresh_until=0))
+
+    assert get_value() == "old"
+    deadline = time.monotonic() + 2
+    while cache.get(key).value == "old" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert get_value() == "new"
+
+
+@pytest.mark.unit
+def test_cacheable_local_tier(locmem_cache, monkeypatch):
+    """Test hits are served in-process until another process invalidates them."""
+    calls = []
+
+    @cacheable("config")
+    def get_config():
+        calls.append(1)
+        return {"feature": True}
+
+    get_config()["feature"] = False
+    assert get_config() == {"feature": True}
+    assert (cache_stats.local.hits, cache_stats.shared.misses) == (1, 1)
+
+    # another process updates the value and bumps the version
+    key = get_config.cached_function.get_key((), {})
+    cache.set(key, CacheEntry({"feature": False}, fresh_until=time.time() + 60))
+    local_key = get_config.cached_function.get_local_key(key)
+    invalidate_local_caches()
+    local_cache.set(local_key, CacheEntry({"feature": True}, time.time() + 60), 60)
+    monkeypatch.setattr(local_cache, "synced_at", 0.0)
+
+    assert get_config() == {"feature": False}
+    assert cache_stats.shared.hits == 1
+    assert len(calls) == 1
+
+
+@pytest.mark.unit
+def test_invalidate_tags_keeps_the_local_tier(locmem_cache, monkeypatch):
+    """Test a tag invalidation only drops the tag generations of the local tier."""
+    calls = []
+
+    @cacheable(tags=lambda user_id: [f"user:{user_id}"])
+    def get_profile(user_id):
+        calls.append(user_id)
+        return {"id": user_id}
+
+    @cacheable("settings")
+    def get_settings():
+        calls.append("settings")
+        return {}
+
+    get_profile(1)
+    get_settings()
+    invalidate_tags("user:1")
+    monkeypatch.setattr(local_cache, "synced_at", 0.0)
+    get_profile(1)
+    get_settings()
+    assert calls == [1, "settings", 1]
+    assert cache_stats.shared.misses == 3
+
+    # another process invalidates the tag, the generation is read again on sync
+    generation_key = "cacheable:tag:user:1"
+    local_cache.set(generation_key, 0, 60)
+    cache.incr(generation_key)
+    cache.incr("local_cache:tags_version")
+    monkeypatch.setattr(local_cache, "synced_at", 0.0)
+    get_profile(1)
+    get_settings()
+    assert calls == [1, "settings", 1, 1]
+
+
+@pytest.mark.unit
+def test_cacheable_invalidate_keeps_the_local_tier(locmem_cache, monkeypatch):
+    """Test invalidating a key only drops the local entries of its function."""
+    calls = []
+
+    @cacheable()
+    def get_profile(user_id):
+        calls.append(user_id)
+        return {"id": user_id}
+
+    @cacheable("settings")
+    def get_settings():
+        calls.append("settings")
+        return {}
+
+    get_profile(1)
+    get_settings()
+    get_profile.invalidate(1)
+    monkeypatch.setattr(local_cache, "synced_at", 0.0)
+    get_profile(1)
+    get_settings()
+    assert calls == [1, "settings", 1]
+    assert (cache_stats.local.hits, cache_stats.shared.misses) == (1, 3)
+
+
+@pytest.mark.unit
+def test_cacheable_derives_keys_from_arguments(locmem_cache):
+    """Test keys are derived from the bound arguments and invalidated by tag."""
+    calls = []
+
+    @cacheable(tags=lambda user_id, detail=False: [f"user:{user_id}"])
+    def get_profile(user_id, detail=False):
+        calls.append(user_id)
+        return {"id": user_id, "detail": detail}
+
+    assert get_profile(1) == get_profile(user_id=1, detail=False)
+    get_profile(2)
+    assert calls == [1, 2]
+
+    invalidate_tags("user:1")
+    get_profile(1)
+    get_profile(2)
+    assert calls == [1, 2, 1]
+
+    get_profile.invalidate_all()
+    get_profile(2)
+    assert calls == [1, 2, 1, 2]
+
+
+@pytest.mark.django_db
+def test_invalidate_on_save(locmem_cache, django_capture_on_commit_callbacks):
+    """Test saving an instance invalidates the keys tagged with it."""
+
+    def get_tags(tag):
+        return [f"tag:{tag.pk}"]
+
+    @cacheable(tags=lambda tag: get_tags(tag))
+    def get_usage(tag):
+        return Tag.objects.get(pk=tag.pk).usage_count
+
+    invalidate_on_save(Tag, get_tags)
+    try:
+        tag = Tag.objects.create(name="Python", slug="python", usage_count=1)
+        assert get_usage(tag) == 1
+        with django_capture_on_commit_callbacks(execute=True):
+            tag.usage_count = 2
+            tag.save()
+        assert get_usage(tag) == 2
+    finally:
+        for signal in (post_save, post_delete):
+            signal.disconnect(
+                sender=Tag,
+                dispatch_uid=f"cacheable:core.Tag:{id(get_tags)}",
+            )
+
+
+@pytest.mark.unit
+def test_cacheable_many(locmem_cache):
+    """Test the cached values are read at once and the misses loaded at once."""
+    loaded = []
+
+    @cacheable(local_timeout=0)
+    def get_square(x):
+        return x * x
+
+    def load_squares(values):
+        loaded.append(values)
+        return {x: x * x for x in values}
+
+    assert get_square(2) == 4
+    assert get_square.many([1, 2, 3, 1], loader=load_squares) == [1, 4, 9, 1]
+    assert loaded == [[1, 3]]
+    assert get_square.many([3, 1, 2], loader=load_squares) == [9, 1, 4]
+    assert loaded == [[1, 3]]
+
+
+@pytest.mark.django_db
+def test_system_configuration_store(
+    locmem_cache,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+):
+    """Test the typed values are read once and reloaded after a save."""
+    SystemConfiguration.objects.create(
+        key="limits", value='{"rows": 10}', value_type="json"
+    )
+    SystemConfiguration.objects.create(key="old", value="1", is_active=False)
+    config = SystemConfigurationStore(check_interval=0)
+
+    assert config.get("limits") == {"rows": 10}
+    with django_assert_num_queries(0):
+        assert config.get("old", "default") == "default"
+        # the callers get copies, the snapshot is not changed
+        config.get("limits")["rows"] = 20
+        config["limits"]["rows"] = 30
+        assert config["limits"] == {"rows": 10}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        SystemConfiguration.objects.filter(key="old").get().delete()
+        SystemConfiguration.objects.create(
+            key="debug", value="yes", value_type="boolean"
+        )
+    assert config.get("debug") is True
+
+
+@pytest.mark.unit
+def test_compressed_redis_serializer():
+    """Test large values are compressed and integers stay raw for incr."""
+    pytest.importorskip("zstandard")
+    from core.cache_serializers import ZSTD_MAGIC, CompressedRedisSerializer
+
+    serializer = CompressedRedisSerializer(min_size=100)
+    value = {"rows": ["x" * 10] * 100}
+
+    data = serializer.dumps(value)
+    assert data.startswith(ZSTD_MAGIC)
+    assert serializer.loads(data) == value
+    assert serializer.loads(serializer.dumps("small")) == "small"
+    assert serializer.dumps(1) == 1
+
+
+@pytest.mark.unit
+def test_sized_zstd_compressor(monkeypatch):
+    """Test the django-redis compressor applies CACHE_COMPRESS_MIN_BYTES."""
+    pytest.importorskip("django_redis")
+    pytest.importorskip("pyzstd")
+    from core.cache_compressors import SizedZStdCompressor
+    from core.cache_serializers import ZSTD_MAGIC
+
+    monkeypatch.setattr(SizedZStdCompressor, "min_length", 100)
+    compressor = SizedZStdCompressor(None)
+    assert compressor.compress(b"x" * 99) == b"x" * 99
+    data = compressor.compress(b"x" * 100)
+    assert data.startswith(ZSTD_MAGIC)
+    assert compressor.decompress(data) == b"x" * 100
+
+
+def paginate(queryset, link=None, **params):
+    if link:
+        params = {
+            key: value[0] for key, value in parse_qs(urlparse(link).query).items()
+        }
+    request = Request(APIRequestFactory().get("/categories/", params))
+    paginator = CursorPagination()
+    paginator.signing_key = "cursor-signing-key"
+    page = paginator.paginate_queryset(queryset, request)
+    return [category.name for category in page], paginator.get_paginated_response(
+        []
+    ).data
+
+
+@pytest.mark.django_db
+def test_cursor_pagination_walks_both_ways():
+    """Test the pages follow the ordering with ties and NULLs, forward and back."""
+    roots = [
+        Category.objects.create(name=f"root {i}", slug=f"root-{i}") for i in range(2)
+    ]
+    for i in range(7):
+        Category.objects.create(
+            name=f"child {i}",
+            slug=f"child-{i}",
+            parent=roots[i % 2],
+            order=i % 3,
+        )
+    queryset = Category.objects.order_by("-parent", "order")
+
+    pages = []
+    names, data = paginate(queryset, size=3, count="true")
+    assert data["count"] == 9
+    assert data["previous"] is None
+    while True:
+        pages.append(names)
+        if not data["next"]:
+            break
+        names, data = paginate(queryset, data["next"])
+
+    assert [len(page) for page in pages] == [3, 3, 3]
+    names = [name for page in pages for name in page]
+    assert names[:2] == ["root 0", "root 1"]
+    assert sorted(names) == sorted(Category.objects.values_list("name", flat=True))
+
+    previous_pages = []
+    while data["previous"]:
+        names, data = paginate(queryset, data["previous"])
+        previous_pages.insert(0, names)
+    assert previous_pages == pages[:-1]
+
+    with pytest.raises(NotFound):
+        paginate(queryset, cursor="tampered")
+
+
+@pytest.mark.django_db
+def test_estimated_count_paginator(locmem_cache, monkeypatch):
+    """Test small tables are counted exactly, large ones use the estimate."""
+    for i in range(5):
+        Category.objects.create(name=f"category {i}", slug=f"category-{i}")
+    queryset = Category.objects.order_by("pk")
+
+    paginator = EstimatedCountPaginator(queryset, 2)
+    assert (paginator.count, paginator.is_count_approximate) == (5, False)
+    Category.objects.create(name="category 5", slug="category-5")
+    # the new row spills onto a fourth page right away
+    paginator = EstimatedCountPaginator(queryset, 2)
+    assert paginator.count == 6
+    assert len(paginator.page(3)) == 2
+
+    if connection.vendor == "postgresql":
+        sql, params = queryset.query.sql_with_params()
+        assert isinstance(pagination.estimate_count(queryset, sql, params), int)
+
+    def fail(*args):
+        raise AssertionError
+
+    # below the threshold the planner is not asked
+    monkeypatch.setattr(pagination, "get_table_rows", lambda queryset: 500)
+    monkeypatch.setattr(pagination, "estimate_count", fail)
+    assert pagination.get_count(queryset.filter(pk__gt=0)) == (6, False)
+
+    monkeypatch.setattr(pagination, "get_table_rows", lambda queryset: 30_000)
+    assert pagination.get_count(queryset) == (30_000, True)
+
+    monkeypatch.setattr(pagination, "estimate_count", lambda *args: 20_000)
+    paginator = EstimatedCountPaginator(queryset.filter(pk__gt=0), 2)
+    assert (paginator.count, paginator.is_count_approximate) == (20_000, True)
+    assert paginator.page(2).has_next()
+    # only the pages known to exist are linked
+    assert paginator.num_pages == 3
+    with pytest.raises(EmptyPage):
+        paginator.page(4)
+    # the last page makes the count exact
+    page = paginator.page(3)
+    assert len(page) == 2
+    assert not page.has_next()
+    assert (paginator.count, paginator.is_count_approximate) == (6, False)
+    assert paginator.num_pages == 3
+
+
+@pytest.mark.django_db
+def test_approximate_count_has_no_total_pages(monkeypatch):
+    """Test the estimated pages are not given as `total_pages`."""
+    for i in range(5):
+        Category.objects.create(name=f"category {i}", slug=f"category-{i}")
+    monkeypatch.setattr(pagination, "get_table_rows", lambda queryset: 30_000)
+    queryset = Category.objects.order_by("pk")
+
+    def get_page(**params):
+        request = Request(APIRequestFactory().get("/categories/", params))
+        paginator = pagination.StandardResultsSetPagination()
+        paginator.paginate_queryset(queryset, request)
+        return paginator.get_paginated_response([]).data
+
+    data = get_page(page_size=2)
+    assert (data["count"], data["count_is_approximate"]) == (30_000, True)
+    assert data["total_pages"] is None
+    assert data["next"]
+    data = get_page(page_size=2, page=3)
+    assert (data["count"], data["count_is_approximate"]) == (5, False)
+    assert (data["total_pages"], data["next"]) == (3, None)
+    with pytest.raises(NotFound):
+        get_page(page_size=2, page=4)
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    sort_order = serializers.IntegerField(source="order")
+
+    class Meta:
+        model = Category
+        fields = ["name", "sort_order"]
+
+
+class CategoryListView(ConsistentListMixin, generics.ListAPIView):
+    queryset = Category.objects.order_by("order")
+    serializer_class = CategorySerializer
+    pagination_class = None
+    filter_backends = []
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    list_chunk_size = 2
+    list_max_rows = 3
+
+
+@pytest.mark.django_db
+def test_consistent_list_streams_without_pagination(caplog):
+    """Test the unpaginated list is streamed in chunks and flagged when capped."""
+    for i in range(5):
+        Category.objects.create(name=f"category {i}", slug=f"category-{i}", order=i)
+
+    response = CategoryListView.as_view()(APIRequestFactory().get("/categories/"))
+
+    assert response.status_code == 200
+    assert response.streaming
+    assert json.loads(b"".join(response.streaming_content)) == {
+        "results": [{"name": f"category {i}", "sortOrder": i} for i in range(3)],
+        "next": None,
+        "previous": None,
+        "count": 3,
+        "page": 1,
+        "pageSize": 3,
+        "totalPages": 1,
+        "truncated": True,
+    }
+    assert "truncated to 3 rows" in caplog.text
+
+    Category.objects.filter(order__gte=3).delete()
+    response = CategoryListView.as_view()(APIRequestFactory().get("/categories/"))
+    content = json.loads(b"".join(response.streaming_content))
+    assert (content["count"], content["truncated"]) == (3, False)
+
+
+@pytest.mark.django_db
+def test_consistent_list_fails_before_streaming(monkeypatch):
+    """Test an error in the first chunk is raised before the response starts."""
+    Category.objects.create(name="category", slug="category")
+
+    def fail(*args, **kwargs):
+        raise RuntimeError
+
+    monkeypatch.setattr(CategorySerializer, "to_representation", fail)
+    with pytest.raises(RuntimeError):
+        CategoryListView.as_view()(APIRequestFactory().get("/categories/"))
+
+
+@pytest.mark.unit
+def test_casing_matches_djangorestframework_camel_case():
+    """Test the memoized translations match the library and skip the ignored keys."""
+    payload = {
+        "first_name": "a",
+        "results": [{"user_id": 1, "field_2": [{"is_active": True}]}],
+        "extra_data": {"raw_key": 1},
+        1: ("tuple_value",),
+    }
+    options = {"ignore_fields": ["extra_data"], "ignore_keys": ["keep_me"]}
+    payload["keep_me"] = {"inner_key": 1}
+    assert camelize(payload, **options) == camel_case_util.camelize(payload, **options)
+
+    camel_payload = camelize(payload)
+    for options in [{}, {"no_underscore_before_number": True}]:
+        assert underscoreize(camel_payload, **options) == (
+            camel_case_util.underscoreize(camel_payload, **options)
+        )
+
+    nested = {"child_node": None}
+    for _ in range(5000):
+        nested = {"child_node": nested}
+    nested = camelize(nested)
+    depth = 0
+    while nested is not None:
+        nested = nested["childNode"]
+        depth += 1
+    assert depth == 5001
+
+
+@pytest.mark.unit
+def test_camel_case_orjson_renderer_and_parser():
+    """Test the orjson renderer writes what the camel case renderer does."""
+    data = {
+        "user_id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "created_at": datetime.datetime(
+            2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.UTC
+        ),
+        "birth_date": datetime.date(2024, 1, 2),
+        "unit_price": Decimal("1.50"),
+        "label_text": gettext_lazy("Name"),
+        "line_separator": "\u2028",
+        "nested_rows": [{"is_active": True, "empty_value": None}],
+    }
+    content = CamelCaseORJSONRenderer().render(data)
+    assert content == CamelCaseJSONRenderer().render(data)
+    assert json.loads(content)["createdAt"] == "2024-01-02T03:04:05.678901Z"
+
+    parsed = CamelCaseORJSONParser().parse(io.BytesIO(content))
+    assert parsed["nested_rows"] == [{"is_active": True, "empty_value": None}]
+    with pytest.raises(ParseError):
+        CamelCaseORJSONParser().parse(io.BytesIO(b"{"))
+
+
+@pytest.mark.unit
+def test_sorting_index_check_resolves_fields():
+    """Test the indexes found for the sort keys, through relations too."""
+    assert has_index(*resolve_field(Category, "name"))
+    assert has_index(*resolve_field(Category, "parent"))
+    assert has_index(*resolve_field(Category, "parent__pk"))
+    assert not has_index(*resolve_field(Category, "description"))
+    assert not has_index(*resolve_field(Category, "parent__description"))
+    assert resolve_field(Category, "name__missing") is None
+
+
+class CategoryFilterView(generics.ListAPIView):
+    queryset = Category.objects.order_by("order")
+    serializer_class = CategorySerializer
+    pagination_class = None
+    filter_backends = [CustomDjangoFilterBackend]
+    filterset_fields = {"is_active": ["exact"], "order": ["gte", "lte"]}
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+
+@pytest.mark.django_db
+def test_camel_case_filters(monkeypatch):
+    """Test the camelCase filters over requests, the filterset is built once."""
+    for i in range(5):
+        Category.objects.create(
+            name=f"category {i}", slug=f"category-{i}", order=i, is_active=i % 2 == 0
+        )
+    monkeypatch.setattr(CustomDjangoFilterBackend, "filtersets", {})
+    built = []
+    get_filterset_class = filters.DjangoFilterBackend.get_filterset_class
+
+    def counting_get_filterset_class(self, view, queryset=None):
+        built.append(type(view))
+        return get_filterset_class(self, view, queryset)
+
+    monkeypatch.setattr(
+        filters.DjangoFilterBackend,
+        "get_filterset_class",
+        counting_get_filterset_class,
+    )
+
+    def names(**params):
+        request = APIRequestFactory().get("/categories/", params)
+        response = CategoryFilterView.as_view()(request)
+        assert response.status_code == 200
+        return [row["name"] for row in response.data]
+
+    for _ in range(3):
+        assert names(**{"isActive": "true", "order:gte": "1"}) == [
+            "category 2",
+            "category 4",
+        ]
+    # the snake_case names are still accepted
+    assert names(**{"is_active": "false", "order:lte": "2"}) == ["category 1"]
+    assert names() == [f"category {i}" for i in range(5)]
+    assert built == [CategoryFilterView]
+
+
+class CategorySortView(generics.ListAPIView):
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+    pagination_class = None
+    filter_backends = [SortingFilter]
+    sorting_fields = {"sort_order": "order", "name": "name"}
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+
+@pytest.mark.django_db
+def test_sorting_filter_adds_pk_tiebreaker():
+    """Test the rows with the same sort value are ordered by pk, in the same direction."""
+    for name, order in [("b", 1), ("c", 0), ("a", 1), ("d", 0)]:
+        Category.objects.create(name=name, slug=name, order=order)
+
+    def names(sort):
+        request = APIRequestFactory().get("/categories/", {"sort": sort})
+        response = CategorySortView.as_view()(request)
+        assert response.status_code == 200
+        return [row["name"] for row in response.data]
+
+    assert names("sortOrder") == ["c", "d", "b", "a"]
+    assert names("sortOrder:desc") == ["a", "b", "d", "c"]
+    assert names("name:desc") == ["d", "c", "b", "a"]
+    request = APIRequestFactory().get("/categories/", {"sort": "description"})
+    assert CategorySortView.as_view()(request).status_code == 400
+
+
+@pytest.mark.django_db
+def test_search_filter_ranks_matches():
+    """Test every term matches a field, exact and prefix matches rank first."""
+    for name, description in [
+        ("garden tools", "spades"),
+        ("tools", "hammers and saws"),
+        ("power tools", "drills and saws"),
+        ("kitchen", "pots"),
+    ]:
+        Category.objects.create(
+            name=name, slug=name.replace(" ", "-"), description=description
+        )
+
+    class CategoryView:
+        search_fields = ("name", "@description")
+
+    def search(**params):
+        request = Request(APIRequestFactory().get("/categories/", params))
+        queryset = CustomSearchFilter().filter_queryset(
+            request, Category.objects.all(), CategoryView()
+        )
+        return list(queryset.values_list("name", flat=True))
+
+    assert search(search="tools")[0] == "tools"
+    assert sorted(search(search="tools saws")) == ["power tools", "tools"]
+    assert search(search="pots") == ["kitchen"]
+    assert search(search="tools", sort="name") == sorted(search(search="tools"))
+
+
+@pytest.mark.django_db
+def test_search_filter_breaks_ties_by_model_ordering():
+    """Test the matches of the same rank follow the ordering of the model."""
+    for name, order in [("old tools", 2), ("new tools", 0), ("used tools", 1)]:
+        Category.objects.create(name=name, slug=name.replace(" ", "-"), order=order)
+
+    class CategoryView:
+        search_fields = ("name",)
+
+    queryset = CustomSearchFilter().filter_queryset(
+        Request(APIRequestFactory().get("/categories/", {"search": "tools"})),
+        Category.objects.all(),
+        CategoryView(),
+    )
+    assert list(queryset.values_list("name", flat=True)) == [
+        "new tools",
+        "used tools",
+        "old tools",
+    ]
+
+
+@pytest.mark.django_db
+def test_search_filter_with_cursor_pagination():
+    """Test the ranked search results are paged by rank, then the view ordering."""
+    for name in ["tools", "tools kit", "power tools", "garden tools", "toolshed"]:
+        Category.objects.create(name=name, slug=name.replace(" ", "-"))
+
+    class CategoryView:
+        search_fields = ("name",)
+
+    queryset = CustomSearchFilter().filter_queryset(
+        Request(APIRequestFactory().get("/categories/", {"search": "tools"})),
+        Category.objects.order_by("-name", "pk"),
+        CategoryView(),
+    )
+    names, data = paginate(queryset, size=2)
+    pages = [names]
+    while data["next"]:
+        names, data = paginate(queryset, data["next"])
+        pages.append(names)
+
+    # the exact match, the prefix matches, then the others, each by -name
+    assert pages == [
+        ["tools", "toolshed"],
+        ["tools kit", "power tools"],
+        ["garden tools"],
+    ]
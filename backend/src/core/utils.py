@@ -3,64 +3,88 @@ from __future__ import annotations
 import contextlib
 import csv
 import datetime
+import gzip
+import io
 import logging
 import os
+import re
 import shutil
-import subprocess
 import tempfile
 import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
-from functools import wraps
-from itertools import zip_longest
+from decimal import Decimal
+from functools import lru_cache, wraps
+from itertools import islice, zip_longest
+from operator import attrgetter, itemgetter
 from pathlib import Path
 from re import sub
-from typing import TYPE_CHECKING, Self
+from typing import IO, TYPE_CHECKING, ClassVar, Literal, NotRequired, Self, TypedDict
 
 import boto3
+import orjson
 import psutil
 from django.core import serializers
-from django.db import transaction
+from django.core.exceptions import (
+    FieldDoesNotExist,
+    ImproperlyConfigured,
+    ValidationError,
+)
+from django.db import connections, models, router, transaction
+from django.db.models.query import (
+    FlatValuesListIterable,
+    ModelIterable,
+    ValuesIterable,
+)
 from django.db.utils import IntegrityError
 from django.utils import timezone
+from django.utils.duration import duration_iso_string
 
 from core.storages import FileStorage
 
+from .archives import ZipArchiver
+from .casing import translate_keys
 from .config import settings
 from .exceptions import ExceededMaximumRetryAttemptsError
+from .locks import get_lock
 
 if TYPE_CHECKING:
-    import uuid
     from collections.abc import Callable, Generator, Iterable
     from types import TracebackType
     from typing import Any, Self
 
+    import polars as pl
+    import pyarrow as pa
+    import pyarrow.parquet as pq
     from django.core.files.storage import Storage
-    from django.db import models
+    from django.db.backends.utils import CursorWrapper
     from rest_framework import serializers
 
 logger = logging.getLogger("default")
 
 
+SEPARATORS_RE = re.compile(r"([_-])+")
+DIGITS_RE = re.compile(r"(\d)+")
+UPPERCASE_RE = re.compile(r"([A-Z])+")
+
+
+@lru_cache(maxsize=settings.CASE_KEY_CACHE_SIZE)
 def camel_case(string: str) -> str:
-    string = sub(r"([_-])+", " ", string).title().replace(" ", "")
+    string = SEPARATORS_RE.sub(" ", string).title().replace(" ", "")
     return "".join([string[0].lower(), string[1:]])
 
 
+@lru_cache(maxsize=settings.CASE_KEY_CACHE_SIZE)
 def snake_case(string: str) -> str:
-    string = sub(r"(\d)+", r"_\1", string)
-    string = sub(r"([A-Z])+", r"_\1", string).lower()
-    return sub(r"([_-])+", "_", string)
+    string = DIGITS_RE.sub(r"_\1", string)
+    string = UPPERCASE_RE.sub(r"_\1", string).lower()
+    return SEPARATORS_RE.sub("_", string)
 
 
 def make_key_snake_case_recursive(item: dict | list | object) -> dict | list:
-    if isinstance(item, dict):
-        return {
-            snake_case(k): make_key_snake_case_recursive(v) for k, v in item.items()
-        }
-    if isinstance(item, list):
-        return [make_key_snake_case_recursive(i) for i in item]
-
-    return item
+    return translate_keys(item, snake_case)
 
 
 @contextmanager
@@ -75,7 +99,7 @@ def create_temp_folder_and_upload_to_s3(
     temp_folder = tempfile.mkdtemp()
     msg = f"\no - Created temp folder: {temp_folder}"
     logger.info(msg)
-    fs = FileStorage(settings.FILESTORE_BACKEND, bucket_name=bucket_name)
+    fs = FileStorage(settings.FILESTORE_BACKEND, bucket_name)
     try:
         yield temp_folder
         # upload everything in tmp folder to s3_path
@@ -101,41 +125,98 @@ def create_temp_folder_and_upload_to_s3(
 
 
 def batched(data: Iterable, batch_size: int) -> Generator[list, None, None]:
-    for i in range(0, len(data), batch_size):
-        yield data[i : i + batch_size]
+    """
+    Split any iterable into lists of `batch_size` items, without materializing it.
+    Use `batched_queryset` to stream a large queryset with bounded memory.
+    """
+    if isinstance(data, models.QuerySet):
+        # do not fill the queryset result cache
+        data = data.iterator(chunk_size=batch_size)
+
+    iterator = iter(data)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def _get_keyset_getter(queryset: models.QuerySet, key: str) -> Callable[[Any], Any]:
+    iterable_class = queryset._iterable_class  # noqa: SLF001
+    if issubclass(iterable_class, ModelIterable):
+        return attrgetter(queryset.model._meta.get_field(key).attname)
+    if issubclass(iterable_class, ValuesIterable):
+        return itemgetter(key)
+    if issubclass(iterable_class, FlatValuesListIterable):
+        return lambda value: value
+
+    fields = list(queryset._fields)  # noqa: SLF001
+    if key not in fields:
+        msg = f"values_list() must include the keyset field {key!r}"
+        raise ValueError(msg)
+    return itemgetter(fields.index(key))
+
+
+def batched_queryset(
+    queryset: models.QuerySet,
+    batch_size: int = settings.BATCH_SIZE,
+    key: str = "pk",
+) -> Generator[list, None, None]:
+    """
+    Stream a queryset in batches with keyset pagination,
+    each batch is one `WHERE key > last_key ORDER BY key LIMIT batch_size` query.
+
+    Works with model, `values()` and `values_list()` querysets,
+    `key` must be unique and not null, the queryset ordering is replaced by it.
+    ```
+    for batch in batched_queryset(Order.objects.values_list("id", "amount")):
+        writer.write_batch(batch)
+    ```
+    """
+    if key == "pk":
+        key = queryset.model._meta.pk.name
+
+    queryset = queryset.order_by(key)
+    get_key = _get_keyset_getter(queryset, key)
+    last_key = None
+    while True:
+        page = queryset
+        if last_key is not None:
+            page = queryset.filter(**{f"{key}__gt": last_key})
+
+        batch = list(page[:batch_size])
+        if batch:
+            yield batch
+        if len(batch) < batch_size:
+            return
+        last_key = get_key(batch[-1])
 
 
 def compress_files(
     zip_file_name: str,
     files_to_compress: list[str],
     password: str | None = None,
+    encryption: Literal["zipcrypto", "aes"] = "zipcrypto",
 ) -> int:
     """
-    If OS is Windows, bypass the compress.
-    Password is only supported on Linux.
+    Compress the files into a zip file, the files are removed afterwards.
+    Password protected archives use ZipCrypto through the `zip` command like
+    before, `encryption="aes"` switches to WinZip AES, which requires the
+    optional pyzipper package and can not be opened by Windows Explorer.
     Returns
     -------
         filesize of the zip file: int
     """
-    files_to_compress_str = " ".join(
-        [str(filename) for filename in files_to_compress],
-    )
-    if os.name == "nt":
-        logger.warning("Windows OS, bypass the compress.")
-        return 0
-    password_param = f"-P {password}" if password else ""
-    subprocess.run(  # noqa: S602
-        f"zip {password_param} "  # password
-        f'-r "{zip_file_name}" '  # zip file name
-        f"{files_to_compress_str} "  # include files
-        "-j",  # junk the path, do not make directory structure
-        shell=True,
-        check=True,
-    )
+    with (
+        Path(zip_file_name).open("wb") as f,
+        ZipArchiver(f, password=password, encryption=encryption) as archiver,
+    ):
+        # junk the path, do not make directory structure
+        archiver.add_files(files_to_compress)
+    msg = f"{zip_file_name}: {archiver.get_stats_message()}"
+    logger.info(msg)
+
     for file_to_compress in files_to_compress:
         Path(file_to_compress).unlink()
 
-    return Path(zip_file_name).stat().st_size
+    return archiver.bytes_out
 
 
 def get_current_date_dict() -> dict[str, int]:
@@ -194,9 +275,9 @@ def flush_stage_cache(
         return True
 
 
-class BatchCSVWriter:
+class BaseBatchWriter(ABC):
     """
-    A CSV writer which will write rows to CSV file "by batch".
+    Shared lifecycle of the batch writers: batch numbering, file naming and the OK file.
     """
 
     def __init__(  # noqa: PLR0913
@@ -204,17 +285,13 @@ class BatchCSVWriter:
         folder: str,
         filename_format: str,
         headers: list | None = None,
-        delimiter: str = ",",
-        file_limit_bytes: int | None = settings.MAX_FILE_SIZE_BYTES,
         ok_file_name: str | None = None,
         ok_file_content: str = "",
     ) -> None:
         """
         Arguments:
-            - file_limit_bytes:
-                setting file_limit_bytes to 0 will only write everything into one file with no limit.
             - ok_file_name:
-                if specified, the ok file will be created after all the csv files are uploaded.
+                if specified, the ok file will be created after all the files are written.
                 format variables: batch_number
             - ok_file_content:
                 the content of the ok file, if not specified, the content will be blank.
@@ -222,23 +299,16 @@ class BatchCSVWriter:
                 format variables: batch_number
         """
         self.batch_number = 0
-        self.writer = None
-        self.csv_file = None
         self.folder = folder
-        # if specified, the first row of the csv file will be the headers
+        # if specified, the headers are used as the column names
         self.headers = headers
 
         # filename format must have {batch_number} placeholders
         self.filename_format = filename_format
-        self.delimiter = delimiter
-        self.file_limit_bytes = file_limit_bytes
 
         self.ok_file_name = ok_file_name
         self.ok_file_content = ok_file_content or ""
 
-    def write_no_data_row(self: Self, no_data_mark: str = "N/A") -> None:
-        self.write([no_data_mark] * len(self.headers))
-
     def get_ok_file_context(self: Self) -> dict:
         return {
             "batch_number": self.batch_number,
@@ -264,53 +334,342 @@ class BatchCSVWriter:
             with ok_file_path.open("w") as f:
                 f.write(ok_file_content)
 
+    def get_file_path(self: Self) -> Path:
+        file_name = self.filename_format.format(
+            batch_number=self.batch_number,
+        )
+        return Path(self.folder) / file_name
+
+    @abstractmethod
+    def open_new_file(
+        self: Self,
+        columns: list[str] | None = None,
+        filename_format: str | None = None,
+    ) -> None: ...
+
+    @abstractmethod
+    def write_batch(
+        self: Self,
+        chunk: Any,
+    ) -> None: ...
+
+    def write_queryset(
+        self: Self,
+        queryset: models.QuerySet,
+        batch_size: int = settings.BATCH_SIZE,
+        key: str = "pk",
+    ) -> None:
+        """Stream the queryset into the files, see `batched_queryset`."""
+        for batch in batched_queryset(queryset, batch_size, key):
+            self.write_batch(batch)
+
+    @abstractmethod
+    def close(
+        self: Self,
+    ) -> None: ...
+
+    def __enter__(
+        self: Self,
+    ) -> Self:
+        self.open_new_file()
+        return self
+
+    def __exit__(
+        self: Self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> bool | None:
+        self.close()
+        self.write_ok_file()
+
+
+class ByteCountingFile:
+    """
+    Wrap a text file and count the bytes written through it,
+    so the file size is known exactly without flushing or calling stat().
+    """
+
+    def __init__(self: Self, file: IO[str], encoding: str = "utf-8") -> None:
+        self.file = file
+        self.encoding = encoding
+        self.bytes_written = 0
+
+    @property
+    def name(self: Self) -> str:
+        return self.file.name
+
+    def write(self: Self, text: str) -> int:
+        # most exported text is ascii, which can skip the encoding
+        if text.isascii():
+            self.bytes_written += len(text)
+        else:
+            self.bytes_written += len(text.encode(self.encoding))
+        return self.file.write(text)
+
+    def close(self: Self) -> None:
+        self.file.close()
+
+
+class _TextSink:
+    """
+    A stable write target for csv.writer, the batch writer swaps the file behind it.
+    """
+
+    def __init__(self: Self, write: Callable[[str], Any]) -> None:
+        self.write = write
+
+
+class BatchCSVWriter(BaseBatchWriter):
+    """
+    A CSV writer which will write rows to CSV file "by batch".
+
+    Rows are buffered and written with `writerows` in blocks of `buffer_rows`,
+    the file size is tracked by counting the bytes written.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: Self,
+        folder: str,
+        filename_format: str,
+        headers: list | None = None,
+        delimiter: str = ",",
+        file_limit_bytes: int | None = settings.MAX_FILE_SIZE_BYTES,
+        ok_file_name: str | None = None,
+        ok_file_content: str = "",
+        buffer_rows: int = 1000,
+        encoding: str = "utf-8",
+    ) -> None:
+        """
+        Arguments:
+            - file_limit_bytes:
+                setting file_limit_bytes to 0 will only write everything into one file with no limit.
+            - ok_file_name:
+                if specified, the ok file will be created after all the csv files are uploaded.
+                format variables: batch_number
+            - ok_file_content:
+                the content of the ok file, if not specified, the content will be blank.
+                or override the get_ok_file_content method to customize the content.
+                format variables: batch_number
+            - buffer_rows:
+                number of rows buffered before they are written with `writerows`.
+        """
+        super().__init__(
+            folder,
+            filename_format,
+            headers=headers,
+            ok_file_name=ok_file_name,
+            ok_file_content=ok_file_content,
+        )
+        self.csv_file: ByteCountingFile | None = None
+        self.delimiter = delimiter
+        self.file_limit_bytes = file_limit_bytes
+        self.buffer_rows = buffer_rows
+        self.encoding = encoding
+        self.rows: list = []
+        self.writer = csv.writer(_TextSink(self.write_text), delimiter=delimiter)
+
+    def write_no_data_row(self: Self, no_data_mark: str = "N/A") -> None:
+        self.write([no_data_mark] * len(self.headers))
+
+    def open_file(self: Self, path: Path) -> IO[str]:
+        return path.open(
+            "w",
+            newline="",
+            encoding=self.encoding,
+            buffering=io.DEFAULT_BUFFER_SIZE * 128,
+        )
+
     def open_new_file(
         self: Self,
         columns: list[str] | None = None,
         filename_format: str | None = None,
-    ) -> tuple[csv.writer, str]:
+    ) -> None:
         if filename_format:
             self.filename_format = filename_format
 
         if columns:
             self.headers = columns
 
-        file_name = self.filename_format.format(
-            batch_number=self.batch_number,
+        self.csv_file = ByteCountingFile(
+            self.open_file(self.get_file_path()),
+            self.encoding,
         )
-        file_full_path = Path(self.folder) / file_name
-        csv_file = Path(file_full_path).open("w")  # noqa: SIM115
-        writer = csv.writer(csv_file, delimiter=self.delimiter)
         if self.headers:
-            writer.writerow(self.headers)
-        self.writer = writer
-        self.csv_file = csv_file
+            # write the headers directly, the rollover check only applies to rows
+            csv.writer(self.csv_file, delimiter=self.delimiter).writerow(self.headers)
 
-    def write(
-        self: Self,
-        row: list,
-    ) -> None:
-        self.writer.writerow(row)
+    def write_text(self: Self, text: str) -> None:
+        self.csv_file.write(text)
 
         # 檢查目前檔案大小是否超過上傳上限
         if (
             self.file_limit_bytes
-            and get_file_size(self.csv_file.name) >= self.file_limit_bytes
+            and self.csv_file.bytes_written >= self.file_limit_bytes
         ):
             self.batch_number += 1
-            self.csv_file.close()
+            self.close_file()
             self.open_new_file()
 
-    def close(
+    def write(
+        self: Self,
+        row: list,
+    ) -> None:
+        self.rows.append(row)
+        if len(self.rows) >= self.buffer_rows:
+            self.flush()
+
+    def write_batch(
+        self: Self,
+        chunk: Iterable[list],
+    ) -> None:
+        self.rows.extend(chunk)
+        if len(self.rows) >= self.buffer_rows:
+            self.flush()
+
+    def flush(
+        self: Self,
+    ) -> None:
+        # csv.writer writes row by row, so the rollover still happens on the exact row
+        rows, self.rows = self.rows, []
+        self.writer.writerows(rows)
+
+    def close_file(
         self: Self,
     ) -> None:
         self.csv_file.close()
 
-    def __enter__(
+    def close(
         self: Self,
-    ) -> Self:
-        self.open_new_file()
-        return self
+    ) -> None:
+        self.flush()
+        self.close_file()
+
+
+class StreamingBatchCSVWriter(BatchCSVWriter):
+    """
+    A BatchCSVWriter which compresses the part files while writing them,
+    and uploads every finished part in the background as soon as it rolls over.
+
+    The ok file is written and uploaded only after all the parts are uploaded.
+    ```
+    with StreamingBatchCSVWriter(
+        folder, "orders_{batch_number}.csv", "bucket", ["exports/orders"],
+        headers=headers, compression="gzip", ok_file_name="orders.ok",
+    ) as writer:
+        for row in rows:
+            writer.write(row)
+    ```
+    """
+
+    compression_suffixes: ClassVar[dict[str, str]] = {
+        "gzip": ".gz",
+        "zstd": ".zst",
+    }
+
+    def __init__(  # noqa: PLR0913
+        self: Self,
+        folder: str,
+        filename_format: str,
+        bucket_name: str,
+        s3_paths: list[str],
+        *args: Any,
+        compression: str | None = "gzip",
+        compress_level: int | None = None,
+        max_upload_workers: int = 4,
+        delete_uploaded_files: bool = True,
+        storage: FileStorage | None = None,
+        **kwargs: Any,
+    ) -> None:
+        """
+        Arguments:
+            - s3_paths:
+                every finished part file is uploaded to each of the paths.
+            - compression:
+                gzip, zstd or None, file_limit_bytes applies to the uncompressed size.
+            - max_upload_workers:
+                number of part files uploaded concurrently.
+            - delete_uploaded_files:
+                delete the local part file once it is uploaded.
+        """
+        super().__init__(folder, filename_format, *args, **kwargs)
+        if compression and compression not in self.compression_suffixes:
+            msg = f"Unsupported compression: {compression}"
+            raise ValueError(msg)
+
+        self.s3_paths = s3_paths
+        self.compression = compression
+        self.compress_level = compress_level
+        self.delete_uploaded_files = delete_uploaded_files
+        self.storage = storage or FileStorage(settings.FILESTORE_BACKEND, bucket_name)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_upload_workers,
+            thread_name_prefix="csv-upload",
+        )
+        self.uploads: list[Future] = []
+        self.file_path: Path | None = None
+
+    def get_file_path(self: Self) -> Path:
+        path = super().get_file_path()
+        if self.compression:
+            return path.with_name(
+                path.name + self.compression_suffixes[self.compression]
+            )
+        return path
+
+    def open_file(self: Self, path: Path) -> IO[str]:
+        self.file_path = path
+        if self.compression == "gzip":
+            return gzip.open(
+                path,
+                "wt",
+                compresslevel=self.compress_level or 6,
+                encoding=self.encoding,
+                newline="",
+            )
+        if self.compression == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                msg = "zstd compression requires the zstandard package"
+                raise ImproperlyConfigured(msg) from e
+
+            return zstandard.open(
+                path,
+                "wt",
+                cctx=zstandard.ZstdCompressor(level=self.compress_level or 3),
+                encoding=self.encoding,
+                newline="",
+            )
+        return super().open_file(path)
+
+    def upload(self: Self, path: Path) -> None:
+        for s3_path in self.s3_paths:
+            msg = f"  o - Uploading {path.name} to {s3_path}"
+            logger.info(msg)
+            self.storage.upload_file(str(path), str(Path(s3_path) / path.name))
+
+        if self.delete_uploaded_files:
+            path.unlink()
+
+    def close_file(
+        self: Self,
+    ) -> None:
+        super().close_file()
+        self.uploads.append(self.executor.submit(self.upload, self.file_path))
+
+    def wait_for_uploads(self: Self) -> None:
+        """Wait for all the uploads, raise the first upload error if any."""
+        try:
+            for future in self.uploads:
+                future.result()
+        finally:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def write_ok_file(self: Self) -> None:
+        super().write_ok_file()
+        if self.ok_file_name:
+            self.upload(Path(self.folder) / self.get_ok_file_name())
 
     def __exit__(
         self: Self,
@@ -318,8 +677,204 @@ class BatchCSVWriter:
         exc: BaseException | None,
         traceback: TracebackType | None,
     ) -> bool | None:
+        if exc is not None:
+            # do not publish a partial export, and do not wait for pending uploads
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.csv_file.close()
+            return None
+
         self.close()
+        self.wait_for_uploads()
         self.write_ok_file()
+        return None
+
+
+class BatchParquetWriter(BaseBatchWriter):
+    """
+    A Parquet writer which will write columnar chunks to Parquet files "by batch".
+
+    Each chunk is streamed to the open file as compressed row groups of at most
+    `row_group_size` rows, a new file is started every `file_limit_rows` rows.
+    Only the current chunk is held in memory.
+    ```
+    with BatchParquetWriter(folder, "orders_{batch_number}.parquet", headers) as writer:
+        writer.write_queryset(queryset.values_list(*headers))
+    ```
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: Self,
+        folder: str,
+        filename_format: str,
+        headers: list | None = None,
+        file_limit_rows: int | None = 1_000_000,
+        row_group_size: int = 100_000,
+        compression: str = "zstd",
+        ok_file_name: str | None = None,
+        ok_file_content: str = "",
+        schema: dict | None = None,
+    ) -> None:
+        """
+        Arguments:
+            - file_limit_rows:
+                setting file_limit_rows to 0 will only write everything into one file with no limit.
+            - schema:
+                polars dtypes by column, the types of the first chunk are used otherwise,
+                e.g. `{"closed_at": pl.Datetime}` for a column which may be all null.
+            - row_group_size:
+                maximum number of rows per parquet row group.
+            - compression:
+                parquet compression codec, e.g. zstd, snappy, gzip, lz4 or none.
+        """
+        super().__init__(
+            folder,
+            filename_format,
+            headers=headers or (list(schema) if schema else None),
+            ok_file_name=ok_file_name,
+            ok_file_content=ok_file_content,
+        )
+        self.schema = schema
+        self.file_limit_rows = file_limit_rows
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.writer: pq.ParquetWriter | None = None
+        self.rows_in_file = 0
+        self.files_written = 0
+
+    def to_frame(self: Self, chunk: Any) -> pl.DataFrame:
+        """
+        Convert a chunk into a polars DataFrame.
+
+        Accepts polars DataFrames, Arrow record batches and tables, list of dicts,
+        list of model instances (the headers, or else the concrete fields, are
+        used as the columns) and list of rows (the headers are used as the column names).
+        """
+        import polars as pl
+
+        if isinstance(chunk, pl.DataFrame):
+            frame = chunk
+        elif hasattr(chunk, "schema") and hasattr(chunk, "num_rows"):
+            # pyarrow.RecordBatch / pyarrow.Table
+            frame = pl.from_arrow(chunk)
+        else:
+            rows = list(chunk)
+            if rows and isinstance(rows[0], dict):
+                frame = pl.DataFrame(rows, infer_schema_length=None)
+            else:
+                if rows and isinstance(rows[0], models.Model):
+                    rows = self.get_instance_rows(rows)
+                frame = pl.DataFrame(
+                    rows,
+                    schema=self.headers,
+                    orient="row",
+                    infer_schema_length=None,
+                )
+
+        if self.schema:
+            frame = frame.cast(
+                {name: dtype for name, dtype in self.schema.items() if name in frame}
+            )
+        return frame
+
+    def get_instance_rows(self: Self, instances: list[models.Model]) -> list[tuple]:
+        """The values of the headers of each instance, foreign keys by their id."""
+        opts = instances[0]._meta
+        if not self.headers:
+            self.headers = [field.attname for field in opts.concrete_fields]
+
+        attnames = []
+        for name in self.headers:
+            try:
+                attnames.append(opts.get_field(name).attname)
+            except (FieldDoesNotExist, AttributeError):
+                # an annotation or a property
+                attnames.append(name)
+        get_values = attrgetter(*attnames)
+        if len(attnames) == 1:
+            return [(get_values(instance),) for instance in instances]
+        return [get_values(instance) for instance in instances]
+
+    def open_new_file(
+        self: Self,
+        columns: list[str] | None = None,
+        filename_format: str | None = None,
+    ) -> None:
+        """Finish the current file, the next rows go to a new file."""
+        self.close_file()
+        if filename_format:
+            self.filename_format = filename_format
+
+        if columns:
+            self.headers = columns
+
+    def open_writer(self: Self, schema: pa.Schema) -> None:
+        import pyarrow.parquet as pq
+
+        # roll over lazily so batch_number always points at the last written file
+        if self.files_written:
+            self.batch_number += 1
+        self.writer = pq.ParquetWriter(
+            self.get_file_path(),
+            schema,
+            compression=self.compression,
+            write_statistics=True,
+        )
+        self.rows_in_file = 0
+        self.files_written += 1
+
+    def close_file(self: Self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def write_batch(
+        self: Self,
+        chunk: Any,
+    ) -> None:
+        frame = self.to_frame(chunk)
+        if frame.is_empty():
+            return
+
+        table = frame.to_arrow()
+        while table.num_rows:
+            if self.writer is None:
+                self.open_writer(table.schema)
+            elif table.schema != self.writer.schema:
+                table = self.cast_table(table)
+
+            rows = table.num_rows
+            if self.file_limit_rows:
+                rows = min(rows, self.file_limit_rows - self.rows_in_file)
+            self.writer.write_table(table.slice(0, rows), self.row_group_size)
+            self.rows_in_file += rows
+            table = table.slice(rows)
+
+            if self.file_limit_rows and self.rows_in_file >= self.file_limit_rows:
+                self.close_file()
+
+    def cast_table(self: Self, table: pa.Table) -> pa.Table:
+        import pyarrow as pa
+
+        try:
+            return table.cast(self.writer.schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            msg = (
+                f"The chunk does not match the columns of {self.get_file_path()}"
+                f" ({self.writer.schema.types}), pass the `schema` of the columns"
+                " which may be all null in a chunk"
+            )
+            raise ValueError(msg) from e
+
+    def close(
+        self: Self,
+    ) -> None:
+        import polars as pl
+
+        if not self.files_written:
+            # keep the same behavior as BatchCSVWriter, always output at least one file
+            schema = self.schema or dict.fromkeys(self.headers or [], pl.Null)
+            self.open_writer(pl.DataFrame(schema=schema).to_arrow().schema)
+        self.close_file()
 
 
 def get_uuid_in_serializer(serializer: serializers.ModelSerializer) -> uuid.UUID | None:
@@ -434,44 +989,19 @@ def access_file_as_data(
     from eventhub.models import ObjectStorageFileLock
 
     with contextlib.suppress(IntegrityError):
-        obj, _ = ObjectStorageFileLock.objects.get_or_create(file_key=file_key)
-
-    on_success = None
-    retry = 0
-    if auto_commit:
-        locked = True
+        ObjectStorageFileLock.objects.get_or_create(file_key=file_key)
+    obj = ObjectStorageFileLock.objects.get(file_key=file_key)
 
-        def on_success(file_size: int, duration: int) -> None:
-            ObjectStorageFileLock.objects.filter(file_key=file_key).update(
-                access_lock=False,
-            )
+    if not auto_commit:
+        with obj.yield_storage_data(file_key, auto_commit=auto_commit) as data:
+            yield data
+        return
 
-        while locked:
-            with transaction.atomic():
-                obj = (
-                    ObjectStorageFileLock.objects.select_for_update()
-                    .filter(file_key=file_key)
-                    .get()
-                )
-                locked = obj.access_lock
-                if not locked:
-                    obj.access_lock = True
-                    obj.save(update_fields=["access_lock"])
-            if locked:
-                retry += 1
-                logger.info("Waiting for file lock %s", file_key)
-                time.sleep(60)
-
-            max_retry = 100
-            if retry > max_retry:
-                msg = f"Failed to get file lock {file_key}"
-                raise TimeoutError(msg)
-
-    with obj.yield_storage_data(
-        file_key,
-        auto_commit=auto_commit,
-        on_success=on_success,
-    ) as data:
+    # waiters are woken up when the lock is released instead of polling the row
+    with (
+        get_lock(f"object_storage_file:{file_key}"),
+        obj.yield_storage_data(file_key, auto_commit=auto_commit) as data,
+    ):
         yield data
 
 
@@ -494,38 +1024,158 @@ def retry(retry_attempts: int = 3, retry_time_sleep: float = 1) -> Callable:
     return decorator
 
 
-def bulk_update_or_create(
-    model: type,
+class BulkUpsertResult(TypedDict):
+    created: int
+    updated: int
+    unchanged: int
+    partitions: NotRequired[list[BulkUpsertResult]]
+
+
+def bulk_update_or_create(  # noqa: PLR0913
+    model: type[models.Model],
     data: list[dict],
     match_field: str,
     create_fields: list[str],
     update_fields: list[str],
-) -> None:
+    using: str | None = None,
+    workers: int = 1,
+) -> BulkUpsertResult:
     """
     Bulk update or create the model instance
+
+    On PostgreSQL, when `match_field` is unique, the data is copied into a temporary
+    table and merged with `INSERT ... ON CONFLICT`, other databases fall back to
+    `bulk_create` and `bulk_update`.
+    If the same `match_field` value appears more than once, the last item wins.
+    Matched rows whose `update_fields` already hold the incoming values are not
+    written and counted as unchanged, `auto_now` fields are not compared.
+
+    With `workers` > 1, the data is hash-partitioned by `match_field` and each
+    partition is upserted on its own thread and database connection, the disjoint
+    keys do not contend for the same row locks. Each partition commits on its own,
+    so it cannot run inside a transaction. The result reports every partition.
     """
     if not data:
-        return
+        return BulkUpsertResult(created=0, updated=0, unchanged=0)
+
+    using = using or router.db_for_write(model)
+    if workers <= 1:
+        return _bulk_update_or_create(
+            model,
+            data,
+            match_field,
+            create_fields,
+            update_fields,
+            using,
+        )
+
+    if connections[using].in_atomic_block:
+        msg = "Concurrent bulk_update_or_create cannot run inside a transaction"
+        raise ValueError(msg)
 
+    partitions: list[list[dict]] = [[] for _ in range(workers)]
+    for item in data:
+        partitions[hash(item[match_field]) % workers].append(item)
+
+    def upsert_partition(partition: list[dict]) -> BulkUpsertResult:
+        if not partition:
+            return BulkUpsertResult(created=0, updated=0, unchanged=0)
+        try:
+            return _bulk_update_or_create(
+                model,
+                partition,
+                match_field,
+                create_fields,
+                update_fields,
+                using,
+            )
+        finally:
+            # every thread opens its own connection
+            connections[using].close()
+
+    with ThreadPoolExecutor(
+        max_workers=workers,
+        thread_name_prefix="bulk-upsert",
+    ) as executor:
+        results = list(executor.map(upsert_partition, partitions))
+
+    for i, result in enumerate(results):
+        msg = f"bulk_update_or_create {model.__name__} partition {i}: {result}"
+        logger.info(msg)
+
+    return BulkUpsertResult(
+        created=sum(result["created"] for result in results),
+        updated=sum(result["updated"] for result in results),
+        unchanged=sum(result["unchanged"] for result in results),
+        partitions=results,
+    )
+
+
+def _bulk_update_or_create(  # noqa: PLR0913
+    model: type[models.Model],
+    data: list[dict],
+    match_field: str,
+    create_fields: list[str],
+    update_fields: list[str],
+    using: str,
+) -> BulkUpsertResult:
+    if can_use_postgresql_upsert(model, match_field, using):
+        return _bulk_update_or_create_postgresql(
+            model,
+            data,
+            match_field,
+            create_fields,
+            update_fields,
+            using,
+        )
+
+    return _bulk_update_or_create_fallback(
+        model,
+        data,
+        match_field,
+        create_fields,
+        update_fields,
+        using,
+    )
+
+
+def _bulk_update_or_create_fallback(  # noqa: PLR0913
+    model: type[models.Model],
+    data: list[dict],
+    match_field: str,
+    create_fields: list[str],
+    update_fields: list[str],
+    using: str,
+) -> BulkUpsertResult:
     match_field_values = {item[match_field] for item in data}
     existing_objs = []
-    for batch in batched(list(match_field_values), 1000):
-        existing_objs.extend(model.objects.filter(**{f"{match_field}__in": batch}))
+    for batch in batched(match_field_values, 1000):
+        existing_objs.extend(
+            model.objects.using(using).filter(**{f"{match_field}__in": batch}),
+        )
     match_field_to_existing = {
         getattr(record, match_field): record for record in existing_objs
     }
 
+    compared_fields = _get_compared_fields(model, update_fields)
     to_create = []
     to_update = []
+    unchanged = 0
 
     for item in data:
         current_field_value = item[match_field]
         if current_field_value in match_field_to_existing:
             # update existing order
             target_to_update = match_field_to_existing[current_field_value]
+            stored_values = [
+                getattr(target_to_update, f.attname) for f in compared_fields
+            ]
             for field in update_fields:
                 setattr(target_to_update, field, item[field])
-            to_update.append(target_to_update)
+            if _has_changed(target_to_update, compared_fields, stored_values):
+                to_update.append(target_to_update)
+            else:
+                unchanged += 1
         else:
             new_instance = model()
             for field in create_fields:
@@ -533,9 +1183,258 @@ def bulk_update_or_create(
             to_create.append(new_instance)
 
     if to_create:
-        model.objects.bulk_create(to_create, settings.BATCH_SIZE, ignore_conflicts=True)
+        model.objects.using(using).bulk_create(
+            to_create,
+            settings.BATCH_SIZE,
+            ignore_conflicts=True,
+        )
     if to_update:
-        model.objects.bulk_update(to_update, update_fields, settings.BATCH_SIZE)
+        model.objects.using(using).bulk_update(
+            to_update,
+            update_fields,
+            settings.BATCH_SIZE,
+        )
+
+    return BulkUpsertResult(
+        created=len(to_create),
+        updated=len(to_update),
+        unchanged=unchanged,
+    )
+
+
+def _get_compared_fields(
+    model: type[models.Model],
+    update_fields: list[str],
+) -> list[models.Field]:
+    """The update fields compared to detect a change, `auto_now` is always new."""
+    fields = [model._meta.get_field(field) for field in update_fields]
+    return [field for field in fields if not getattr(field, "auto_now", False)]
+
+
+def _has_changed(
+    instance: models.Model,
+    fields: list[models.Field],
+    stored_values: list[Any],
+) -> bool:
+    if not fields:
+        # nothing to compare, e.g. only auto_now fields are updated
+        return True
+
+    for field, stored_value in zip(fields, stored_values, strict=True):
+        value = getattr(instance, field.attname)
+        try:
+            if field.to_python(value) != field.to_python(stored_value):
+                return True
+        except ValidationError:
+            return True
+    return False
+
+
+def can_use_postgresql_upsert(
+    model: type[models.Model],
+    match_field: str,
+    using: str,
+) -> bool:
+    """
+    The PostgreSQL upsert needs a unique `match_field` for `ON CONFLICT`,
+    which is not left out of the INSERT (e.g. an auto primary key),
+    and every value must be computed in Python (no db_default).
+    """
+    if connections[using].vendor != "postgresql":
+        return False
+
+    opts = model._meta
+    if opts.parents:
+        # multi-table inheritance spreads a row across tables
+        return False
+
+    field = opts.get_field(match_field)
+    if not (field.unique or field.primary_key):
+        return False
+    if field not in _get_insert_fields(model):
+        # ON CONFLICT could never match a column the INSERT does not set
+        return False
+
+    return not any(f.has_db_default() for f in opts.local_concrete_fields)
+
+
+def _get_insert_fields(model: type[models.Model]) -> list[models.Field]:
+    return [
+        field
+        for field in model._meta.local_concrete_fields
+        if not getattr(field, "db_returning", False)
+        and not getattr(field, "generated", False)
+    ]
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.timedelta):
+        return duration_iso_string(value)
+    if isinstance(value, bytes | memoryview):
+        return "\\x" + bytes(value).hex()
+    raise TypeError
+
+
+def _get_document(
+    instance: models.Model,
+    fields: list[models.Field],
+    add: bool,
+) -> dict[str, Any]:
+    """Get the column values of the instance, as `jsonb_populate_record` expects."""
+    document = {}
+    for field in fields:
+        value = (
+            field.pre_save(instance, add) if add else getattr(instance, field.attname)
+        )
+        if not isinstance(field, models.JSONField):
+            value = field.get_prep_value(value)
+        document[field.column] = value
+    return document
+
+
+def _bulk_update_or_create_postgresql(  # noqa: PLR0913
+    model: type[models.Model],
+    data: list[dict],
+    match_field: str,
+    create_fields: list[str],
+    update_fields: list[str],
+    using: str,
+) -> BulkUpsertResult:
+    opts = model._meta
+    connection = connections[using]
+    qn = connection.ops.quote_name
+
+    insert_fields = _get_insert_fields(model)
+    match_field_obj = opts.get_field(match_field)
+    update_field_objs = [opts.get_field(field) for field in update_fields]
+    # the fields which are not assigned when creating need a separate UPDATE,
+    # `EXCLUDED` would carry the default value for them
+    update_only = not {f.name for f in update_field_objs} <= {
+        opts.get_field(field).name for field in [*create_fields, match_field]
+    }
+
+    # the last item wins when the same match_field value appears more than once
+    deduplicated = {item[match_field]: item for item in data}.values()
+    compared_fields = _get_compared_fields(model, update_fields)
+
+    buffer = io.BytesIO()
+    for item in deduplicated:
+        # instantiate the model to apply python side defaults, e.g. uuid pk or auto_now
+        new_instance = model()
+        for field in create_fields:
+            setattr(new_instance, field, item[field])
+        document = {"c": _get_document(new_instance, insert_fields, add=True)}
+
+        if update_only:
+            update_instance = model()
+            for field in [match_field, *update_fields]:
+                setattr(update_instance, field, item[field])
+            document["u"] = _get_document(
+                update_instance,
+                [match_field_obj, *update_field_objs],
+                add=False,
+            )
+
+        # COPY text format, backslash is the only character to escape in json
+        line = orjson.dumps(document, default=_json_default).replace(b"\\", b"\\\\")
+        buffer.write(line + b"\n")
+    buffer.seek(0)
+
+    table = qn(opts.db_table)
+    temp_table = qn(f"bulk_upsert_{uuid.uuid4().hex}")
+    match_column = qn(match_field_obj.column)
+    insert_columns = ", ".join(qn(f.column) for f in insert_fields)
+    select_columns = ", ".join(f"r.{qn(f.column)}" for f in insert_fields)
+    source = (
+        f"{temp_table} CROSS JOIN LATERAL "
+        f"jsonb_populate_record(NULL::{table}, {temp_table}.doc -> %s) AS r"
+    )
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {temp_table} (doc jsonb) ON COMMIT DROP",
+        )
+        _copy_from(cursor, f"COPY {temp_table} (doc) FROM STDIN", buffer)
+
+        if update_only:
+            assignments = ", ".join(
+                f"{qn(f.column)} = r.{qn(f.column)}" for f in update_field_objs
+            )
+            conditions = [f"{table}.{match_column} = r.{match_column}"]
+            if compared_fields:
+                conditions.append(
+                    _get_changed_condition(table, "r", compared_fields, qn),
+                )
+            cursor.execute(
+                f"UPDATE {table} SET {assignments} FROM {source} "  # noqa: S608
+                f"WHERE {' AND '.join(conditions)}",
+                ["u"],
+            )
+            updated = cursor.rowcount
+            cursor.execute(
+                f"INSERT INTO {table} ({insert_columns}) "  # noqa: S608
+                f"SELECT {select_columns} FROM {source} "
+                f"ON CONFLICT ({match_column}) DO NOTHING",
+                ["c"],
+            )
+            created = cursor.rowcount
+            return BulkUpsertResult(
+                created=created,
+                updated=updated,
+                unchanged=len(deduplicated) - created - updated,
+            )
+
+        assignments = ", ".join(
+            f"{qn(f.column)} = EXCLUDED.{qn(f.column)}" for f in update_field_objs
+        )
+        conflict_action = (
+            f"DO UPDATE SET {assignments}" if assignments else "DO NOTHING"
+        )
+        if assignments and compared_fields:
+            changed = _get_changed_condition(table, "EXCLUDED", compared_fields, qn)
+            conflict_action += f" WHERE {changed}"
+        cursor.execute(
+            f"WITH upserted AS ("  # noqa: S608
+            f"INSERT INTO {table} ({insert_columns}) "
+            f"SELECT {select_columns} FROM {source} "
+            f"ON CONFLICT ({match_column}) {conflict_action} "
+            f"RETURNING (xmax = 0) AS inserted"
+            f") SELECT "
+            f"count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) "
+            f"FROM upserted",
+            ["c"],
+        )
+        created, updated = cursor.fetchone()
+        return BulkUpsertResult(
+            created=created,
+            updated=updated,
+            unchanged=len(deduplicated) - created - updated,
+        )
+
+
+def _get_changed_condition(
+    table: str,
+    alias: str,
+    fields: list[models.Field],
+    qn: Callable[[str], str],
+) -> str:
+    """The rows are only written when a compared column is distinct, NULL aware."""
+    stored = ", ".join(f"{table}.{qn(f.column)}" for f in fields)
+    incoming = ", ".join(f"{alias}.{qn(f.column)}" for f in fields)
+    return f"ROW({stored}) IS DISTINCT FROM ROW({incoming})"
+
+
+def _copy_from(cursor: CursorWrapper, sql: str, buffer: IO[bytes]) -> None:
+    """COPY the buffer with either psycopg2 or psycopg (3)."""
+    if hasattr(cursor.cursor, "copy_expert"):
+        cursor.cursor.copy_expert(sql, buffer)
+        return
+
+    with cursor.cursor.copy(sql) as copy:
+        while data := buffer.read(io.DEFAULT_BUFFER_SIZE * 128):
+            copy.write(data)
 
 
 def zip_by_first_iterable(
@@ -11,7 +11,21 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .models import ImageModel
-from .serializers import ImageModelSerializer, ImageUploadSerializer
+from .serializers import (
+    ImageModelSerializer,
+    ImageUploadSerializer,
+    optimize_queryset,
+)
+
+
+class SerializerRelationsMixin:
+    """
+    Select and prefetch the relations the serializer of a generic view reads,
+    see `get_serializer_relations`.
+    """
+
+    def get_queryset(self):
+        return optimize_queryset(super().get_queryset(), self.get_serializer_class())
 
 
 class HealthCheckView(APIView):
@@ -13,8 +13,10 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from __future__ import annotations
 
 import os
+import tempfile
 from datetime import timedelta
 from enum import Enum
+from importlib.util import find_spec
 from pathlib import Path
 from urllib.parse import urlparse
 
@@ -192,7 +194,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "djangorestframework_camel_case.middleware.CamelCaseMiddleWare",
+    "core.middleware.CamelCaseMiddleware",
     "axes.middleware.AxesMiddleware",
     "csp.middleware.CSPMiddleware",
 ]
@@ -266,7 +268,7 @@ AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
 ]
 
-render_classes = ["djangorestframework_camel_case.render.CamelCaseJSONRenderer"]
+render_classes = ["core.renderers.CamelCaseORJSONRenderer"]
 if settings.DEBUG:
     render_classes.append("rest_framework.renderers.BrowsableAPIRenderer")
 
@@ -277,7 +279,7 @@ REST_FRAMEWORK = {
         # If you use MultiPartFormParser or FormParser, we also have a camel case version
         "djangorestframework_camel_case.parser.CamelCaseFormParser",
         "djangorestframework_camel_case.parser.CamelCaseMultiPartParser",
-        "djangorestframework_camel_case.parser.CamelCaseJSONParser",
+        "core.parsers.CamelCaseORJSONParser",
         "rest_framework.parsers.FormParser",
         "rest_framework.parsers.MultiPartParser",
         # Any other parsers
@@ -515,13 +517,73 @@ CORS_ALLOW_METHODS = [
     "PUT",
 ]
 
-if settings.ENABLE_CACHE:
+if settings.ENABLE_CACHE and settings.CACHE_BACKEND.startswith("django_redis"):
+    # the compressor imports pyzstd on the first cache operation
+    compress_cache = settings.CACHE_COMPRESS_MIN_BYTES > 0 and bool(find_spec("pyzstd"))
+    CACHES = {
+        "default": {
+            "BACKEND": settings.CACHE_BACKEND,
+            "LOCATION": settings.CACHE_LOCATION,
+            "OPTIONS": {
+                "CONNECTION_POOL_KWARGS": {
+                    "max_connections": settings.CACHE_MAX_CONNECTIONS,
+                },
+                "SOCKET_TIMEOUT": settings.CACHE_SOCKET_TIMEOUT,
+                "SOCKET_CONNECT_TIMEOUT": settings.CACHE_SOCKET_TIMEOUT,
+                **(
+                    {"COMPRESSOR": "core.cache_compressors.SizedZStdCompressor"}
+                    if compress_cache
+                    else {}
+                ),
+            },
+        },
+    }
+elif settings.ENABLE_CACHE and "redis" in settings.CACHE_BACKEND.lower():
+    compress_cache = settings.CACHE_COMPRESS_MIN_BYTES > 0 and bool(
+        find_spec("zstandard")
+    )
+    CACHES = {
+        "default": {
+            "BACKEND": settings.CACHE_BACKEND,
+            "LOCATION": settings.CACHE_LOCATION,
+            "OPTIONS": {
+                # passed to the redis connection pool
+                "max_connections": settings.CACHE_MAX_CONNECTIONS,
+                "socket_timeout": settings.CACHE_SOCKET_TIMEOUT,
+                "socket_connect_timeout": settings.CACHE_SOCKET_TIMEOUT,
+                "health_check_interval": 30,
+                **(
+                    {"serializer": "core.cache_serializers.CompressedRedisSerializer"}
+                    if compress_cache
+                    else {}
+                ),
+            },
+        },
+    }
+elif settings.ENABLE_CACHE:
     CACHES = {
         "default": {
             "BACKEND": settings.CACHE_BACKEND,
             "LOCATION": settings.CACHE_LOCATION,
         },
     }
+elif settings.DEBUG and settings.CACHE_LOCAL_BACKEND == "locmem":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        },
+    }
+elif settings.DEBUG and settings.CACHE_LOCAL_BACKEND == "file":
+    # local runs without redis, a file cache avoids a SQL round trip per operation
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": settings.CACHE_FILE_LOCATION
+            or str(Path(tempfile.gettempdir()) / f"{settings.PROJECT_NAME}_cache"),
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        },
+    }
 else:
     # Fallback to database cache for OAuth and other features that require caching
     CACHES = {
@@ -530,3 +592,7 @@ else:
             "LOCATION": "oauth_cache_table",
         },
     }
+
+if settings.ENABLE_CACHE:
+    # sessions are read from the shared cache and written through to the database
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
@@ -1,13 +1,19 @@
 from django.contrib import admin
 
+from core.pagination import EstimatedCountPaginator
+
 from .models import User
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ("username", "email", "first_name", "last_name")
+    # icontains on these is served by the trigram indexes of users.0002_search_indexes
     search_fields = ("username", "email", "first_name", "last_name")
     ordering = ("username",)
+    # count by the planner estimate and skip the count of the unfiltered users
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 # Register your models here.
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from core.operations import AddPostgresIndex, get_search_vector_index, get_trigram_index
+
+
+class Migration(migrations.Migration):
+
+    # the indexes are created concurrently, outside of a transaction
+    atomic = False
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        AddPostgresIndex(
+            model_name='user',
+            index=get_trigram_index(field_name, f'users_{field_name}_trgm'),
+            extension='pg_trgm',
+        )
+        for field_name in ['username', 'email', 'first_name', 'last_name']
+    ] + [
+        AddPostgresIndex(
+            model_name='user',
+            index=get_search_vector_index('bio', 'users_bio_search'),
+        ),
+    ]
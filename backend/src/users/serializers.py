@@ -106,6 +106,14 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
 
+class UserAutocompleteSerializer(serializers.ModelSerializer):
+    """Serializer for the user autocomplete."""
+
+    class Meta:
+        model = User
+        fields = ["id", "username", "email", "first_name", "last_name"]
+
+
 class UserRegistrationSerializer(serializers.Serializer):
     """Serializer for user registration."""
 
@@ -91,3 +91,96 @@ def test_simple_unit_test():
     """Simple unit test to verify pytest is working."""
     assert 1 + 1 == 2
     assert "hello".upper() == "HELLO"
+
+
+@pytest.mark.django_db
+def test_user_autocomplete(user_factory):
+    """Test the staff autocomplete returns the best matches of 3+ characters."""
+    staff = user_factory(username="staff", email="staff@example.com", is_staff=True)
+    user_factory(username="alice", email="alice@example.com")
+    user_factory(username="malice", email="m@example.com")
+    client = APIClient()
+    client.force_authenticate(staff)
+    url = reverse("user_autocomplete")
+
+    response = client.get(url, {"search": "alice"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [user["username"] for user in response.json()] == ["alice", "malice"]
+    assert client.get(url, {"search": "al"}).json() == []
+    assert client.get(url, {"search": "al ic"}).json() == []
+    # the short term is dropped, not matched by a full scan
+    response = client.get(url, {"search": "mal ic"})
+    assert [user["username"] for user in response.json()] == ["malice"]
+
+    client.force_authenticate(User.objects.get(username="alice"))
+    assert client.get(url, {"search": "alice"}).status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+def test_user_admin_search(admin_client):
+    """Test the admin changelist searches without the full result count."""
+    User.objects.create_user(username="alice", email="alice@example.com")
+    response = admin_client.get(reverse("admin:users_user_changelist"), {"q": "alice"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.context["cl"].result_count == 1
+    assert response.context["cl"].full_result_count is None
+
+
+@pytest.mark.django_db
+def test_user_list_queries_do_not_grow(user_factory, api_client, count_queries):
+    """The user list joins the profiles, settings and avatars in its queries."""
+    from core.models import ImageModel
+    from users.models import UserProfile, UserSettings
+
+    def add_users(start, stop):
+        for i in range(start, stop):
+            user = user_factory(username=f"user{i}", email=f"user{i}@example.com")
+            user.avatar_image = ImageModel.objects.create(
+                title=f"avatar{i}", uploaded_by=user
+            )
+            user.save()
+            UserProfile.objects.create(user=user)
+            UserSettings.objects.create(user=user)
+
+    add_users(0, 2)
+    api_client.force_authenticate(user=get_user_model().objects.first())
+    url = reverse("users")
+
+    # the first request reads the table size on PostgreSQL, see `get_count`
+    api_client.get(url)
+    response, queries = count_queries(api_client.get, url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["results"][0]["avatar"]["title"] == "avatar0"
+    # the count, then the users joined with their avatars, profiles and settings
+    assert queries == 2
+
+    add_users(2, 6)
+    response, more_queries = count_queries(api_client.get, url)
+    assert [user["username"] for user in response.json()["results"]] == [
+        f"user{i}" for i in range(6)
+    ]
+    assert more_queries == queries
+
+
+@pytest.mark.django_db
+def test_user_list_sort(user_factory, api_client):
+    """Test the user list is sorted by the allowed keys only."""
+    for username in ["bob", "alice", "carol"]:
+        user_factory(username=username, email=f"{username}@example.com")
+    api_client.force_authenticate(user=User.objects.get(username="alice"))
+    url = reverse("users")
+
+    def usernames(**params):
+        response = api_client.get(url, params)
+        assert response.status_code == status.HTTP_200_OK
+        return [user["username"] for user in response.json()["results"]]
+
+    assert usernames() == ["alice", "bob", "carol"]
+    assert usernames(sort="username:desc") == ["carol", "bob", "alice"]
+    assert usernames(sort="id") == ["bob", "alice", "carol"]
+
+    response = api_client.get(url, {"sort": "email"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "Unsupported sort 'email'" in response.json()["detail"]
+    response = api_client.get(url, {"sort": "username:up"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
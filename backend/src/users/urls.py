@@ -16,6 +16,11 @@ urlpatterns = [
     path("token/blacklist/", TokenBlacklistView.as_view(), name="token_blacklist"),
     # User management
     path("users/", views.UserViewSet.as_view(), name="users"),
+    path(
+        "users/autocomplete/",
+        views.UserAutocompleteView.as_view(),
+        name="user_autocomplete",
+    ),
     path("register/", views.UserRegistrationView.as_view(), name="user_register"),
     path(
         "profile/", views.CurrentUserProfileView.as_view(), name="current_user_profile"
@@ -4,12 +4,14 @@ from django.contrib.auth.hashers import make_password
 from django.db import transaction
 from django.utils import timezone
 from rest_framework import generics, status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from core.backends import CustomSearchFilter
 from core.serializers import ImageUploadSerializer
+from core.views import SerializerRelationsMixin
 
 from .models import (
     User,
@@ -18,6 +20,7 @@ from .models import (
 )
 from .serializers import (
     ChangePasswordSerializer,
+    UserAutocompleteSerializer,
     UserProfileDetailSerializer,
     UserProfileSerializer,
     UserRegistrationSerializer,
@@ -188,22 +191,49 @@ class AvatarUploadView(APIView):
         return Response(image_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserViewSet(generics.ListAPIView):
+class UserViewSet(SerializerRelationsMixin, generics.ListAPIView):
     """User management viewset."""
 
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    sorting_fields = {"id": "pk", "username": "username"}
+    ordering = ("username",)
+    search_fields = ("username", "email", "first_name", "last_name", "@bio")
 
 
-class UserProfileViewSet(generics.ListCreateAPIView):
+class UserAutocompleteView(generics.ListAPIView):
+    """
+    Staff lookup of users by username, email or name, best matches first.
+
+    The trigram indexes need 3 characters to narrow the search, shorter terms
+    are ignored and a search without a longer term returns no users.
+    """
+
+    queryset = User.objects.all()
+    serializer_class = UserAutocompleteSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [CustomSearchFilter]
+    search_fields = ("username", "email", "first_name", "last_name")
+    pagination_class = None
+    search_min_length = 3
+    limit = 20
+
+    def filter_queryset(self, queryset):
+        if not CustomSearchFilter().get_view_search_terms(self.request, self):
+            return queryset.none()
+        return super().filter_queryset(queryset)[: self.limit]
+
+
+class UserProfileViewSet(SerializerRelationsMixin, generics.ListCreateAPIView):
     """User profile management viewset."""
 
+    queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return UserProfile.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
 
 
 class ChangePasswordView(APIView):